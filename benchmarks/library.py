@@ -0,0 +1,108 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Generate a synthetic video library for the benchmarks, along with the files it refers to.
+"""
+
+import os
+import random
+import time
+
+VIDEO_SIZE = (700 * 1024 ** 2, 8 * 1024 ** 3)
+RELATED_EXTENSIONS = [u".nfo", u".srt", u"-poster.jpg"]
+
+
+def _create(path, size):
+    with open(path.encode("utf-8"), "wb") as f:
+        f.truncate(size)  # Sparse, so large libraries fit on any disk
+
+
+def _properties(rng, watched):
+    played = rng.random() < watched
+    lastplayed = time.time() - rng.randint(1, 365) * 24 * 60 * 60
+    return {
+        u"playcount": 1 if played else 0,
+        u"lastplayed": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(lastplayed)) if played else u"",
+        u"rating": round(rng.uniform(1, 10), 1),
+        u"resume": {u"position": 0 if played or rng.random() < 0.9 else 600, u"total": 0},
+        u"dateadded": u"2019-01-01 00:00:00"
+    }
+
+
+def generate(root, movies=0, episodes=0, watched=0.75, stacked=0.05, related=2, episodes_per_season=10,
+             seasons_per_show=4, create_files=True, seed=1):
+    """
+    Generate a library of movies and episodes. Movies each have their own folder, episodes are grouped by show and
+    season.
+
+    :type root: unicode
+    :param root: The folder to create the files in.
+    :type movies: int
+    :param movies: The number of movies.
+    :type episodes: int
+    :param episodes: The number of episodes.
+    :type watched: float
+    :param watched: The fraction of videos that were watched.
+    :type stacked: float
+    :param stacked: The fraction of movies that consist of two stacked parts.
+    :type related: int
+    :param related: The number of related files (NFO files, subtitles, posters) next to each video.
+    :type episodes_per_season: int
+    :param episodes_per_season: The number of episodes in each season.
+    :type seasons_per_show: int
+    :param seasons_per_show: The number of seasons of each show.
+    :type create_files: bool
+    :param create_files: Create the files, or only the library.
+    :type seed: int
+    :param seed: The seed for the random properties of the videos, to make libraries reproducible.
+    :rtype: dict
+    :return: The library, with lists of the properties of all videos by type, as used by the ``xbmc`` stand-in.
+    """
+    rng = random.Random(seed)
+    library = {u"movies": [], u"episodes": [], u"musicvideos": []}
+    extensions = RELATED_EXTENSIONS[:related]
+
+    for i in xrange(movies):
+        title = u"Movie {0:06d}{1}".format(i, u" Amélie" if i % 10 == 0 else u"")
+        folder = os.path.join(root, u"Movies", title)
+        if rng.random() < stacked:
+            parts = [os.path.join(folder, u"{0}-cd{1:d}.avi".format(title, part)) for part in (1, 2)]
+            filename = u"stack://" + u" , ".join(parts)
+        else:
+            parts = [os.path.join(folder, title + u".mkv")]
+            filename = parts[0]
+
+        if create_files:
+            os.makedirs(folder.encode("utf-8"))
+            size = rng.randint(*VIDEO_SIZE)
+            for part in parts:
+                _create(part, size // len(parts))
+            for extension in extensions:
+                _create(os.path.join(folder, title + extension), 4096)
+
+        movie = _properties(rng, watched)
+        movie.update({u"movieid": i + 1, u"title": title, u"label": title, u"file": filename})
+        library[u"movies"].append(movie)
+
+    per_show = episodes_per_season * seasons_per_show
+    for i in xrange(episodes):
+        show, season, episode = i // per_show, i % per_show // episodes_per_season + 1, i % episodes_per_season + 1
+        show_title = u"Show {0:05d}".format(show)
+        folder = os.path.join(root, u"TV Shows", show_title, u"Season {0:02d}".format(season))
+        name = u"{0} S{1:02d}E{2:02d}".format(show_title, season, episode)
+        filename = os.path.join(folder, name + u".mkv")
+
+        if create_files:
+            if episode == 1:
+                os.makedirs(folder.encode("utf-8"))
+            _create(filename, rng.randint(*VIDEO_SIZE) // 4)
+            for extension in extensions:
+                _create(os.path.join(folder, name + extension), 4096)
+
+        item = _properties(rng, watched)
+        item.update({u"episodeid": i + 1, u"tvshowid": show + 1, u"showtitle": show_title, u"title": name,
+                     u"label": name, u"file": filename})
+        library[u"episodes"].append(item)
+
+    return library
@@ -0,0 +1,247 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Measure the performance of the addon outside of Kodi.
+
+The addon runs against the stand-in modules in ``benchmarks/stubs``, with a synthetic library generated in a temporary
+folder. Each case runs in a separate process, and reports its wall time, peak memory, the number of calls to ``xbmcvfs``
+and the number of bytes of JSON-RPC responses parsed. Cases with a target in ``TARGETS`` are flagged when they take
+longer than that.
+
+Examples::
+
+    python benchmarks/run.py --sizes 10000,50000 --save baseline
+    python benchmarks/run.py --sizes 10000,50000 --latency 0.002 --compare baseline
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+RESULTS = os.path.join(BENCHMARKS, "results")
+
+# The settings used by all cases, on top of the defaults
+SETTINGS = {
+    "clean_movies": "true",
+    "clean_tv_shows": "true",
+    "cleaning_type": "1",
+    "delete_folders": "true",
+    "clean_related": "true",
+    "clean_kodi_library": "true",
+    "enable_expiration": "true",
+    "expire_after": "30",
+    "not_in_progress": "true"
+}
+
+# The maximum wall time in seconds of cases that must stay fast no matter how large the library is
+TARGETS = {
+    "service_import": 0.05
+}
+
+# The modules the service must not load while Kodi boots, but only once the first cleaning run is due
+LAZY_MODULES = ["default", "copier", "planner", "viewer", "reset_exclusions", "gzip", "ctypes", "sqlite3"]
+
+
+def setup(workdir, latency, workers):
+    os.environ["BENCHMARK_HOME"] = os.path.join(workdir, "home")
+    os.environ["BENCHMARK_PROFILE"] = os.path.join(workdir, "profile")
+    os.environ["BENCHMARK_LATENCY"] = str(latency)
+    sys.path[:0] = [os.path.join(BENCHMARKS, "stubs"), os.path.dirname(BENCHMARKS)]
+
+    import xbmcaddon
+    xbmcaddon.SETTINGS.update(SETTINGS)
+    xbmcaddon.SETTINGS["concurrent_operations"] = str(workers)
+
+
+def get_expired_videos(size, workdir):
+    import library
+    import xbmc
+    xbmc.LIBRARY.update(library.generate(workdir, movies=size // 2, episodes=size - size // 2, create_files=False))
+
+    import default
+    cleaner = default.Cleaner()
+    return lambda: [len(list(cleaner.get_expired_videos(video_type)[1]))
+                    for video_type in (cleaner.MOVIES, cleaner.TVSHOWS)]
+
+
+def get_expired_videos_cached(size, workdir):
+    import library
+    import xbmc
+    xbmc.LIBRARY.update(library.generate(workdir, movies=size // 2, episodes=size - size // 2, create_files=False))
+
+    import default
+    cleaner = default.Cleaner()
+    run = lambda: [len(list(cleaner.get_expired_videos(video_type)[1]))
+                   for video_type in (cleaner.MOVIES, cleaner.TVSHOWS)]
+    # The previous run filled the library catalog and cleaned all videos that matched
+    for video_type in (cleaner.MOVIES, cleaner.TVSHOWS):
+        cleaned = set(video[2] for video in cleaner.get_expired_videos(video_type)[1])
+        id_field = cleaner.id_fields[video_type]
+        xbmc.LIBRARY[video_type][:] = [item for item in xbmc.LIBRARY[video_type] if item[id_field] not in cleaned]
+        cleaner.catalog.forget(video_type, cleaned)
+
+    # Since then, 1% of the videos were watched
+    now = time.strftime("%Y-%m-%d %H:%M:%S")
+    for video_type in (cleaner.MOVIES, cleaner.TVSHOWS):
+        for item in xbmc.LIBRARY[video_type][::100]:
+            item.update(playcount=item[u"playcount"] + 1, lastplayed=now)
+    return run
+
+
+def clean_all(size, workdir):
+    import library
+    import xbmc
+    xbmc.LIBRARY.update(library.generate(os.path.join(workdir, u"library"), movies=size // 2,
+                                         episodes=size - size // 2))
+
+    import default
+    cleaner = default.Cleaner()
+    return cleaner.clean_all
+
+
+def log_append(size, workdir):
+    import utils
+    entries = [{u"type": u"movies", u"path": u"/media/Movies/Movie {0:06d}/Movie {0:06d}.mkv".format(i),
+                u"bytes": 4 * 1024 ** 3} for i in xrange(size)]
+
+    def run():
+        log = utils.Log()
+        for start in xrange(0, size, 100):
+            log.append(entries[start:start + 100])
+    return run
+
+
+def service_import(size, workdir):
+    def run():
+        import service
+        loaded = [module for module in LAZY_MODULES if module in sys.modules]
+        if loaded:
+            raise AssertionError(u"Starting the service loaded {0}".format(u", ".join(loaded)))
+    return run
+
+
+def plan_cache(size, workdir):
+    def run():
+        import settings
+        from rules import PlanCache
+        values = settings.load_all()
+        if PlanCache.settings_hash(settings.Snapshot(values)) != PlanCache.settings_hash(settings.Snapshot(values)):
+            raise AssertionError(u"Equal settings have different hashes")
+        if PlanCache.settings_hash(settings.Snapshot(dict(values, expire_after=values["expire_after"] + 1))) == \
+                PlanCache.settings_hash(settings.Snapshot(values)):
+            raise AssertionError(u"Different settings have the same hash")
+
+        cache, built = PlanCache(), []
+        for _ in xrange(size):
+            cache.get(settings.Snapshot(values), u"movies", lambda: built.append(1))
+        if len(built) != 1:
+            raise AssertionError(u"Plans were built {0:d} times for equal settings".format(len(built)))
+    return run
+
+
+CASES = {
+    "get_expired_videos": get_expired_videos,
+    "get_expired_videos_cached": get_expired_videos_cached,
+    "clean_all": clean_all,
+    "log_append": log_append,
+    "plan_cache": plan_cache,
+    "service_import": service_import
+}
+
+
+def measure(case, size, latency, workers):
+    """
+    Run a single case in the current process and print its results as JSON.
+    """
+    workdir = tempfile.mkdtemp(prefix="janitor-benchmark-")
+    try:
+        setup(workdir, latency, workers)
+        run = CASES[case](size, workdir)
+
+        import xbmc
+        import xbmcvfs
+        xbmcvfs.CALLS.clear()
+        xbmc.RPC.update(dict.fromkeys(xbmc.RPC, 0))
+
+        setup_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.time()
+        run()
+        wall_time = time.time() - start
+
+        print json.dumps({
+            "case": case,
+            "size": size,
+            "latency": latency,
+            "workers": workers,
+            "wall_time": wall_time,
+            "setup_rss_kb": setup_rss,
+            "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "vfs_calls": dict(xbmcvfs.CALLS),
+            "jsonrpc_calls": xbmc.RPC[u"calls"],
+            "json_bytes_parsed": xbmc.RPC[u"bytes_received"]
+        }, sort_keys=True)
+    finally:
+        shutil.rmtree(workdir, True)
+
+
+def report(result, baseline=None):
+    line = u"{case:<26} {size:>8d} {wall_time:>9.2f}s {peak_rss_kb:>10d}KB {calls:>9d} {json_bytes_parsed:>12d}".format(
+        calls=sum(result["vfs_calls"].values()), **result)
+    if baseline is not None:
+        line += u"   time {0:+.0%}, memory {1:+.0%}, calls {2:+d}".format(
+            result["wall_time"] / max(baseline["wall_time"], 1e-9) - 1,
+            float(result["peak_rss_kb"]) / baseline["peak_rss_kb"] - 1,
+            sum(result["vfs_calls"].values()) - sum(baseline["vfs_calls"].values()))
+    if result["wall_time"] > TARGETS.get(result["case"], float("inf")):
+        line += u"   over the target of {0:.2f}s".format(TARGETS[result["case"]])
+    print line
+
+
+def main():
+    parser = argparse.ArgumentParser(description=u"Measure the performance of the addon outside of Kodi.")
+    parser.add_argument("--cases", default=",".join(sorted(CASES)), help=u"comma-separated cases to run")
+    parser.add_argument("--sizes", default="10000", help=u"comma-separated numbers of videos or log entries")
+    parser.add_argument("--latency", type=float, default=0.0, help=u"seconds to wait on each xbmcvfs call")
+    parser.add_argument("--workers", type=int, default=1, help=u"concurrent file operations while cleaning")
+    parser.add_argument("--save", metavar="NAME", help=u"save the results as benchmarks/results/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help=u"compare against benchmarks/results/NAME.json")
+    parser.add_argument("--child", nargs=2, metavar=("CASE", "SIZE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        measure(args.child[0], int(args.child[1]), args.latency, args.workers)
+        return
+
+    baseline = {}
+    if args.compare:
+        with open(os.path.join(RESULTS, args.compare + ".json")) as f:
+            baseline = dict(((r["case"], r["size"], r["latency"], r["workers"]), r) for r in json.load(f))
+
+    print u"{0:<26} {1:>8} {2:>10} {3:>12} {4:>9} {5:>12}".format(u"case", u"size", u"time", u"peak memory",
+                                                                 u"vfs calls", u"json bytes")
+    results = []
+    for case in args.cases.split(","):
+        for size in [int(size) for size in args.sizes.split(",")]:
+            output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--child", case, str(size),
+                                              "--latency", str(args.latency), "--workers", str(args.workers)])
+            result = json.loads(output.splitlines()[-1])
+            report(result, baseline.get((case, size, args.latency, args.workers)))
+            results.append(result)
+
+    if args.save:
+        if not os.path.isdir(RESULTS):
+            os.makedirs(RESULTS)
+        with open(os.path.join(RESULTS, args.save + ".json"), "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
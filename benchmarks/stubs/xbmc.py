@@ -0,0 +1,202 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Stand-in for the ``xbmc`` module of Kodi, for running the addon outside of Kodi.
+
+JSON-RPC requests are answered from ``LIBRARY``, which holds the movies, episodes and music videos as dicts of their
+properties. Library filters are evaluated much like Kodi does. The number of requests and the number of bytes sent to
+and returned by JSON-RPC are counted in ``RPC``.
+"""
+
+import json
+import os
+import threading
+import time
+
+LOGDEBUG, LOGINFO, LOGNOTICE, LOGWARNING, LOGERROR, LOGSEVERE, LOGFATAL, LOGNONE = range(8)
+
+HOME = os.environ.get("BENCHMARK_HOME", "/tmp/janitor-benchmark/home")
+PROFILE = os.environ.get("BENCHMARK_PROFILE", "/tmp/janitor-benchmark/profile")
+
+LIBRARY = {u"movies": [], u"episodes": [], u"musicvideos": []}
+SOURCES = []
+BUILTINS = []
+RPC = {u"calls": 0, u"requests": 0, u"bytes_sent": 0, u"bytes_received": 0}
+
+_lock = threading.Lock()
+_filter_cache = {}
+_id_cache = {}
+
+ID_FIELDS = {u"movies": u"movieid", u"episodes": u"episodeid", u"musicvideos": u"musicvideoid"}
+LIST_METHODS = {
+    u"VideoLibrary.GetMovies": u"movies",
+    u"VideoLibrary.GetEpisodes": u"episodes",
+    u"VideoLibrary.GetMusicVideos": u"musicvideos"
+}
+DETAIL_METHODS = {
+    u"VideoLibrary.GetMovieDetails": (u"movies", u"moviedetails"),
+    u"VideoLibrary.GetEpisodeDetails": (u"episodes", u"episodedetails"),
+    u"VideoLibrary.GetMusicVideoDetails": (u"musicvideos", u"musicvideodetails")
+}
+REMOVE_METHODS = {
+    u"VideoLibrary.RemoveMovie": u"movies",
+    u"VideoLibrary.RemoveEpisode": u"episodes",
+    u"VideoLibrary.RemoveMusicVideo": u"musicvideos"
+}
+
+
+def log(msg, level=LOGDEBUG):
+    pass
+
+
+def translatePath(path):
+    path = path.replace(u"special://home", HOME).replace(u"special://profile", PROFILE)
+    return path.encode("utf-8") if isinstance(path, unicode) else path
+
+
+def makeLegalFilename(path):
+    return path.encode("utf-8") if isinstance(path, unicode) else path
+
+
+def getCondVisibility(condition):
+    return False
+
+
+def executebuiltin(function, wait=False):
+    BUILTINS.append(function)
+
+
+def sleep(milliseconds):
+    time.sleep(milliseconds / 1000.0)
+
+
+def _matches(item, condition):
+    if u"and" in condition:
+        return all(_matches(item, c) for c in condition[u"and"])
+    if u"or" in condition:
+        return any(_matches(item, c) for c in condition[u"or"])
+
+    field, operator, value = condition[u"field"], condition[u"operator"], condition[u"value"]
+    if field == u"inprogress":
+        in_progress = item.get(u"resume", {}).get(u"position", 0) > 0
+        return in_progress if operator == u"true" else not in_progress
+    if operator in (u"after", u"before"):
+        actual = item.get(field) or u""  # Dates are compared as text, which works for Kodi's date format
+        return actual > value if operator == u"after" else bool(actual) and actual < value
+    if field == u"lastplayed":
+        played = time.mktime(time.strptime(item[u"lastplayed"], "%Y-%m-%d %H:%M:%S")) if item[u"lastplayed"] else 0
+        in_the_last = time.time() - played <= float(value) * 24 * 60 * 60
+        return in_the_last if operator == u"inthelast" else not in_the_last
+    if field in (u"path", u"filename"):
+        actual, value = item[u"file"].lower(), value.lower()
+        return {
+            u"contains": lambda: value in actual,
+            u"doesnotcontain": lambda: value not in actual,
+            u"startswith": lambda: actual.startswith(value),
+            u"is": lambda: actual == value,
+            u"isnot": lambda: actual != value
+        }[operator]()
+
+    actual, value = float(item.get(field) or 0), float(value)
+    return {
+        u"greaterthan": actual > value,
+        u"lessthan": actual < value,
+        u"is": actual == value,
+        u"isnot": actual != value
+    }[operator]
+
+
+def _filtered(video_type, condition):
+    """
+    Filter the library the way Kodi does. Results are cached, so requesting the next page does not filter the entire
+    library again. Kodi uses a database for this, which the benchmarks should not measure.
+    """
+    key = (video_type, len(LIBRARY[video_type]), json.dumps(condition, sort_keys=True))
+    if key not in _filter_cache:
+        _filter_cache[key] = [item for item in LIBRARY[video_type] if not condition or _matches(item, condition)]
+    return _filter_cache[key]
+
+
+def _by_id(video_type):
+    """
+    Look up library items by their id, like Kodi's database does.
+    """
+    key = (video_type, len(LIBRARY[video_type]))
+    if key not in _id_cache:
+        _id_cache[key] = dict((item[ID_FIELDS[video_type]], item) for item in LIBRARY[video_type])
+    return _id_cache[key]
+
+
+def _answer(request, removed):
+    method, params = request[u"method"], request.get(u"params", {})
+    response = {u"jsonrpc": u"2.0", u"id": request.get(u"id")}
+
+    if method in LIST_METHODS:
+        video_type = LIST_METHODS[method]
+        items = _filtered(video_type, params.get(u"filter"))
+        if u"tvshowid" in params:
+            items = [item for item in items if item.get(u"tvshowid") == params[u"tvshowid"]]
+        limits = params.get(u"limits", {})
+        start, end = limits.get(u"start", 0), limits.get(u"end", len(items))
+        fields = set(params.get(u"properties", [])) | set([ID_FIELDS[video_type], u"label"])
+        page = [dict((k, v) for k, v in item.iteritems() if k in fields) for item in items[start:end]]
+        response[u"result"] = {u"limits": {u"start": start, u"end": start + len(page), u"total": len(items)}}
+        if page:
+            response[u"result"][video_type] = page
+    elif method in DETAIL_METHODS:
+        video_type, details = DETAIL_METHODS[method]
+        id_field = ID_FIELDS[video_type]
+        fields = set(params.get(u"properties", [])) | set([id_field, u"label"])
+        item = _by_id(video_type).get(params[id_field])
+        if item is not None:
+            response[u"result"] = {details: dict((k, v) for k, v in item.iteritems() if k in fields)}
+        else:
+            response[u"error"] = {u"code": -32602, u"message": u"Invalid params."}
+    elif method in REMOVE_METHODS:
+        video_type = REMOVE_METHODS[method]
+        if params[ID_FIELDS[video_type]] in _by_id(video_type):
+            removed.setdefault(video_type, set()).add(params[ID_FIELDS[video_type]])
+            response[u"result"] = u"OK"
+        else:
+            response[u"error"] = {u"code": -32602, u"message": u"Invalid params."}
+    elif method == u"Files.GetSources":
+        response[u"result"] = {u"sources": [{u"file": source, u"label": source} for source in SOURCES]}
+    else:
+        response[u"result"] = u"OK"
+    return response
+
+
+def executeJSONRPC(command):
+    request, removed = json.loads(command), {}
+    if isinstance(request, list):
+        result = json.dumps([_answer(r, removed) for r in request])
+    else:
+        result = json.dumps(_answer(request, removed))
+    for video_type, ids in removed.items():
+        LIBRARY[video_type][:] = [item for item in LIBRARY[video_type] if item[ID_FIELDS[video_type]] not in ids]
+    with _lock:
+        RPC[u"calls"] += 1
+        RPC[u"requests"] += len(request) if isinstance(request, list) else 1
+        RPC[u"bytes_sent"] += len(command)
+        RPC[u"bytes_received"] += len(result)
+    return result
+
+
+class Monitor(object):
+    def abortRequested(self):
+        return False
+
+    def waitForAbort(self, timeout=0):
+        return False
+
+    def onSettingsChanged(self):
+        pass
+
+    def onNotification(self, sender, method, data):
+        pass
+
+
+class Player(object):
+    def isPlaying(self):
+        return False
@@ -0,0 +1,45 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Stand-in for the ``xbmcaddon`` module of Kodi. Settings start out with the defaults from ``resources/settings.xml`` and
+can be changed through ``SETTINGS``. Localized strings are read from the English language file.
+"""
+
+import os
+import re
+
+import xbmc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SETTINGS = {}
+with open(os.path.join(ROOT, "resources", "settings.xml")) as f:
+    for match in re.finditer(r'id="([^"]+)"[^>]*?default="([^"]*)"', f.read()):
+        SETTINGS[match.group(1)] = match.group(2)
+
+STRINGS = {}
+with open(os.path.join(ROOT, "resources", "language", "resource.language.en_gb", "strings.po")) as f:
+    for match in re.finditer(r'msgctxt "#(\d+)"\nmsgid "(.*)"', f.read()):
+        STRINGS[int(match.group(1))] = match.group(2).decode("utf-8")
+
+
+class Addon(object):
+    def __init__(self, id=None):
+        self.info = {"id": "script.service.janitor", "name": "Janitor", "version": "benchmark", "path": ROOT,
+                     "profile": xbmc.PROFILE, "icon": os.path.join(ROOT, "resources", "icon.png")}
+
+    def getAddonInfo(self, key):
+        return self.info[key]
+
+    def getSetting(self, key):
+        return SETTINGS.get(key, "")
+
+    def setSetting(self, id, value):
+        SETTINGS[id] = value
+
+    def getLocalizedString(self, id):
+        return STRINGS.get(id, u"")
+
+    def openSettings(self):
+        pass
@@ -0,0 +1,70 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Stand-in for the ``xbmcgui`` module of Kodi. Dialogs return immediately, as if the user confirmed them.
+"""
+
+
+class Dialog(object):
+    def ok(self, *args, **kwargs):
+        return True
+
+    def yesno(self, *args, **kwargs):
+        return True
+
+    def notification(self, *args, **kwargs):
+        pass
+
+    def select(self, *args, **kwargs):
+        return -1
+
+    def browse(self, *args, **kwargs):
+        return ""
+
+    def input(self, *args, **kwargs):
+        return ""
+
+    def textviewer(self, *args, **kwargs):
+        pass
+
+
+class DialogProgress(object):
+    def create(self, *args):
+        pass
+
+    def update(self, *args):
+        pass
+
+    def iscanceled(self):
+        return False
+
+    def close(self):
+        pass
+
+
+class Window(object):
+    properties = {}
+
+    def __init__(self, id=-1):
+        pass
+
+    def getProperty(self, key):
+        return self.properties.get(key, "")
+
+    def setProperty(self, key, value):
+        self.properties[key] = value
+
+    def clearProperty(self, key):
+        self.properties.pop(key, None)
+
+
+class WindowXMLDialog(object):
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def doModal(self):
+        pass
+
+    def close(self):
+        pass
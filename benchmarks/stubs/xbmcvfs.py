@@ -0,0 +1,117 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Stand-in for the ``xbmcvfs`` module of Kodi, operating on the local file system. Every call waits for ``LATENCY``
+seconds first, to simulate the round trips of a network share, and is counted in ``CALLS``.
+"""
+
+import os
+import shutil
+import threading
+import time
+
+LATENCY = float(os.environ.get("BENCHMARK_LATENCY", 0))
+CALLS = {}
+
+_lock = threading.Lock()
+
+
+def _call(name, path):
+    with _lock:
+        CALLS[name] = CALLS.get(name, 0) + 1
+    if LATENCY:
+        time.sleep(LATENCY)
+    return path.encode("utf-8") if isinstance(path, unicode) else path
+
+
+def exists(path):
+    return os.path.exists(_call("exists", path))
+
+
+def delete(path):
+    try:
+        os.remove(_call("delete", path))
+        return True
+    except OSError:
+        return False
+
+
+def rename(source, destination):
+    try:
+        os.rename(_call("rename", source), destination.encode("utf-8") if isinstance(destination, unicode) else
+                  destination)
+        return True
+    except OSError:
+        return False
+
+
+def copy(source, destination):
+    try:
+        shutil.copy(_call("copy", source), destination.encode("utf-8") if isinstance(destination, unicode) else
+                    destination)
+        return True
+    except (IOError, OSError):
+        return False
+
+
+def mkdirs(path):
+    try:
+        os.makedirs(_call("mkdirs", path))
+        return True
+    except OSError:
+        return False
+
+
+def rmdir(path):
+    try:
+        os.rmdir(_call("rmdir", path))
+        return True
+    except OSError:
+        return False
+
+
+def listdir(path):
+    path = _call("listdir", path)
+    subfolders, files = [], []
+    try:
+        names = os.listdir(path)
+    except OSError:
+        return subfolders, files
+    for name in names:
+        (subfolders if os.path.isdir(os.path.join(path, name)) else files).append(name)
+    return subfolders, files
+
+
+class Stat(object):
+    def __init__(self, path):
+        try:
+            self.__stat = os.stat(_call("Stat", path))
+        except OSError:
+            self.__stat = os.stat_result((0,) * 10)
+
+    def st_mode(self):
+        return self.__stat.st_mode
+
+    def st_size(self):
+        return self.__stat.st_size
+
+    def st_nlink(self):
+        return self.__stat.st_nlink
+
+    def st_mtime(self):
+        return self.__stat.st_mtime
+
+    def st_dev(self):
+        return self.__stat.st_dev
+
+
+class File(object):
+    def __init__(self, path, mode="r"):
+        self.__path = _call("File", path)
+
+    def size(self):
+        return os.path.getsize(self.__path)
+
+    def close(self):
+        pass
@@ -0,0 +1,120 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import threading
+
+import xbmc
+from utils import ADDON_PROFILE, debug
+from settings import *
+
+
+class CandidateQueue(object):
+    """
+    The CandidateQueue class keeps track of library items whose watched state changed since they were last evaluated.
+
+    Items are added when Kodi reports a change in play count (``VideoLibrary.OnUpdate``) or when playback of an item
+    stops (``Player.OnStop``). This way an incremental cleaning run only needs to look at these items, instead of
+    querying the entire library. The queue is saved in the addon profile, so it survives restarts of Kodi.
+
+    *Example*
+      ``monitor.listeners.append(CandidateQueue().on_notification)``
+    """
+    # Map the item types used in notifications to the video types used by the cleaner
+    ITEM_TYPES = {
+        u"movie": u"movies",
+        u"episode": u"episodes",
+        u"musicvideo": u"musicvideos"
+    }
+
+    def __init__(self):
+        self.path = os.path.join(ADDON_PROFILE, "queue.json")
+        self.__lock = threading.Lock()
+        self.__items = self.__load()
+
+    def __load(self):
+        try:
+            with open(self.path) as f:
+                return dict((video_type, set(ids)) for video_type, ids in json.load(f).iteritems())
+        except (IOError, OSError, ValueError) as err:
+            if os.path.exists(self.path):
+                debug(u"Could not load the candidate queue: {error}", xbmc.LOGWARNING, error=err)
+            return {}
+
+    def __save(self):
+        """
+        Write the queue to the addon profile. Must be called while holding the lock.
+        """
+        try:
+            if not os.path.isdir(ADDON_PROFILE):
+                os.makedirs(ADDON_PROFILE)
+            with open(self.path + ".tmp", "w") as f:
+                json.dump(dict((video_type, sorted(ids)) for video_type, ids in self.__items.iteritems()), f)
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            os.rename(self.path + ".tmp", self.path)
+        except (IOError, OSError) as err:
+            debug(u"Could not save the candidate queue: {error}", xbmc.LOGERROR, error=err)
+
+    def on_notification(self, method, data):
+        """
+        Add the item a notification is about to the queue, if the notification could mean the item was watched.
+
+        :type method: unicode
+        :param method: The notification that was received.
+        :type data: unicode
+        :param data: The JSON data sent along with the notification.
+        """
+        if method not in (u"VideoLibrary.OnUpdate", u"Player.OnStop") or not get_setting(incremental_cleaning):
+            return
+
+        try:
+            data = json.loads(data)
+            item = data[u"item"]
+            video_type = self.ITEM_TYPES[item[u"type"]]
+            item_id = int(item[u"id"])
+        except (KeyError, TypeError, ValueError):
+            return  # Not a library item we clean
+
+        if method == u"VideoLibrary.OnUpdate" and data.get(u"playcount", 1) == 0:
+            return  # Marked as unwatched
+
+        debug(u"Queueing {type} {id:d} for the next incremental cleaning run.", type=video_type, id=item_id)
+        self.add(video_type, [item_id])
+
+    def add(self, video_type, ids):
+        """
+        Add items to the queue.
+
+        :type video_type: unicode
+        :param video_type: The type of the items (one of the video types used by the cleaner).
+        :type ids: list
+        :param ids: The library ids of the items.
+        """
+        with self.__lock:
+            self.__items.setdefault(video_type, set()).update(ids)
+            self.__save()
+
+    def remove(self, video_type, ids):
+        """
+        Remove items from the queue.
+
+        :type video_type: unicode
+        :param video_type: The type of the items (one of the video types used by the cleaner).
+        :type ids: list
+        :param ids: The library ids of the items.
+        """
+        with self.__lock:
+            self.__items.get(video_type, set()).difference_update(ids)
+            self.__save()
+
+    def get(self, video_type):
+        """
+        :type video_type: unicode
+        :param video_type: The type of the items (one of the video types used by the cleaner).
+        :rtype: list
+        :return: The library ids of all queued items of this type.
+        """
+        with self.__lock:
+            return sorted(self.__items.get(video_type, ()))
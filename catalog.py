@@ -0,0 +1,262 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+import xbmc
+from utils import ADDON_PROFILE, debug
+
+# What the catalog knows about the videos of one type
+CatalogState = namedtuple("CatalogState", ["key", "watermark", "refreshed"])
+
+
+class LibraryCatalog(object):
+    """
+    The LibraryCatalog class remembers the watched videos in the Kodi library between cleaning runs, along with the
+    verdict of the last run on each of them.
+
+    The first run requests all watched videos from Kodi. Later runs only request the videos that were played or added
+    after the watermark, the latest ``lastplayed`` or ``dateadded`` seen so far, and merge them into the catalog. The
+    verdicts of all other videos are reused: videos that did not match the rule, or that are excluded or hard linked,
+    are not looked at again until they are played again. Videos that will only match once they expire are evaluated
+    again from their stored properties, without asking Kodi. Videos that matched, or whose file was missing, are
+    checked again in every run, as a missing file may just be on a share that was offline.
+
+    Kodi does not report videos that were marked as unwatched or removed from the library in these queries. Therefore
+    the catalog is rebuilt every ``REFRESH_INTERVAL`` seconds, or when the key it was built with changes, e.g. because
+    the settings or the exclusions changed.
+
+    The catalog is stored in an SQLite database in the addon profile. All methods are safe to call from multiple threads
+    at once.
+
+    *Example*
+      ``catalog.merge(u"movies", videos); catalog.advance(u"movies", watermark); catalog.videos(u"movies", [MATCH])``
+    """
+    REFRESH_INTERVAL = 7 * 24 * 60 * 60
+
+    # The verdicts of the last run on a video
+    NO_MATCH = 0  # The video does not match the rule, and will not until it is played again
+    MATCH = 1  # The video matches the rule
+    LATER = 2  # The video does not match the rule yet, but may once time passes
+    SKIPPED = 3  # The video matches the rule, but may not be cleaned, e.g. because it is hard linked
+    EXCLUDED = 4  # The video matches the rule, but is excluded by the user
+    MISSING = 5  # The video matches the rule, but its file could not be found, e.g. because its share is offline
+
+    # The verdicts of the videos that are checked again in every run
+    RECHECKED = [MATCH, MISSING]
+
+    def __init__(self, path=None):
+        """
+        :type path: unicode
+        :param path: (Optional) The path of the database. Defaults to ``catalog.db`` in the addon profile.
+        """
+        self.path = path or os.path.join(ADDON_PROFILE, "catalog.db")
+        self.__connection = None
+        self.__lock = threading.RLock()
+
+    def __connect(self):
+        """
+        Open the database and create its tables, if that was not done yet. Must be called while holding the lock.
+
+        :rtype: sqlite3.Connection
+        :return: The connection to the database.
+        """
+        if self.__connection is None:
+            if not os.path.isdir(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            self.__connection = sqlite3.connect(self.path, check_same_thread=False)
+            with self.__connection:
+                self.__connection.executescript(u"""
+                    CREATE TABLE IF NOT EXISTS state (
+                        video_type TEXT PRIMARY KEY,
+                        key TEXT NOT NULL,
+                        watermark TEXT,
+                        refreshed REAL NOT NULL
+                    );
+                    CREATE TABLE IF NOT EXISTS videos (
+                        video_type TEXT NOT NULL,
+                        id INTEGER NOT NULL,
+                        file TEXT NOT NULL,
+                        lastplayed TEXT,
+                        playcount INTEGER,
+                        verdict INTEGER NOT NULL,
+                        details TEXT NOT NULL,
+                        PRIMARY KEY (video_type, id)
+                    );
+                    CREATE INDEX IF NOT EXISTS videos_by_verdict ON videos (video_type, verdict);
+                """)
+        return self.__connection
+
+    def __execute(self, statement, parameters=(), many=False):
+        """
+        Run a statement in a transaction of its own.
+
+        :rtype: list
+        :return: The rows the statement returned.
+        """
+        with self.__lock:
+            try:
+                connection = self.__connect()
+                with connection:
+                    if many:
+                        return connection.executemany(statement, parameters).fetchall()
+                    return connection.execute(statement, parameters).fetchall()
+            except (sqlite3.Error, IOError, OSError) as err:
+                debug(u"Could not access the library catalog: {error}", xbmc.LOGERROR, error=err)
+                return []
+
+    def state(self, video_type):
+        """
+        :type video_type: unicode
+        :param video_type: The type of the videos (one of the video types used by the cleaner).
+        :rtype: CatalogState
+        :return: What the catalog knows about the videos of this type, or None if it holds none of them.
+        """
+        rows = self.__execute(u"SELECT key, watermark, refreshed FROM state WHERE video_type = ?", (video_type,))
+        return CatalogState(*rows[0]) if rows else None
+
+    def is_stale(self, video_type, key):
+        """
+        :type video_type: unicode
+        :param video_type: The type of the videos (one of the video types used by the cleaner).
+        :type key: str
+        :param key: Identifies what the catalog should have been built with, e.g. a hash of the settings.
+        :rtype: bool
+        :return: True if the catalog must be rebuilt before it can be used, False otherwise.
+        """
+        state = self.state(video_type)
+        return (state is None or state.key != key or state.watermark is None or
+                not 0 <= time.time() - state.refreshed < self.REFRESH_INTERVAL)
+
+    def reset(self, video_type, key):
+        """
+        Forget all videos of a type, so the catalog can be rebuilt.
+
+        :type video_type: unicode
+        :param video_type: The type of the videos (one of the video types used by the cleaner).
+        :type key: str
+        :param key: Identifies what the catalog is built with, e.g. a hash of the settings.
+        """
+        debug(u"Rebuilding the library catalog of {type}.", type=video_type)
+        with self.__lock:
+            self.__execute(u"DELETE FROM videos WHERE video_type = ?", (video_type,))
+            self.__execute(u"INSERT OR REPLACE INTO state VALUES (?, ?, NULL, ?)", (video_type, key, time.time()))
+
+    def merge(self, video_type, videos):
+        """
+        Add videos to the catalog, or replace what it knows about them.
+
+        :type video_type: unicode
+        :param video_type: The type of the videos (one of the video types used by the cleaner).
+        :type videos: list
+        :param videos: Tuples of the library id, the verdict and the properties of each video, as returned by Kodi.
+        """
+        if videos:
+            self.__execute(u"INSERT OR REPLACE INTO videos VALUES (?, ?, ?, ?, ?, ?, ?)",
+                           [(video_type, library_id, details[u"file"], details.get(u"lastplayed"),
+                             details.get(u"playcount"), verdict, json.dumps(details))
+                            for library_id, verdict, details in videos], many=True)
+
+    def advance(self, video_type, watermark):
+        """
+        Move the watermark forward, once all videos played or added up to it were merged into the catalog.
+
+        :type video_type: unicode
+        :param video_type: The type of the videos (one of the video types used by the cleaner).
+        :type watermark: unicode
+        :param watermark: The latest ``lastplayed`` or ``dateadded`` of the merged videos, e.g. ``2017-01-31 20:00:00``.
+        """
+        if watermark:
+            self.__execute(u"UPDATE state SET watermark = ? WHERE video_type = ? AND "
+                           u"(watermark IS NULL OR watermark < ?)", (watermark, video_type, watermark))
+
+    def count(self, video_type, verdicts):
+        """
+        :type video_type: unicode
+        :param video_type: The type of the videos (one of the video types used by the cleaner).
+        :type verdicts: list
+        :param verdicts: The verdicts of the videos to count.
+        :rtype: int
+        :return: The number of videos in the catalog with any of these verdicts.
+        """
+        rows = self.__execute(u"SELECT COUNT(*) FROM videos WHERE video_type = ? AND verdict IN ({0})"
+                              .format(u", ".join(u"?" * len(verdicts))), [video_type] + list(verdicts))
+        return rows[0][0] if rows else 0
+
+    def videos(self, video_type, verdicts, after=None, limit=None):
+        """
+        Get videos from the catalog in order of their library id. Pass the id of the last video returned as ``after``
+        to get the next videos, so only ``limit`` videos have to be held in memory at a time.
+
+        :type video_type: unicode
+        :param video_type: The type of the videos (one of the video types used by the cleaner).
+        :type verdicts: list
+        :param verdicts: The verdicts of the videos to get.
+        :type after: int
+        :param after: (Optional) Only get videos with a greater library id. Defaults to ``None``, which starts with the
+            first video.
+        :type limit: int
+        :param limit: (Optional) The maximum number of videos to get. Defaults to ``None``, which gets all of them.
+        :rtype: list
+        :return: Tuples of the library id, the verdict and the stored properties of each video.
+        """
+        rows = self.__execute(u"SELECT id, verdict, details FROM videos WHERE video_type = ? AND verdict IN ({0}) "
+                              u"AND id > ? ORDER BY id LIMIT ?".format(u", ".join(u"?" * len(verdicts))),
+                              [video_type] + list(verdicts) + [-1 if after is None else after,
+                                                               -1 if limit is None else limit])
+        return [(library_id, verdict, json.loads(details)) for library_id, verdict, details in rows]
+
+    def pages(self, video_type, verdicts, size):
+        """
+        :type video_type: unicode
+        :param video_type: The type of the videos (one of the video types used by the cleaner).
+        :type verdicts: list
+        :param verdicts: The verdicts of the videos to get.
+        :type size: int
+        :param size: The maximum number of videos on a page.
+        :rtype: generator
+        :return: Lists of tuples of the library id, the verdict and the stored properties of each video, as returned by
+            ``videos()``. Verdicts may be changed while the pages are consumed.
+        """
+        after = None
+        while True:
+            page = self.videos(video_type, verdicts, after, size)
+            if not page:
+                return
+            yield page
+            after = page[-1][0]
+
+    def judge(self, video_type, ids, verdict):
+        """
+        Change the verdict on videos in the catalog.
+
+        :type video_type: unicode
+        :param video_type: The type of the videos (one of the video types used by the cleaner).
+        :type ids: list
+        :param ids: The library ids of the videos.
+        :type verdict: int
+        :param verdict: The new verdict.
+        """
+        ids = [library_id for library_id in ids if library_id is not None]
+        if ids:
+            self.__execute(u"UPDATE videos SET verdict = ? WHERE video_type = ? AND id = ?",
+                           [(verdict, video_type, library_id) for library_id in ids], many=True)
+
+    def forget(self, video_type, ids):
+        """
+        Remove videos from the catalog, e.g. because they were cleaned.
+
+        :type video_type: unicode
+        :param video_type: The type of the videos (one of the video types used by the cleaner).
+        :type ids: list
+        :param ids: The library ids of the videos.
+        """
+        ids = [library_id for library_id in ids if library_id is not None]
+        if ids:
+            self.__execute(u"DELETE FROM videos WHERE video_type = ? AND id = ?",
+                           [(video_type, library_id) for library_id in ids], many=True)
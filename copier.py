@@ -0,0 +1,270 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import ctypes
+import ctypes.util
+import errno
+import hashlib
+import os
+import time
+
+import xbmc
+from utils import debug
+from vfs import native_path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Not available on Windows
+
+# Values of the move_verification setting
+VERIFY_NONE = u"0"
+VERIFY_SIZE = u"1"
+VERIFY_CHECKSUM = u"2"
+
+# The ioctl that clones a file on Linux file systems that support it, e.g. btrfs and XFS
+FICLONE = 0x40049409
+
+# Errors indicating that a method of copying is not supported for these files, rather than that copying failed
+UNSUPPORTED = set(getattr(errno, name) for name in ["ENOSYS", "EXDEV", "EINVAL", "EOPNOTSUPP", "ENOTSUP", "EBADF"]
+                  if hasattr(errno, name))
+
+
+def __load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    except (OSError, TypeError):
+        return None, None
+
+    copy_file_range, sendfile = getattr(libc, "copy_file_range", None), getattr(libc, "sendfile64", None)
+    if copy_file_range is not None:
+        offset = ctypes.POINTER(ctypes.c_longlong)
+        copy_file_range.argtypes = [ctypes.c_int, offset, ctypes.c_int, offset, ctypes.c_size_t, ctypes.c_uint]
+        copy_file_range.restype = ctypes.c_ssize_t
+    if sendfile is not None:
+        sendfile.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.POINTER(ctypes.c_longlong), ctypes.c_size_t]
+        sendfile.restype = ctypes.c_ssize_t
+    return copy_file_range, sendfile
+
+
+_copy_file_range, _sendfile = __load_libc()
+
+
+class CopyEngine(object):
+    """
+    The CopyEngine class copies large local files as fast as the file systems allow, while remaining interruptible.
+
+    The fastest method available is used:
+
+    1. Cloning the file (reflink), on file systems that support it. No data is copied at all.
+    2. ``copy_file_range()`` or ``sendfile()``, which copy the data within the kernel.
+    3. Reading and writing large chunks.
+
+    Files are copied to a ``.part`` file next to the destination, which is only renamed once the copy is complete and
+    verified, and is removed if copying fails. If copying was canceled or interrupted, e.g. because Kodi was closed, it
+    is resumed where it left off next time. As copying happens in chunks, a bandwidth limit can be applied and
+    cancellation is checked between chunks.
+
+    Only local paths are supported, which includes network shares mounted by the operating system. See ``supports()``.
+
+    *Example*
+      ``CopyEngine(bandwidth_limit=50 * 1024 ** 2, verification=VERIFY_SIZE).copy(source, destination)``
+    """
+    CHUNK_SIZE = 16 * 1024 ** 2
+    MIN_CHUNK_SIZE = 64 * 1024
+    RESUME_CHECK_SIZE = 1024 ** 2
+    PART_EXTENSION = u".part"
+
+    # Returned by copy() when copying was canceled, as opposed to True or False. Compare with ``is``.
+    CANCELED = object()
+
+    def __init__(self, bandwidth_limit=0, verification=VERIFY_SIZE, is_canceled=lambda: False):
+        """
+        :type bandwidth_limit: int
+        :param bandwidth_limit: (Optional) The maximum number of bytes to copy per second, or 0 for no limit.
+        :type verification: unicode
+        :param verification: (Optional) How to verify copies (one of VERIFY_NONE, VERIFY_SIZE or VERIFY_CHECKSUM).
+        :type is_canceled: callable
+        :param is_canceled: (Optional) Called between chunks. Returns True to stop copying.
+        """
+        self.bandwidth_limit = int(bandwidth_limit)
+        self.verification = verification
+        self.is_canceled = is_canceled
+        self.chunk_size = self.CHUNK_SIZE
+        if self.bandwidth_limit:
+            # Copy at least a few chunks per second, so cancellation is noticed quickly
+            self.chunk_size = min(self.CHUNK_SIZE, max(self.bandwidth_limit // 4, self.MIN_CHUNK_SIZE))
+
+    @staticmethod
+    def supports(path):
+        """
+        :type path: unicode
+        :param path: The path of a file.
+        :rtype: bool
+        :return: True if the path is a local path the engine can copy, False if it should be left to Kodi.
+        """
+        return u"://" not in path
+
+    def copy(self, source, destination):
+        """
+        Copy a file. An existing ``.part`` file of the destination is resumed if it matches the source.
+
+        :type source: unicode
+        :param source: The file to copy.
+        :type destination: unicode
+        :param destination: The path to copy the file to.
+        :rtype: bool
+        :return: True if the file was copied and verified, ``CANCELED`` if copying was canceled, False otherwise.
+        """
+        part = native_path(destination + self.PART_EXTENSION)
+        try:
+            size = os.path.getsize(native_path(source))
+            offset = self.__resume_offset(native_path(source), part, size)
+            flags = os.O_WRONLY | os.O_CREAT | getattr(os, "O_BINARY", 0) | (0 if offset else os.O_TRUNC)
+            src = os.open(native_path(source), os.O_RDONLY | getattr(os, "O_BINARY", 0))
+            try:
+                dst = os.open(part, flags)
+                try:
+                    if offset == 0 and self.__clone(src, dst):
+                        debug(u"Cloned {source} to {dest}.", source=source, dest=destination)
+                        offset = size
+                    else:
+                        debug(u"Copying {source} to {dest} from byte {offset:d}.", source=source, dest=destination,
+                              offset=offset)
+                        offset = self.__copy_range(src, dst, offset, size)
+                        os.fsync(dst)
+                finally:
+                    os.close(dst)
+            finally:
+                os.close(src)
+
+            if offset < size:
+                debug(u"Copying was canceled after {offset:d} of {size:d} bytes. It will be resumed next time.",
+                      offset=offset, size=size)
+                return self.CANCELED
+            if not self.__verify(native_path(source), part, size):
+                debug(u"The copy of {source} does not match the original. Removing it.", xbmc.LOGERROR, source=source)
+                self.__remove(part)
+                return False
+            os.rename(part, native_path(destination))
+            return True
+        except (IOError, OSError) as err:
+            debug(u"Could not copy {source}: {error}", xbmc.LOGERROR, source=source, error=err)
+            self.__remove(part)
+            return False
+
+    @staticmethod
+    def __remove(part):
+        """
+        Remove a partial copy, if there is one.
+        """
+        try:
+            os.remove(part)
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                debug(u"Could not remove the partial copy {path}: {error}", xbmc.LOGWARNING, path=part, error=err)
+
+    def __resume_offset(self, source, part, size):
+        """
+        Determine where to resume copying. The end of the partial copy must match the source, otherwise the partial
+        copy is discarded.
+
+        :rtype: int
+        :return: The number of bytes that were already copied.
+        """
+        try:
+            copied = os.path.getsize(part)
+        except OSError:
+            return 0
+        if not 0 < copied <= size:
+            return 0
+
+        check = min(self.RESUME_CHECK_SIZE, copied)
+        with open(source, "rb") as f, open(part, "rb") as g:
+            f.seek(copied - check)
+            g.seek(copied - check)
+            if f.read(check) != g.read(check):
+                debug(u"The partial copy does not match its source. Starting over.", xbmc.LOGWARNING)
+                return 0
+        return copied
+
+    @staticmethod
+    def __clone(src, dst):
+        if fcntl is None:
+            return False
+        try:
+            fcntl.ioctl(dst, FICLONE, src)
+            return True
+        except (IOError, OSError):
+            return False
+
+    def __copy_range(self, src, dst, offset, size):
+        """
+        Copy bytes from one file to another in chunks, starting at the given offset, with the fastest method that works.
+
+        :rtype: int
+        :return: The offset copying stopped at. Less than the size if copying was canceled.
+        """
+        methods = [m for m, available in [(self.__copy_file_range, _copy_file_range), (self.__sendfile, _sendfile)]
+                   if available is not None] + [self.__read_write]
+        start, started = offset, time.time()
+        while offset < size and not self.is_canceled():
+            try:
+                copied = methods[0](src, dst, offset, min(self.chunk_size, size - offset))
+            except OSError as err:
+                if err.errno not in UNSUPPORTED or len(methods) == 1:
+                    raise
+                debug(u"Falling back to the next method of copying: {error}", error=err)
+                methods.pop(0)
+                continue
+            if not copied:
+                raise IOError(u"The source file ended after {0:d} of {1:d} bytes.".format(offset, size))
+            offset += copied
+
+            if self.bandwidth_limit:
+                delay = float(offset - start) / self.bandwidth_limit - (time.time() - started)
+                if delay > 0:
+                    time.sleep(delay)
+        return offset
+
+    @staticmethod
+    def __copy_file_range(src, dst, offset, count):
+        src_offset, dst_offset = ctypes.c_longlong(offset), ctypes.c_longlong(offset)
+        copied = _copy_file_range(src, ctypes.byref(src_offset), dst, ctypes.byref(dst_offset), count, 0)
+        if copied < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        return copied
+
+    @staticmethod
+    def __sendfile(src, dst, offset, count):
+        os.lseek(dst, offset, os.SEEK_SET)
+        copied = _sendfile(dst, src, ctypes.byref(ctypes.c_longlong(offset)), count)
+        if copied < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        return copied
+
+    @staticmethod
+    def __read_write(src, dst, offset, count):
+        os.lseek(src, offset, os.SEEK_SET)
+        os.lseek(dst, offset, os.SEEK_SET)
+        data = os.read(src, count)
+        view, written = memoryview(data), 0
+        while written < len(data):
+            written += os.write(dst, view[written:])
+        return len(data)
+
+    def __verify(self, source, copy, size):
+        if self.verification == VERIFY_NONE:
+            return True
+        if os.path.getsize(copy) != size:
+            return False
+        if self.verification == VERIFY_CHECKSUM:
+            return self.__checksum(source) == self.__checksum(copy)
+        return True
+
+    def __checksum(self, path):
+        checksum = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(self.CHUNK_SIZE), b""):
+                checksum.update(chunk)
+        return checksum.digest()
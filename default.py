@@ -4,10 +4,24 @@
 import json
 import sys
 import re
-
-from reset_exclusions import *
+import threading
+from itertools import islice, izip_longest
+
+from candidates import CandidateQueue
+from catalog import LibraryCatalog
+from copier import CopyEngine
+from exclusions import ExclusionList, manage_exclusions
+from executor import Executor, get_share
+from holding import HoldingFolder
+from metrics import RunMetrics
+from plan import CleaningPlan, DELETE, MOVE, REMOVE_FOLDER
+from planner import SpacePlanner
+from progress import ProgressReporter
+from pruner import FolderPruner
+from rules import And, Condition, PlanCache, compile_rule
 from utils import *
-from viewer import *
+from vfs import DirectoryIndex
+from volumes import VolumeMonitor
 
 
 class Cleaner(object):
@@ -66,16 +80,70 @@ class Cleaner(object):
         MOVIES: [u"file", u"title"],
         MUSIC_VIDEOS: [u"file", u"artist"]
     }
+    detail_methods = {
+        TVSHOWS: u"VideoLibrary.GetEpisodeDetails",
+        MOVIES: u"VideoLibrary.GetMovieDetails",
+        MUSIC_VIDEOS: u"VideoLibrary.GetMusicVideoDetails"
+    }
+    id_fields = {
+        TVSHOWS: u"episodeid",
+        MOVIES: u"movieid",
+        MUSIC_VIDEOS: u"musicvideoid"
+    }
+    details_fields = {
+        TVSHOWS: u"episodedetails",
+        MOVIES: u"moviedetails",
+        MUSIC_VIDEOS: u"musicvideodetails"
+    }
+    remove_methods = {
+        TVSHOWS: u"VideoLibrary.RemoveEpisode",
+        MOVIES: u"VideoLibrary.RemoveMovie",
+        MUSIC_VIDEOS: u"VideoLibrary.RemoveMusicVideo"
+    }
+    # The localized names of the video types, as used in the progress dialog
+    type_names = {
+        TVSHOWS: 32628,
+        MOVIES: 32626,
+        MUSIC_VIDEOS: 32627
+    }
+    cleaning_settings = {
+        TVSHOWS: clean_tv_shows,
+        MOVIES: clean_movies,
+        MUSIC_VIDEOS: clean_music_videos
+    }
     stacking_indicators = [u"part", u"pt", u"cd", u"dvd", u"disk", u"disc"]
+    # The settings the verdicts in the library catalog depend on. Changing any other setting keeps the catalog.
+    catalog_settings = [enable_expiration, expire_after, clean_when_low_rated, minimum_rating, ignore_no_rating,
+                        not_in_progress, keep_hard_linked, exclusion_enabled]
+
+    # The number of videos to request from Kodi at once. Keeps memory usage bounded for large libraries.
+    PAGE_SIZE = 250
 
-    progress = xbmcgui.DialogProgress()
-    monitor = xbmc.Monitor()
     silent = True
     exit_status = STATUS_SUCCESS
+    executor = Executor()
+    rule_plans = PlanCache()
 
-    def __init__(self):
-        debug(u"{0} version {1} loaded.".format(ADDON.getAddonInfo(u"name").decode("utf-8"),
-                                                ADDON.getAddonInfo(u"version").decode("utf-8")))
+    def __init__(self, monitor=None, candidate_queue=None):
+        """
+        :type monitor: Monitor
+        :param monitor: (Optional) The monitor to wait on and to receive notifications from. Defaults to a new one.
+        :type candidate_queue: CandidateQueue
+        :param candidate_queue: (Optional) The queue of videos to consider in incremental runs. Defaults to a new one.
+        """
+        self.monitor = monitor or Monitor()
+        self.progress = ProgressReporter()
+        self.metrics = RunMetrics()
+        self.directory_index = DirectoryIndex(self.metrics)
+        self.holding = HoldingFolder(get_setting(holding_folder), self.directory_index, self.metrics)
+        self.pruner = FolderPruner(get_setting(ignore_extensions), self.directory_index, self.metrics)
+        self.library_ids = {}
+        self.cleaned_sizes = {}
+        self.candidate_queue = candidate_queue or CandidateQueue()
+        self.catalog = LibraryCatalog()
+        self.exclusions = ExclusionList()
+        self.volumes = VolumeMonitor()
+        debug(u"{0} version {1} loaded.".format(ADDON_NAME, ADDON.getAddonInfo(u"version").decode("utf-8")))
 
     def __is_canceled(self):
         """
@@ -103,30 +171,32 @@ class Cleaner(object):
         """
         self.silent = True
 
-    def clean(self, video_type):
+    def clean(self, video_type, incremental=False, expired_videos=None):
         """
         Clean all watched videos of the provided type.
 
         :type video_type: unicode
         :param video_type: The type of videos to clean (one of TVSHOWS, MOVIES, MUSIC_VIDEOS).
+        :type incremental: bool
+        :param incremental: (Optional) Only consider videos in the candidate queue. Defaults to ``False``.
+        :type expired_videos: (int, iterable)
+        :param expired_videos: (Optional) The number of videos to clean and their (filename, title, library id) tuples,
+            as returned by ``get_expired_videos()`` or selected by a ``SpacePlanner``. Defaults to ``None``, which finds
+            the videos to clean first.
         :rtype: (list, int, int)
         :return: A list of the filenames that were cleaned, as well as the number of files cleaned and the return status.
         """
         cleaned_files = []
         count = 0
-        type_translation = {self.MOVIES: translate(32626), self.MUSIC_VIDEOS: translate(32627), self.TVSHOWS: translate(32628)}
+        type_name = translate(self.type_names.get(video_type, 32615))
 
         if not self.silent:
             # Cleaning <video type>
-            self.progress.update(0, translate(32629).format(type=type_translation[video_type]), *map(translate, (32615, 32615)))
-            self.monitor.waitForAbort(1)
+            self.progress.update(0, translate(32629).format(type=type_name), *map(translate, (32615, 32615)))
 
-        if video_type == self.TVSHOWS:
-            clean_this_video_type = get_setting(clean_tv_shows)
-        elif video_type == self.MOVIES:
-            clean_this_video_type = get_setting(clean_movies)
-        elif video_type == self.MUSIC_VIDEOS:
-            clean_this_video_type = get_setting(clean_music_videos)
+        settings = snapshot()
+        if video_type in self.cleaning_settings:
+            clean_this_video_type = settings[self.cleaning_settings[video_type]]
         else:
             debug(u"Incorrect video type specified: {0}".format(video_type), xbmc.LOGERROR)
             return [], 0, self.STATUS_FAILURE
@@ -134,120 +204,457 @@ class Cleaner(object):
         progress_percent = 0
 
         if clean_this_video_type:
-            expired_videos = self.get_expired_videos(video_type)
+            if expired_videos is not None:
+                amount, expired_videos = expired_videos
+            elif incremental:
+                amount, expired_videos = self.get_queued_videos(video_type)
+            else:
+                amount, expired_videos = self.get_expired_videos(video_type)
             if not self.silent:
-                amount = len(expired_videos)
                 debug(u"Found {0} videos that may need cleaning.".format(amount))
                 try:
                     increment = 1.0 / amount
                 except ZeroDivisionError:
                     self.progress.update(0, *map(translate, (32621, 32622, 32623)))  # No watched videos found
-                    if self.monitor.waitForAbort(2.5):
-                        pass
-
-            for filename, title in expired_videos:
-                if not self.__is_canceled():
-                    unstacked_path = self.unstack(filename)
-                    if xbmcvfs.exists(unstacked_path[0]) and self.has_no_hard_links(filename):
-                        if get_setting(cleaning_type) == self.CLEANING_TYPE_MOVE:
-                            # No destination set, prompt user to set one now
-                            if get_setting(holding_folder) == "":
-                                if xbmcgui.Dialog().yesno(ADDON_NAME, *map(translate, (32521, 32522, 32523))):
-                                    xbmc.executebuiltin(u"Addon.OpenSettings({0})".format(ADDON_ID))
-                                self.exit_status = self.STATUS_ABORTED
-                                break
-                            if get_setting(create_subdirs):
-                                title = re.sub(r"[\\/:*?\"<>|]+","_", title)
-                                new_path = os.path.join(get_setting(holding_folder).encode("utf-8"),
-                                                        title.encode("utf-8"))
-                            else:
-                                new_path = get_setting(holding_folder)
-                            move_result = self.move_file(filename, new_path)
-                            if move_result == 1:
-                                debug(u"File(s) moved successfully.")
-                                count += 1
-                                if len(unstacked_path) > 1:
-                                    cleaned_files.extend(unstacked_path)
-                                else:
-                                    cleaned_files.append(filename)
-                                self.clean_related_files(filename, new_path)
-                                self.delete_empty_folders(os.path.dirname(filename))
-                            elif move_result == -1:
-                                debug(u"Moving errors occurred. Skipping related files and directories.", xbmc.LOGWARNING)
-                                xbmcgui.Dialog().ok(*map(translate, (32611, 32612, 32613, 32614)))
-                        elif get_setting(cleaning_type) == self.CLEANING_TYPE_DELETE:
-                            if self.delete_file(filename):
-                                debug(u"File(s) deleted successfully.")
-                                count += 1
-                                if len(unstacked_path) > 1:
-                                    cleaned_files.extend(unstacked_path)
-                                else:
-                                    cleaned_files.append(filename)
-                                self.clean_related_files(filename)
-                                self.delete_empty_folders(os.path.dirname(filename))
-                    else:
-                        debug(u"Not cleaning {0}.".format(filename), xbmc.LOGNOTICE)
+
+            # No destination set, prompt user to set one now
+            if amount and settings[cleaning_type] == self.CLEANING_TYPE_MOVE and settings[holding_folder] == "":
+                if xbmcgui.Dialog().yesno(ADDON_NAME, *map(translate, (32521, 32522, 32523))):
+                    xbmc.executebuiltin(u"Addon.OpenSettings({0})".format(ADDON_ID))
+                self.exit_status = self.STATUS_ABORTED
+                return cleaned_files, count, self.exit_status
+
+            self.executor = Executor(settings[concurrent_operations], settings[concurrent_operations_per_share])
+            for page in self.__pages(expired_videos):
+                if self.__is_canceled():
+                    break
+                with self.metrics.span(u"plan"):
+                    plan = self.create_plan(video_type, page)
+                if not self.silent:
+                    progress_percent += increment * 100 * (len(page) - len(plan.videos))  # Skipped videos
+
+                for (video,), result in self.execute_plan(plan):
+                    if result == 1:
+                        count += 1
+                        self.metrics.count(u"videos_cleaned")
+                        cleaned_files.extend(self.unstack(video[u"path"]))
+                        self.cleaned_sizes.update((operation[u"path"], operation[u"size"])
+                                                  for _, operation in plan.operations_of(video))
+                        self.library_ids.setdefault(video_type, []).append(video[u"library_id"])
+                    elif result == -1:
+                        xbmcgui.Dialog().ok(*map(translate, (32611, 32612, 32613, 32614)))
 
                     if not self.silent:
                         progress_percent += increment * 100
-                        debug(u"Progress percent is {percent}, amount is {amount} and increment is {increment}".format(percent=progress_percent, amount=amount, increment=increment))
-                        self.progress.update(int(progress_percent), translate(32616).format(amount=amount, type=type_translation[video_type]), translate(32617), u"[I]{0}[/I]".format(title))
-                        self.monitor.waitForAbort(2)
-                else:
-                    debug(u"We had {amt} {type} left to clean.".format(amt=(amount - count), type=type_translation[video_type]))
+                        debug(u"Progress percent is {percent}, amount is {amount} and increment is {increment}",
+                              percent=progress_percent, amount=amount, increment=increment)
+                        self.progress.update(int(progress_percent), translate(32616).format(amount=amount, type=type_name), translate(32617), u"[I]{0}[/I]".format(video[u"title"]))
+
+            if self.exit_status == self.STATUS_ABORTED:
+                debug(u"We had {amt} {type} left to clean.".format(amt=(amount - count), type=type_name))
         else:
             debug(u"Cleaning of {0} is disabled. Skipping.".format(video_type))
             if not self.silent:
-                self.progress.update(0, translate(32624).format(type=type_translation[video_type]), *map(translate, (32625, 32615)))
-                self.monitor.waitForAbort(2)
+                self.progress.update(0, translate(32624).format(type=type_name), *map(translate, (32625, 32615)))
 
         return cleaned_files, count, self.exit_status
 
-    def clean_all(self):
+    def __pages(self, videos):
+        """
+        Split videos into pages of at most ``PAGE_SIZE`` videos, so only one page needs to be planned at a time.
+
+        :type videos: iterable
+        :param videos: The (filename, title, library id) tuples of the videos to clean.
+        :rtype: generator
+        :return: Lists of (filename, title, library id) tuples.
+        """
+        videos = iter(videos)
+        while True:
+            page = list(islice(videos, self.PAGE_SIZE))
+            if not page:
+                return
+            yield page
+
+    def create_plan(self, video_type, videos, plan=None, detailed=False):
+        """
+        Decide how to clean videos according to the user's preferences, without changing anything on disk yet.
+
+        The metadata of all files is fetched up front, so planning only reads from the directory index.
+
+        :type video_type: unicode
+        :param video_type: The type of the videos (one of TVSHOWS, MOVIES, MUSIC_VIDEOS).
+        :type videos: list
+        :param videos: The (filename, title, library id) tuples of the videos to clean.
+        :type plan: CleaningPlan
+        :param plan: (Optional) The plan to add the videos to. Defaults to ``None``, which creates a new plan.
+        :type detailed: bool
+        :param detailed: (Optional) Also look up the sizes of related files. Defaults to ``False``.
+        :rtype: CleaningPlan
+        :return: The plan, containing only the videos that should be cleaned.
+        """
+        if plan is None:
+            plan = CleaningPlan()
+        self.directory_index.prefetch([p for filename, _, _ in videos for p in self.unstack(filename)],
+                                      self.executor, self.__is_canceled)
+
+        folders = {}
+        for filename, title, library_id in videos:
+            video = self.plan_video(plan, video_type, filename, title, detailed, library_id)
+            if video is not None:
+                folders.setdefault(os.path.dirname(self.unstack(filename)[0]), []).extend(video[u"operations"])
+
+        if get_setting(delete_folders):
+            removed = set(operation[u"path"] for operation in plan.operations if operation[u"action"] != REMOVE_FOLDER)
+            for folder, depends in folders.items():
+                if self.would_be_empty(folder, removed):
+                    plan.add_operation(REMOVE_FOLDER, folder, depends=depends)
+
+        debug(u"Planned {operations:d} operations to clean {amount:d} of {total:d} videos.",
+              operations=len(plan.operations), amount=len(plan.videos), total=len(videos))
+        return plan
+
+    def plan_video(self, plan, video_type, filename, title, detailed=False, library_id=None):
+        """
+        Add the operations needed to clean a single video to a plan: the files of the video itself, followed by any
+        related files.
+
+        :type plan: CleaningPlan
+        :param plan: The plan to add the video to.
+        :type video_type: unicode
+        :param video_type: The type of the video (one of TVSHOWS, MOVIES, MUSIC_VIDEOS).
+        :type filename: unicode
+        :param filename: The (possibly stacked) path of the video to clean.
+        :type title: unicode
+        :param title: The title of the video, used to name subfolders in the holding folder.
+        :type detailed: bool
+        :param detailed: (Optional) Also look up the sizes of related files. Defaults to ``False``.
+        :type library_id: int
+        :param library_id: (Optional) The id of the video in the Kodi library.
+        :rtype: dict
+        :return: The video as added to the plan, or None if it should not be cleaned.
+        """
+        unstacked_path = self.unstack(filename)
+        if not self.directory_index.exists(unstacked_path[0]):
+            debug(u"Not cleaning {file}.", xbmc.LOGNOTICE, file=filename)
+            self.catalog.judge(video_type, [library_id], LibraryCatalog.MISSING)
+            return None
+        if not self.has_no_hard_links(filename):
+            debug(u"Not cleaning {file}.", xbmc.LOGNOTICE, file=filename)
+            self.catalog.judge(video_type, [library_id], LibraryCatalog.SKIPPED)
+            return None
+
+        if get_setting(cleaning_type) == self.CLEANING_TYPE_MOVE:
+            action = MOVE
+            if get_setting(create_subdirs):
+                safe_title = re.sub(r"[\\/:*?\"<>|]+", "_", title)
+                destination = os.path.join(get_setting(holding_folder).encode("utf-8"), safe_title.encode("utf-8"))
+                destination = unicode(destination, encoding="utf-8")
+            else:
+                destination = get_setting(holding_folder)
+        else:
+            action, destination = DELETE, None
+
+        video = plan.add_video(video_type, filename, title, library_id)
+        depends = [plan.add_operation(action, p, destination, self.directory_index.stat(p).size, video=video)
+                   for p in unstacked_path]
+
+        if get_setting(clean_related):
+            path, name = os.path.split(unstacked_path[0])  # Because stacked movies are in the same folder, only check one
+            if filename.startswith(u"stack://"):
+                name = self.get_stack_bare_title(unstacked_path)
+            else:
+                name, ext = os.path.splitext(name)
+
+            debug(u"Attempting to match related files in {path} with prefix {prefix}", path=path, prefix=name)
+            for extra_file in self.directory_index.files_with_prefix(path, name):
+                extra_file_path = os.path.join(path, extra_file)
+                if extra_file_path not in unstacked_path:
+                    debug(u"{file} starts with {prefix}.", file=extra_file, prefix=name)
+                    size = self.directory_index.stat(extra_file_path).size if detailed else None
+                    plan.add_operation(action, extra_file_path, destination, size, depends, video)
+        else:
+            debug(u"Cleaning of related files is disabled.")
+
+        return video
+
+    def would_be_empty(self, folder, removed):
+        """
+        Check if a folder would be empty once the files in it that are about to be cleaned are gone. Files with an
+        ignored extension do not count, and neither do subfolders that would be empty themselves.
+
+        :type folder: unicode
+        :param folder: The folder to check.
+        :type removed: set
+        :param removed: The paths of the files that are about to be cleaned.
+        :rtype: bool
+        :return: True if the folder would be empty, False otherwise.
+        """
+        subfolders, files = self.directory_index.listdir(folder)
+        for f in files:
+            if not self.pruner.is_ignored(f) and os.path.join(folder, f) not in removed:
+                return False
+        return all(self.would_be_empty(os.path.join(folder, f), removed) for f in subfolders)
+
+    def execute_plan(self, plan):
+        """
+        Carry out a cleaning plan. Videos are cleaned concurrently, alternating between network shares so that jobs on
+        different shares can run side by side. The folders that may have been left empty are passed on to the pruner,
+        which removes them at the end of the run.
+
+        :type plan: CleaningPlan
+        :param plan: The plan to carry out.
+        :rtype: generator
+        :return: Tuples of the (video,) arguments of each job and its result, as returned by ``execute_video()``.
+        """
+        queues = {}
+        for video in plan.videos:
+            share = get_share(video[u"path"])
+            queues.setdefault(share, []).append((share, (plan, video)))
+        # Alternate between shares, so the jobs waiting for a busy share do not hold up those for other shares
+        jobs = [job for batch in izip_longest(*[queues[key] for key in sorted(queues)]) for job in batch if job]
+
+        for (_, video), result in self.executor.run(self.execute_video, jobs, self.__is_canceled):
+            yield (video,), result
+
+        for operation in plan.operations:
+            if operation[u"action"] == REMOVE_FOLDER and any(plan.operations[i].get(u"done")
+                                                             for i in operation[u"depends"]):
+                self.pruner.touch(operation[u"path"])
+
+    def execute_video(self, plan, video):
+        """
+        Carry out the operations of a single video in a plan. Related files are only cleaned once the video itself was
+        cleaned.
+
+        This is safe to call from multiple threads at once.
+
+        :type plan: CleaningPlan
+        :param plan: The plan the video is part of.
+        :type video: dict
+        :param video: The video to clean.
+        :rtype: int
+        :return: 1 if the video was cleaned, 0 if not, -1 if errors occurred while moving.
+        """
+        operations = [operation for _, operation in plan.operations_of(video)]
+        for operation in operations:
+            if operation[u"depends"]:
+                continue
+            elif operation[u"action"] == MOVE:
+                result = self.move_file(operation[u"path"], operation[u"destination"])
+                operation[u"done"] = result == 1
+                if result == 0:
+                    debug(u"Moving was canceled. Skipping related files and directories.")
+                    return 0
+                elif not operation[u"done"]:
+                    debug(u"Moving errors occurred. Skipping related files and directories.", xbmc.LOGWARNING)
+                    self.metrics.count(u"errors")
+                    return -1
+            else:
+                operation[u"done"] = self.delete_file(operation[u"path"])
+                if not operation[u"done"]:
+                    self.metrics.count(u"errors")
+
+        if not any(operation.get(u"done") for operation in operations):
+            return 0
+
+        related = [operation for operation in operations if operation[u"depends"]]
+        if related:
+            with self.metrics.span(u"related", video[u"path"]):
+                for operation in related:
+                    debug(u"Cleaning related file {path}.", path=operation[u"path"])
+                    if operation[u"action"] == MOVE:
+                        operation[u"done"] = self.move_file(operation[u"path"], operation[u"destination"]) == 1
+                    elif self.metrics.call(u"delete", xbmcvfs.delete, operation[u"path"]):
+                        self.directory_index.remove(operation[u"path"])
+                        operation[u"done"] = True
+
+        for operation in operations:
+            if operation.get(u"done"):
+                moved = operation[u"action"] == MOVE
+                self.metrics.count(u"files_moved" if moved else u"files_deleted")
+                self.metrics.count(u"bytes_moved" if moved else u"bytes_freed", operation[u"size"] or 0)
+        return 1
+
+    def clean_all(self, incremental=False):
         """
         Clean up any watched videos in the Kodi library, satisfying any conditions set via the addon settings.
 
+        :type incremental: bool
+        :param incremental: (Optional) Only consider videos whose watched state changed since the previous run, as
+            recorded in the candidate queue. Defaults to ``False``, which considers the entire library.
         :rtype: (unicode, int)
         :return: A single-line (localized) summary of the cleaning results to be used for a notification, plus a status.
         """
-        debug(u"Starting cleaning routine.")
+        debug(u"Starting {kind} cleaning routine.", kind=u"incremental" if incremental else u"full")
+
+        # Read all settings once; they stay the same until the user changes them
+        snapshot()
+        self.metrics = RunMetrics()
+        self.directory_index = DirectoryIndex(self.metrics)
+        self.holding = HoldingFolder(get_setting(holding_folder), self.directory_index, self.metrics)
+        self.pruner = FolderPruner(get_setting(ignore_extensions), self.directory_index, self.metrics)
+        self.library_ids = {}
+        self.cleaned_sizes = {}
 
         if get_setting(clean_when_idle) and xbmc.Player().isPlaying():
             debug(u"Kodi is currently playing a file. Skipping cleaning.", xbmc.LOGWARNING)
             return None, self.exit_status
 
+        planner = self.space_planner()
         results = {}
         cleaning_results, cleaned_files = [], []
-        if not get_setting(clean_when_low_disk_space) or (get_setting(clean_when_low_disk_space) and disk_space_low()):
+        if not get_setting(clean_when_low_disk_space) or planner is not None:
             if not self.silent:
                 self.progress.create(ADDON_NAME, *map(translate, (32619, 32615, 32615)))
                 self.progress.update(0)
-                self.monitor.waitForAbort(2)
-            for video_type in [self.MOVIES, self.MUSIC_VIDEOS, self.TVSHOWS]:
-                if not self.__is_canceled():
-                    cleaned_files, count, status = self.clean(video_type)
-                    if count > 0:
-                        cleaning_results.extend(cleaned_files)
-                        results[video_type] = count
+
+            for selection in self.select_videos(planner, incremental):
+                for video_type in [self.MOVIES, self.MUSIC_VIDEOS, self.TVSHOWS]:
+                    if video_type in selection and not self.__is_canceled():
+                        cleaned_files, count, status = self.clean(video_type, incremental, selection[video_type])
+                        if count > 0:
+                            cleaning_results.extend({u"type": video_type, u"path": f,
+                                                     u"bytes": self.cleaned_sizes.get(f)} for f in cleaned_files)
+                            results[video_type] = results.get(video_type, 0) + count
+                        if planner is not None:
+                            planner.cleaned(cleaned_files)
+                if self.__is_canceled():
+                    break
+
+            # Folders are only removed once all videos were cleaned, so each folder is checked just once
+            self.pruner.prune(self.monitor.abortRequested)
+            for video_type, ids in self.library_ids.items():
+                self.catalog.forget(video_type, ids)
+                self.candidate_queue.remove(video_type, ids)
+
+            if planner is not None:
+                debug(u"Freed {freed} of {needed} bytes.", freed=planner.bytes_freed, needed=planner.bytes_needed)
+                for volume, amount in planner.bytes_freed.items():
+                    self.volumes.freed(volume, amount)
             if not self.silent:
                 self.progress.close()
 
         # Check if we need to perform any post-cleaning operations
         if cleaning_results:
             # Write cleaned file names to the log
-            Log().prepend(cleaning_results)
+            Log().append(cleaning_results)
 
-            # Finally clean the library to account for any deleted videos.
+            # Finally remove the cleaned videos from the library
             if get_setting(clean_kodi_library):
-                self.monitor.waitForAbort(2)  # Sleep 2 seconds to make sure file I/O is done.
-
-                if xbmc.getCondVisibility(u"Library.IsScanningVideo"):
-                    debug(u"The video library is being updated. Skipping library cleanup.", xbmc.LOGWARNING)
-                else:
-                    xbmc.executebuiltin(u"XBMC.CleanLibrary(video, false)")
+                with self.metrics.span(u"library_cleanup"):
+                    removed = all([self.remove_from_library(video_type, ids)
+                                   for video_type, ids in self.library_ids.items()])
+                    if not removed and get_setting(full_library_cleanup):
+                        debug(u"Not all videos could be removed from the library. Cleaning the entire library instead.",
+                              xbmc.LOGWARNING)
+                        self.monitor.waitForAbort(2)  # Sleep 2 seconds to make sure file I/O is done.
+
+                        if xbmc.getCondVisibility(u"Library.IsScanningVideo"):
+                            debug(u"The video library is being updated. Skipping library cleanup.", xbmc.LOGWARNING)
+                        else:
+                            xbmc.executebuiltin(u"XBMC.CleanLibrary(video, false)")
 
+        self.holding.save()
+        self.metrics.finish()
+        self.metrics.export()
         return self.summarize(results), self.exit_status
 
+    def space_planner(self):
+        """
+        Set up a space planner if the user wants to clean only when disk space is low, and disk space is low.
+
+        :rtype: SpacePlanner
+        :return: The space planner, or None if cleaning does not depend on disk space or disk space is not low.
+        """
+        if get_setting(clean_when_low_disk_space):
+            bytes_needed = self.volumes.bytes_to_free()
+            if bytes_needed:
+                debug(u"Disk space is low. Cleaning until {bytes} bytes are freed.", bytes=bytes_needed)
+                return SpacePlanner(bytes_needed, get_setting(cleaning_priority), self.directory_index)
+        return None
+
+    def select_videos(self, planner, incremental=False):
+        """
+        Select the videos to clean. When cleaning to free disk space, the next selection is only made once the videos
+        of the previous selection were cleaned.
+
+        :type planner: SpacePlanner
+        :param planner: The space planner to select videos with, or None to select all videos that may be cleaned.
+        :type incremental: bool
+        :param incremental: (Optional) Leave finding the videos to ``clean()``, which only considers queued videos.
+            Defaults to ``False``.
+        :rtype: iterable
+        :return: Dicts of the number of videos to clean and their (filename, title, library id) tuples, by video type.
+        """
+        if planner is None:
+            selection = dict.fromkeys([self.MOVIES, self.MUSIC_VIDEOS, self.TVSHOWS])
+            if not incremental:
+                selection.update(self.find_expired_videos(self.enabled_video_types()))
+            return [selection]
+
+        # Rank all watched videos, not just the queued ones, so the best candidates are cleaned first
+        self.plan(planner)
+        return (dict((video_type, (len(videos), videos)) for video_type, videos in selection.items())
+                for selection in iter(planner.select, {}))
+
+    def preview(self):
+        """
+        Plan what a cleaning run would do right now, without cleaning anything. The plan is saved to the addon profile.
+
+        When disk space is low, the plan assumes all selected videos can be cleaned.
+
+        :rtype: CleaningPlan
+        :return: The plan of the cleaning run.
+        """
+        debug(u"Previewing the cleaning routine.")
+        snapshot()
+        self.metrics = RunMetrics()
+        self.directory_index = DirectoryIndex(self.metrics)
+        self.pruner = FolderPruner(get_setting(ignore_extensions), self.directory_index, self.metrics)
+        self.executor = Executor(get_setting(concurrent_operations), get_setting(concurrent_operations_per_share))
+
+        plan = CleaningPlan()
+        planner = self.space_planner()
+        if not get_setting(clean_when_low_disk_space) or planner is not None:
+            selection = next(iter(self.select_videos(planner)), {})
+            for video_type in [self.MOVIES, self.MUSIC_VIDEOS, self.TVSHOWS]:
+                if selection.get(video_type) and get_setting(self.cleaning_settings[video_type]):
+                    for page in self.__pages(selection[video_type][1]):
+                        self.create_plan(video_type, page, plan, detailed=True)
+
+        plan.save()
+        return plan
+
+    def enabled_video_types(self):
+        """
+        :rtype: list
+        :return: The video types the user wants to clean.
+        """
+        settings = snapshot()
+        return [video_type for video_type in [self.MOVIES, self.MUSIC_VIDEOS, self.TVSHOWS]
+                if settings[self.cleaning_settings[video_type]]]
+
+    def plan(self, planner):
+        """
+        Add all watched videos of the types the user wants to clean to the candidates of a planner.
+
+        :type planner: SpacePlanner
+        :param planner: The planner to add the videos to.
+        """
+        settings = snapshot()
+        all_parts = []
+        for video_type, (_, videos) in self.find_expired_videos(self.enabled_video_types(), planner.PROPERTIES).items():
+            for video in videos:
+                parts = self.unstack(video[0])
+                volume = self.volumes.volume_of(parts[0]) if settings[check_all_volumes] else None
+                planner.add(video_type, video, parts, volume)
+                all_parts.extend(parts)
+
+        if planner.priority == planner.LARGEST_FIRST:
+            # Ranking needs the size of every video
+            executor = Executor(settings[concurrent_operations], settings[concurrent_operations_per_share])
+            self.directory_index.prefetch(all_parts, executor, self.__is_canceled)
+
     def summarize(self, details):
         """
         Create a summary from the cleaning results.
@@ -274,7 +681,7 @@ class Cleaner(object):
         # strip the comma and space from the last iteration and add the localized suffix
         return u"{0}{1}".format(summary.rstrip(u", "), translate(32518)) if summary else u""
 
-    def get_expired_videos(self, option):
+    def get_expired_videos(self, option, extra_properties=()):
         """
         Find videos in the Kodi library that have been watched.
 
@@ -282,96 +689,600 @@ class Cleaner(object):
 
         :type option: unicode
         :param option: The type of videos to find (one of the globals MOVIES, MUSIC_VIDEOS or TVSHOWS).
+        :type extra_properties: list
+        :param extra_properties: (Optional) Additional properties to include for each video.
+        :rtype: (int, generator)
+        :return: The total number of expired videos, and a generator yielding each expired video as a tuple of the
+            extra attributes specific to the video type and its library id, followed by any additional properties.
+        """
+        return self.find_expired_videos([option], extra_properties)[option]
+
+    def find_expired_videos(self, options, extra_properties=()):
+        """
+        Find videos of several types in the Kodi library that have been watched.
+
+        Respects any other conditions user enables in the addon's settings.
+
+        Videos are requested from Kodi in pages of ``PAGE_SIZE`` videos. The first page of every type is requested in a
+        single batch before this method returns. While the videos of one page are being processed, the next page of
+        that type is already fetched in the background.
+
+        :type options: list
+        :param options: The types of videos to find (any of the globals MOVIES, MUSIC_VIDEOS or TVSHOWS).
+        :type extra_properties: list
+        :param extra_properties: (Optional) Additional properties to include for each video.
+        :rtype: dict
+        :return: For each type, the total number of expired videos and a generator yielding each expired video as a
+            tuple of the extra attributes specific to the video type and its library id, followed by any additional
+            properties.
+        """
+        if not options:
+            return {}
+        if get_setting(remember_library) and set(extra_properties) <= set(SpacePlanner.PROPERTIES):
+            return self.find_cataloged_videos(options, extra_properties)
+
+        requests = [self.build_request(option, extra_properties) for option in options]
+        batch = [dict(request, id=i, params=dict(request[u"params"], limits={u"start": 0, u"end": self.PAGE_SIZE}))
+                 for i, request in enumerate(requests)]
+        results = self.send_batch(batch)
+
+        expired_videos = {}
+        for i, (option, request) in enumerate(zip(options, requests)):
+            first_page = self.parse_expired_videos_page(results.get(i, results.get(None, {})), option, request,
+                                                        extra_properties)
+            if first_page is None:
+                expired_videos[option] = 0, iter([])
+            else:
+                videos, total = first_page
+                debug(u"Found {0:d} watched {1} matching your conditions".format(total, option))
+                expired_videos[option] = total, self.__iterate_pages(request, option, videos, total, extra_properties)
+        return expired_videos
+
+    def find_cataloged_videos(self, options, extra_properties=()):
+        """
+        Find videos of several types in the Kodi library that have been watched, using the library catalog to only
+        request the videos that were played or added since the previous run. The first page of every type is requested
+        in a single batch.
+
+        The conditions the user enabled in the addon's settings are evaluated locally, and the verdict on each video is
+        stored in the catalog. The requested videos are merged into the catalog and yielded a page at a time. Videos
+        that matched in an earlier run, or whose file was missing, are read from the catalog a page at a time
+        afterwards, and requested again by id to make sure they were not marked as unwatched or removed from the library
+        since.
+
+        :type options: list
+        :param options: The types of videos to find (any of the globals MOVIES, MUSIC_VIDEOS or TVSHOWS).
+        :type extra_properties: list
+        :param extra_properties: (Optional) Additional properties to include for each video. Must be part of
+            ``SpacePlanner.PROPERTIES``.
+        :rtype: dict
+        :return: For each type, an estimate of the number of expired videos and a generator yielding each expired video
+            as a tuple of the extra attributes specific to the video type and its library id, followed by any
+            additional properties.
+        """
+        settings = snapshot()
+        exclusions = sorted(self.exclusions.rules()) if settings[exclusion_enabled] else []
+        queries = {}
+        for option in options:
+            plan = self.get_rule_plan(option, local=True)
+            properties = sorted(set(self.properties[option] + SpacePlanner.PROPERTIES + plan.properties +
+                                    [u"playcount", u"lastplayed", u"dateadded"]))
+            # Excluded videos are remembered, so the catalog is rebuilt when the exclusions change as well
+            key = PlanCache.settings_hash(dict([(s, settings[s]) for s in self.catalog_settings],
+                                               catalog_properties=properties, catalog_exclusions=exclusions))
+            watched = {u"field": u"playcount", u"operator": u"greaterthan", u"value": u"0"}
+            if self.catalog.is_stale(option, key):
+                self.catalog.reset(option, key)
+                params = {u"properties": properties, u"filter": watched}
+            else:
+                watermark = self.catalog.state(option).watermark
+                debug(u"Requesting {type} played or added after {watermark}.", type=option, watermark=watermark)
+                params = {u"properties": properties, u"filter": {u"and": [watched, {u"or": [
+                    {u"field": u"lastplayed", u"operator": u"after", u"value": watermark},
+                    {u"field": u"dateadded", u"operator": u"after", u"value": watermark}
+                ]}]}}
+            queries[option] = plan, properties, params
+
+        results = self.send_batch([{
+            u"jsonrpc": u"2.0",
+            u"method": self.methods[option],
+            u"params": dict(queries[option][2], limits={u"start": 0, u"end": self.PAGE_SIZE}),
+            u"id": i
+        } for i, option in enumerate(options)])
+
+        expired_videos = {}
+        for i, option in enumerate(options):
+            plan, properties, params = queries[option]
+            first_page = results.get(i, results.get(None, {}))
+            self.__reevaluate_catalog(option, plan)
+            requested = first_page.get(u"result", {}).get(u"limits", {}).get(u"total", 0)
+            cached = self.catalog.count(option, LibraryCatalog.RECHECKED)
+            debug(u"Requesting {requested:d} watched {type}, and checking {cached:d} matching {type} from the catalog.",
+                  requested=requested, cached=cached, type=option)
+            expired_videos[option] = requested + cached, self.__cataloged_videos(option, plan, properties, params,
+                                                                                 first_page, extra_properties)
+        return expired_videos
+
+    def __reevaluate_catalog(self, option, plan):
+        """
+        Evaluate the videos in the library catalog that will only match once they expire again. Their verdict can only
+        change as time passes, so they are not requested from Kodi.
+
+        :type option: unicode
+        :param option: The type of the videos (one of the globals MOVIES, MUSIC_VIDEOS or TVSHOWS).
+        :type plan: RulePlan
+        :param plan: The plan to evaluate the rule with.
+        """
+        for page in self.catalog.pages(option, [LibraryCatalog.LATER], self.PAGE_SIZE):
+            changed = {}
+            for library_id, _, details in page:
+                verdict = self.__verdict(plan, details)
+                if verdict != LibraryCatalog.LATER:
+                    changed.setdefault(verdict, []).append(library_id)
+            for verdict, ids in changed.items():
+                self.catalog.judge(option, ids, verdict)
+
+    def __cataloged_videos(self, option, plan, properties, params, first_page, extra_properties=()):
+        """
+        Yield the expired videos a page at a time. The videos Kodi returns are merged into the library catalog first.
+        Once all of them were merged, the watermark of the catalog is moved forward and the videos that matched in an
+        earlier run, or whose file was missing, are requested again by id.
+
+        :type option: unicode
+        :param option: The type of the videos (one of the globals MOVIES, MUSIC_VIDEOS or TVSHOWS).
+        :type plan: RulePlan
+        :param plan: The plan to evaluate the rule with.
+        :type properties: list
+        :param properties: The properties to request for each video.
+        :type params: dict
+        :param params: The parameters of the request, without any paging limits.
+        :type first_page: dict
+        :param first_page: The parsed JSON-RPC response to the request for the first page.
+        :type extra_properties: list
+        :param extra_properties: (Optional) Additional properties to include for each video.
+        :rtype: generator
+        :return: Each expired video as a tuple of the extra attributes specific to the video type and its library id,
+            followed by any additional properties.
+        """
+        requested, latest = set(), u""
+        for page in self.__library_pages(option, params, first_page):
+            if page is None:
+                latest = None  # Try again from the same watermark in the next run
+                break
+            videos = [(video[self.id_fields[option]], self.__verdict(plan, video), video) for video in page]
+            self.catalog.merge(option, videos)
+            requested.update(library_id for library_id, _, _ in videos)
+            latest = max([latest] + [max(video[u"lastplayed"], video[u"dateadded"]) for video in page])
+            for video in self.__expired(option, [(library_id, details) for library_id, verdict, details in videos
+                                                 if verdict == LibraryCatalog.MATCH], extra_properties):
+                yield video
+        self.catalog.advance(option, latest)
+
+        for page in self.catalog.pages(option, LibraryCatalog.RECHECKED, self.PAGE_SIZE):
+            cached = [library_id for library_id, _, _ in page if library_id not in requested]
+            if not cached:
+                continue
+            debug(u"Checking {amount:d} {type} from the catalog again.", amount=len(cached), type=option)
+            current = self.get_video_details(option, cached, properties)
+            self.catalog.forget(option, [library_id for library_id in current if current[library_id] is None])
+            verdicts = dict((library_id, self.__verdict(plan, details))
+                            for library_id, details in current.items() if details is not None)
+            self.catalog.merge(option, [(library_id, verdict, current[library_id])
+                                        for library_id, verdict in verdicts.items()])
+            for video in self.__expired(option, [(library_id, current[library_id]) for library_id in cached
+                                                 if verdicts.get(library_id) == LibraryCatalog.MATCH],
+                                        extra_properties):
+                yield video
+
+    def __expired(self, option, videos, extra_properties=()):
+        """
+        Leave out the videos that are excluded, and remember them as such in the library catalog, so they are not
+        requested again in later runs.
+
+        :type option: unicode
+        :param option: The type of the videos (one of the globals MOVIES, MUSIC_VIDEOS or TVSHOWS).
+        :type videos: list
+        :param videos: Tuples of the library id and the properties of each video that matches the rule.
+        :type extra_properties: list
+        :param extra_properties: (Optional) Additional properties to include for each video.
         :rtype: list
-        :return: A list of expired videos, along with a number of extra attributes specific to the video type.
+        :return: Each expired video as a tuple of the extra attributes specific to the video type and its library id,
+            followed by any additional properties.
+        """
+        videos = [tuple([details[p] for p in self.properties[option]] + [library_id] +
+                        [details[p] for p in extra_properties]) for library_id, details in videos]
+        remaining = self.exclude(videos)
+        self.catalog.judge(option, [video[len(self.properties[option])] for video in set(videos) - set(remaining)],
+                           LibraryCatalog.EXCLUDED)
+        return remaining
+
+    @staticmethod
+    def __verdict(plan, video):
         """
+        :type plan: RulePlan
+        :param plan: The plan to evaluate the rule with.
+        :type video: dict
+        :param video: The properties of the video.
+        :rtype: int
+        :return: The verdict on the video, as stored in the library catalog.
+        """
+        matches, may_match_later = plan.check(video)
+        if matches:
+            return LibraryCatalog.MATCH
+        return LibraryCatalog.LATER if may_match_later else LibraryCatalog.NO_MATCH
+
+    def __library_pages(self, option, params, first_page):
+        """
+        Request videos from Kodi in pages of ``PAGE_SIZE`` videos, starting with the already requested first page.
+
+        :type option: unicode
+        :param option: The type of videos to request (one of the globals MOVIES, MUSIC_VIDEOS or TVSHOWS).
+        :type params: dict
+        :param params: The parameters of the request, without any paging limits.
+        :type first_page: dict
+        :param first_page: The parsed JSON-RPC response to the request for the first page.
+        :rtype: generator
+        :return: Lists of the properties of the videos on each page, or None if errors occurred.
+        """
+        start, result = 0, first_page
+        while True:
+            if u"error" in result or u"result" not in result:
+                debug(u"An error occurred. {error}", xbmc.LOGERROR, error=result.get(u"error"))
+                self.metrics.count(u"errors")
+                yield None
+                return
+            yield result[u"result"].get(option, [])
+
+            start += self.PAGE_SIZE
+            if start >= result[u"result"][u"limits"][u"total"]:
+                return
+            results = self.send_batch([{
+                u"jsonrpc": u"2.0",
+                u"method": self.methods[option],
+                u"params": dict(params, limits={u"start": start, u"end": start + self.PAGE_SIZE}),
+                u"id": 1
+            }])
+            result = results.get(1, results.get(None, {}))
+
+    def build_request(self, option, extra_properties=()):
+        """
+        Build the JSON-RPC request to find expired videos of the given type, without any paging limits.
 
-        # A non-exhaustive list of pre-defined filters to use during JSON-RPC requests
+        :type option: unicode
+        :param option: The type of videos to find (one of the globals MOVIES, MUSIC_VIDEOS or TVSHOWS).
+        :type extra_properties: list
+        :param extra_properties: (Optional) Additional properties to request for each video.
+        :rtype: dict
+        :return: The JSON-RPC request.
+        """
+        plan = self.get_rule_plan(option)
+        properties = self.properties[option] + list(extra_properties)
+        params = {u"properties": properties + [p for p in plan.properties if p not in properties]}
+        if plan.filter is not None:
+            params[u"filter"] = plan.filter
+        return {u"jsonrpc": u"2.0", u"method": self.methods[option], u"params": params, u"id": 1}
+
+    def get_rule_plan(self, option, local=False):
+        """
+        Get the plan to evaluate the rule for expired videos of the given type. Plans are only compiled once for each
+        version of the settings.
+
+        :type option: unicode
+        :param option: The type of videos to find (one of the globals MOVIES, MUSIC_VIDEOS or TVSHOWS).
+        :type local: bool
+        :param local: (Optional) Evaluate the entire rule locally, e.g. for videos requested by id. Defaults to
+            ``False``, which lets Kodi evaluate as much of the rule as it can.
+        :rtype: RulePlan
+        :return: The plan to evaluate the rule.
+        """
+        fields = () if local else self.supported_filter_fields[option]
+        return self.rule_plans.get(snapshot(), (option, local), lambda: compile_rule(self.build_rule(option), fields))
+
+    def build_rule(self, option):
+        """
+        Build the rule expired videos of the given type must satisfy from the current settings. Exclusions are not part
+        of this rule, but are applied to the results afterwards (see ``exclude()``). Which parts of the rule Kodi
+        evaluates is decided by ``compile_rule()``.
+
+        :type option: unicode
+        :param option: The type of videos to find (one of the globals MOVIES, MUSIC_VIDEOS or TVSHOWS).
+        :rtype: And
+        :return: The rule.
+        """
         # These are possible conditions that must be met before a video can be deleted
-        by_playcount = {u"field": u"playcount", u"operator": u"greaterthan", u"value": u"0"}
-        by_date_played = {u"field": u"lastplayed", u"operator": u"notinthelast", u"value": u"{0:f}".format(get_setting(expire_after))}
-        by_minimum_rating = {u"field": u"rating", u"operator": u"lessthan", u"value": u"{0:f}".format(get_setting(minimum_rating))}
-        by_no_rating = {u"field": u"rating", u"operator": u"isnot", u"value": u"0"}
-        by_progress = {u"field": u"inprogress", u"operator": u"false", u"value": u""}
-        by_exclusion1 = {u"field": u"path", u"operator": u"doesnotcontain", u"value": get_setting(exclusion1)}
-        by_exclusion2 = {u"field": u"path", u"operator": u"doesnotcontain", u"value": get_setting(exclusion2)}
-        by_exclusion3 = {u"field": u"path", u"operator": u"doesnotcontain", u"value": get_setting(exclusion3)}
-        by_exclusion4 = {u"field": u"path", u"operator": u"doesnotcontain", u"value": get_setting(exclusion4)}
-        by_exclusion5 = {u"field": u"path", u"operator": u"doesnotcontain", u"value": get_setting(exclusion5)}
-
-        # link settings and filters together
-        settings_and_filters = [
+        by_playcount = Condition(u"playcount", u"greaterthan", u"0")
+        by_date_played = Condition(u"lastplayed", u"notinthelast", u"{0:f}".format(get_setting(expire_after)))
+        by_minimum_rating = Condition(u"rating", u"lessthan", u"{0:f}".format(get_setting(minimum_rating)))
+        by_no_rating = Condition(u"rating", u"isnot", u"0")
+        by_progress = Condition(u"inprogress", u"false")
+
+        # link settings and conditions together
+        settings_and_conditions = [
             (get_setting(enable_expiration), by_date_played),
             (get_setting(clean_when_low_rated), by_minimum_rating),
-            (get_setting(not_in_progress), by_progress),
-            (get_setting(exclusion_enabled) and get_setting(exclusion1) is not u"", by_exclusion1),
-            (get_setting(exclusion_enabled) and get_setting(exclusion2) is not u"", by_exclusion2),
-            (get_setting(exclusion_enabled) and get_setting(exclusion3) is not u"", by_exclusion3),
-            (get_setting(exclusion_enabled) and get_setting(exclusion4) is not u"", by_exclusion4),
-            (get_setting(exclusion_enabled) and get_setting(exclusion5) is not u"", by_exclusion5)
+            (get_setting(not_in_progress), by_progress)
         ]
 
         # Only check not rated videos if checking for video ratings at all
         if get_setting(clean_when_low_rated):
-            settings_and_filters.append((get_setting(ignore_no_rating), by_no_rating))
+            settings_and_conditions.append((get_setting(ignore_no_rating), by_no_rating))
 
-        enabled_filters = [by_playcount]
-        for s, f in settings_and_filters:
-            if s and f[u"field"] in self.supported_filter_fields[option]:
-                enabled_filters.append(f)
+        # Conditions Kodi cannot filter this type of video on, e.g. the rating of music videos, are evaluated locally
+        rule = And(by_playcount, *[c for s, c in settings_and_conditions if s])
+        debug(u"[{method}] Rule enabled: {rule}", method=self.methods[option], rule=rule)
+        return rule
 
-        debug(u"[{0}] Filters enabled: {1}".format(self.methods[option], enabled_filters))
-
-        filters = {u"and": enabled_filters}
+    def get_expired_videos_page(self, request, option, start, extra_properties=()):
+        """
+        Request a single page of expired videos from Kodi.
 
-        request = {
-            u"jsonrpc": u"2.0",
-            u"method": self.methods[option],
-            u"params": {
-                u"properties": self.properties[option],
-                u"filter": filters
-            },
-            u"id": 1
-        }
-
-        rpc_cmd = json.dumps(request)
-        response = xbmc.executeJSONRPC(rpc_cmd)
-        debug(u"[{0}] Response: {1}".format(self.methods[option], response.decode("utf-8")))
-        result = json.loads(response)
+        :type request: dict
+        :param request: The JSON-RPC request as created by ``build_request()``.
+        :type option: unicode
+        :param option: The type of videos to find (one of the globals MOVIES, MUSIC_VIDEOS or TVSHOWS).
+        :type start: int
+        :param start: The index of the first video on this page.
+        :type extra_properties: list
+        :param extra_properties: (Optional) The additional properties to include for each video.
+        :rtype: (list, int)
+        :return: The expired videos on this page along with the total number of expired videos, or None if errors
+            occurred.
+        """
+        params = dict(request[u"params"], limits={u"start": start, u"end": start + self.PAGE_SIZE})
+        rpc_cmd = json.dumps(dict(request, params=params))
+        with self.metrics.span(u"jsonrpc.query"):
+            response = xbmc.executeJSONRPC(rpc_cmd)
+        debug(u"[{method}] Received {size:d} bytes: {response}", method=self.methods[option], size=len(response),
+              response=response)
+        with self.metrics.span(u"jsonrpc.parse"):
+            result = json.loads(response)
+        del response
+
+        return self.parse_expired_videos_page(result, option, request, extra_properties)
+
+    def parse_expired_videos_page(self, result, option, request, extra_properties=()):
+        """
+        Extract the expired videos from the response to a request for a single page.
 
+        :type result: dict
+        :param result: The parsed JSON-RPC response.
+        :type option: unicode
+        :param option: The type of videos that were requested (one of the globals MOVIES, MUSIC_VIDEOS or TVSHOWS).
+        :type request: dict
+        :param request: The JSON-RPC request as created by ``build_request()``.
+        :type extra_properties: list
+        :param extra_properties: (Optional) The additional properties to include for each video.
+        :rtype: (list, int)
+        :return: The expired videos on this page along with the total number of videos Kodi found, or None if errors
+            occurred.
+        """
         # Check the results for errors
-        try:
-            error = result[u"error"]
-            debug(u"An error occurred. {0}".format(error))
+        if u"error" in result or u"result" not in result:
+            debug(u"An error occurred. {error}", xbmc.LOGERROR, error=result.get(u"error"))
+            self.metrics.count(u"errors")
             return None
-        except KeyError as ke:
-            if u"error" in ke:
-                pass  # no error
-            else:
-                raise
 
-        debug(u"Building list of expired videos")
-        expired_videos = []
         response = result[u"result"]
+        plan = self.get_rule_plan(option)
         try:
-            debug(u"Found {0:d} watched {1} matching your conditions".format(response[u"limits"][u"total"], option))
-            debug(u"JSON Response: {0}".format(response))
-            for video in response[option]:
-                # Gather all properties and add it to this video's information
-                temp = []
-                for p in self.properties[option]:
-                    temp.append(video[p])
-                expired_videos.append(temp)
+            total = response[u"limits"][u"total"]
+            # Gather all properties of each video on this page. Kodi always includes the id of each video.
+            videos = [tuple([video[p] for p in self.properties[option]] + [video[self.id_fields[option]]] +
+                            [video[p] for p in extra_properties])
+                      for video in response.get(option, []) if not plan.local or plan.matches(video)]
+            return self.exclude(videos), total
         except KeyError as ke:
-            if option in ke:
-                pass  # no expired videos found
+            debug(u"KeyError: {key} not found", xbmc.LOGWARNING, key=ke)
+            debug(u"{response}", xbmc.LOGWARNING, response=response)
+            raise
+
+    def __iterate_pages(self, request, option, videos, total, extra_properties=()):
+        """
+        Yield the expired videos of all pages, starting with the already fetched first page. The next page is fetched
+        in a separate thread while the current page is being consumed.
+
+        :type request: dict
+        :param request: The JSON-RPC request as created by ``build_request()``.
+        :type option: unicode
+        :param option: The type of videos to find (one of the globals MOVIES, MUSIC_VIDEOS or TVSHOWS).
+        :type videos: list
+        :param videos: The expired videos on the first page.
+        :type total: int
+        :param total: The total number of expired videos.
+        :type extra_properties: list
+        :param extra_properties: (Optional) The additional properties to include for each video.
+        :rtype: generator
+        :return: Each expired video as a tuple of its properties.
+        """
+        start = 0
+        while True:
+            start += self.PAGE_SIZE
+            next_page = {}
+            prefetch = None
+            if start < total:
+                debug(u"Fetching {type} starting at {start:d} in the background.", type=option, start=start)
+                prefetch = threading.Thread(target=lambda s=start: next_page.update(
+                    result=self.get_expired_videos_page(request, option, s, extra_properties)))
+                prefetch.daemon = True
+                prefetch.start()
+
+            for video in videos:
+                yield video
+
+            if prefetch is None:
+                break
+            prefetch.join()
+            if next_page.get(u"result") is None:
+                break
+            videos, _ = next_page[u"result"]
+
+    def remove_from_library(self, video_type, ids):
+        """
+        Remove cleaned videos from the Kodi library. TV shows that have no episodes left are removed as well. Unlike a
+        full library cleanup, this does not make Kodi check every file in the library.
+
+        :type video_type: unicode
+        :param video_type: The type of the videos (one of TVSHOWS, MOVIES, MUSIC_VIDEOS).
+        :type ids: list
+        :param ids: The library ids of the videos, e.g. their ``episodeid``.
+        :rtype: bool
+        :return: True if all videos were removed, False otherwise.
+        """
+        id_field = self.id_fields[video_type]
+        ids = [library_id for library_id in ids if library_id is not None]
+        debug(u"Removing {amount:d} {type} from the library.", amount=len(ids), type=video_type)
+
+        shows = set()
+        if video_type == self.TVSHOWS:
+            details = self.call_batch(self.detail_methods[video_type],
+                                      [{id_field: library_id, u"properties": [u"tvshowid"]} for library_id in ids])
+            shows = set(result[u"result"][self.details_fields[video_type]][u"tvshowid"] for result in details
+                        if u"result" in result)
+
+        results = self.call_batch(self.remove_methods[video_type], [{id_field: library_id} for library_id in ids])
+        failed = [library_id for library_id, result in zip(ids, results) if result.get(u"result") != u"OK"]
+        if failed:
+            debug(u"Could not remove {type} {ids} from the library.", xbmc.LOGWARNING, type=video_type, ids=failed)
+            self.metrics.count(u"errors", len(failed))
+
+        if shows:
+            shows = sorted(shows)
+            remaining = self.call_batch(u"VideoLibrary.GetEpisodes",
+                                        [{u"tvshowid": show, u"limits": {u"start": 0, u"end": 1}} for show in shows])
+            empty = [show for show, result in zip(shows, remaining)
+                     if result.get(u"result", {}).get(u"limits", {}).get(u"total") == 0]
+            debug(u"Removing TV shows {ids} without episodes from the library.", ids=empty)
+            self.call_batch(u"VideoLibrary.RemoveTVShow", [{u"tvshowid": show} for show in empty])
+
+        return not failed
+
+    def call_batch(self, method, params):
+        """
+        Call a JSON-RPC method for each set of parameters. The calls are sent to Kodi in batches of ``PAGE_SIZE``.
+
+        :type method: unicode
+        :param method: The JSON-RPC method to call, e.g. ``VideoLibrary.RemoveMovie``.
+        :type params: list
+        :param params: The parameters of each call.
+        :rtype: list
+        :return: The response to each call, in the same order as the parameters.
+        """
+        responses = []
+        for start in xrange(0, len(params), self.PAGE_SIZE):
+            batch = [{u"jsonrpc": u"2.0", u"method": method, u"params": p, u"id": start + i}
+                     for i, p in enumerate(params[start:start + self.PAGE_SIZE])]
+            results = self.send_batch(batch)
+            responses.extend(results.get(start + i, results.get(None, {})) for i in xrange(len(batch)))
+        return responses
+
+    def send_batch(self, batch):
+        """
+        Send JSON-RPC requests to Kodi in a single batch.
+
+        :type batch: list
+        :param batch: The requests, each with a unique id.
+        :rtype: dict
+        :return: The parsed response to each request by its id. If the entire batch failed, the error is stored under
+            ``None`` instead.
+        """
+        with self.metrics.span(u"jsonrpc.query"):
+            response = xbmc.executeJSONRPC(json.dumps(batch))
+        debug(u"[{methods}] Received {size:d} bytes: {response}",
+              methods=u", ".join(sorted(set(request[u"method"] for request in batch))), size=len(response),
+              response=response)
+        with self.metrics.span(u"jsonrpc.parse"):
+            results = json.loads(response)
+        del response
+
+        if isinstance(results, dict):
+            results = [results]  # A single error is returned for the entire batch if it could not be parsed
+        return dict((result.get(u"id"), result) for result in results)
+
+    def get_queued_videos(self, option):
+        """
+        Find videos in the candidate queue that have been watched. Used for incremental cleaning.
+
+        The details of all queued videos are requested from Kodi in batches, and the conditions the user enabled in
+        the addon's settings are evaluated locally. Videos that can never match without their watched state changing
+        again are removed from the queue, as are excluded videos. Videos that match stay queued until they were cleaned,
+        so they are tried again if cleaning them fails or is canceled. Videos that have not expired yet stay queued too.
+
+        :type option: unicode
+        :param option: The type of videos to find (one of the globals MOVIES, MUSIC_VIDEOS or TVSHOWS).
+        :rtype: (int, list)
+        :return: The number of expired videos, and a list of each expired video as a tuple of the extra attributes
+            specific to the video type and its library id.
+        """
+        ids = self.candidate_queue.get(option)
+        if not ids:
+            return 0, []
+
+        plan = self.get_rule_plan(option, local=True)
+        properties = sorted(set(self.properties[option] + plan.properties))
+        debug(u"Evaluating {amount:d} queued {type}.", amount=len(ids), type=option)
+
+        matching_videos, evaluated = [], []
+        for item_id, details in sorted(self.get_video_details(option, ids, properties).items()):
+            if details is None:
+                debug(u"Queued item {id} is no longer in the library.", id=item_id)
+                evaluated.append(item_id)
+                continue
+
+            matches, may_match_later = plan.check(details)
+            if matches:
+                matching_videos.append(tuple(details[p] for p in self.properties[option]) + (item_id,))
+            elif not may_match_later:
+                evaluated.append(item_id)  # Only a change in watched state can make this video match
+
+        expired_videos = self.exclude(matching_videos)
+        evaluated.extend(set(video[-1] for video in matching_videos) - set(video[-1] for video in expired_videos))
+        self.candidate_queue.remove(option, evaluated)
+        debug(u"Found {0:d} watched {1} in the queue matching your conditions".format(len(expired_videos), option))
+        return len(expired_videos), expired_videos
+
+    def get_video_details(self, option, ids, properties):
+        """
+        Request the details of videos from Kodi by their library ids, in batches of ``PAGE_SIZE`` videos.
+
+        :type option: unicode
+        :param option: The type of the videos (one of the globals MOVIES, MUSIC_VIDEOS or TVSHOWS).
+        :type ids: list
+        :param ids: The library ids of the videos.
+        :type properties: list
+        :param properties: The properties to request for each video.
+        :rtype: dict
+        :return: The properties of each video by its library id, or None for videos that are no longer in the library.
+            Videos Kodi did not answer for, e.g. because the entire batch failed, are left out.
+        """
+        responses = self.call_batch(self.detail_methods[option],
+                                    [{self.id_fields[option]: item_id, u"properties": properties} for item_id in ids])
+        videos = {}
+        for item_id, response in zip(ids, responses):
+            if u"result" in response:
+                videos[item_id] = response[u"result"].get(self.details_fields[option])
+            elif response.get(u"id") is not None:
+                videos[item_id] = None
             else:
-                debug(u"KeyError: {0} not found".format(ke), xbmc.LOGWARNING)
-                debug(u"{0}".format(response), xbmc.LOGWARNING)
-                raise
-        finally:
-            debug(u"Expired videos: {0}".format(expired_videos))
-            return expired_videos
+                self.metrics.count(u"errors")
+        return videos
+
+    def exclude(self, videos):
+        """
+        Leave out any videos that match the exclusion rules set up by the user, if exclusions are enabled.
+
+        :type videos: list
+        :param videos: The videos to check, as tuples starting with the (possibly stacked) path of each video.
+        :rtype: list
+        :return: The videos that are not excluded.
+        """
+        if not get_setting(exclusion_enabled) or not videos:
+            return videos
+
+        matcher = self.exclusions.matcher()
+        remaining = [video for video in videos if not any(matcher.matches(p) for p in self.unstack(video[0]))]
+        if len(remaining) < len(videos):
+            debug(u"Excluded {amount:d} videos.", amount=len(videos) - len(remaining))
+        return remaining
 
     def unstack(self, path):
         """Unstack path if it is a stacked movie. See http://kodi.wiki/view/File_stacking for more info.
@@ -382,10 +1293,10 @@ class Cleaner(object):
         :return: A list of paths that are part of the stack. If it is no stacked movie, a one-element list is returned.
         """
         if path.startswith(u"stack://"):
-            debug(u"Unstacking {0}.".format(path))
+            debug(u"Unstacking {path}.", path=path)
             return path.replace(u"stack://", u"").split(u" , ")
         else:
-            debug(u"Unstacking {0} is not needed.".format(path))
+            debug(u"Unstacking {path} is not needed.", path=path)
             return [path]
 
     def get_stack_bare_title(self, filenames):
@@ -418,123 +1329,22 @@ class Cleaner(object):
         :rtype: bool
         :return: True if (at least one) file was deleted successfully, False otherwise.
         """
-        debug(u"Attempting to delete {0}".format(location))
+        debug(u"Attempting to delete {path}", path=location)
 
         paths = self.unstack(location)
         success = []
 
         for p in paths:
-            if xbmcvfs.exists(p):
-                success.append(bool(xbmcvfs.delete(p)))
+            if self.directory_index.exists(p):
+                success.append(bool(self.metrics.call(u"delete", xbmcvfs.delete, p)))
+                if success[-1]:
+                    self.directory_index.remove(p)
             else:
-                debug(u"File {0} no longer exists.".format(p), xbmc.LOGERROR)
+                debug(u"File {path} no longer exists.", xbmc.LOGERROR, path=p)
                 success.append(False)
 
         return any(success)
 
-    def delete_empty_folders(self, location):
-        """
-        Delete the folder if it is empty. Presence of custom file extensions can be ignored while scanning.
-
-        To achieve this, edit the ignored file types setting in the addon settings.
-
-        Example:
-            success = delete_empty_folders(path)
-
-        :type location: unicode
-        :param location: The path to the folder to be deleted.
-        :rtype: bool
-        :return: True if the folder was deleted successfully, False otherwise.
-        """
-        if not get_setting(delete_folders):
-            debug(u"Deleting of empty folders is disabled.")
-            return False
-
-        folder = self.unstack(location)[0]  # Stacked paths should have the same parent, use any
-        debug(u"Checking if {0} is empty".format(folder))
-        ignored_file_types = [file_ext.strip() for file_ext in get_setting(ignore_extensions).split(u",")]
-        debug(u"Ignoring file types {0}".format(ignored_file_types))
-
-        subfolders, files = xbmcvfs.listdir(folder)
-        debug(u"Contents of {dir}:\nSubfolders: {sub}\nFiles: {files}".format(dir=folder, sub=subfolders, files=files))
-
-        empty = True
-        try:
-            for f in files:
-                _, ext = os.path.splitext(f)
-                if ext and ext not in ignored_file_types:  # ensure f is not a folder and its extension is not ignored
-                    debug(u"Found non-ignored file type {0}".format(ext))
-                    empty = False
-                    break
-        except OSError as oe:
-            debug(u"Error deriving file extension. Errno {0}".format(oe.errno), xbmc.LOGERROR)
-            empty = False
-
-        # Only delete directories if we found them to be empty (containing no files or filetypes we ignored)
-        if empty:
-            debug(u"Directory is empty and will be removed")
-            try:
-                # Recursively delete any subfolders
-                for f in subfolders:
-                    debug(u"Deleting file at {0}".format(os.path.join(folder, f)))
-                    self.delete_empty_folders(os.path.join(folder, f))
-
-                # Delete any files in the current folder
-                for f in files:
-                    debug(u"Deleting file at {0}".format(os.path.join(folder, f)))
-                    xbmcvfs.delete(os.path.join(folder, f))
-
-                # Finally delete the current folder
-                return xbmcvfs.rmdir(folder)
-            except OSError as oe:
-                debug(u"An exception occurred while deleting folders. Errno {0}".format(oe.errno), xbmc.LOGERROR)
-                return False
-        else:
-            debug(u"Directory is not empty and will not be removed")
-            return False
-
-    def clean_related_files(self, source, dest_folder=None):
-        """Clean files related to another file based on the user's preferences.
-
-        Related files are files that only differ by extension, or that share a prefix in case of stacked movies.
-
-        Examples of related files include NFO files, thumbnails, subtitles, fanart, etc.
-
-        :type source: unicode
-        :param source: Location of the file whose related files should be cleaned.
-        :type dest_folder: unicode
-        :param dest_folder: (Optional) The folder where related files should be moved to. Not needed when deleting.
-        """
-        if get_setting(clean_related):
-            debug(u"Cleaning related files.")
-
-            path_list = self.unstack(source)
-            path, name = os.path.split(path_list[0])  # Because stacked movies are in the same folder, only check one
-            if source.startswith(u"stack://"):
-                name = self.get_stack_bare_title(path_list)
-            else:
-                name, ext = os.path.splitext(name)
-
-            debug(u"Attempting to match related files in {0} with prefix {1}".format(path, name))
-            for extra_file in xbmcvfs.listdir(path)[1]:
-                extra_file = unicode(extra_file, encoding="utf-8")
-
-                if extra_file.startswith(name):
-                    debug(u"{0} starts with {1}.".format(extra_file, name))
-                    extra_file_path = os.path.join(path, extra_file)
-                    if get_setting(cleaning_type) == self.CLEANING_TYPE_DELETE:
-                        if extra_file_path not in path_list:
-                            debug(u"Deleting {0}.".format(extra_file_path))
-                            xbmcvfs.delete(extra_file_path)
-                    elif get_setting(cleaning_type) == self.CLEANING_TYPE_MOVE:
-                        new_extra_path = os.path.join(dest_folder, os.path.basename(extra_file))
-                        if new_extra_path not in path_list:
-                            debug(u"Moving {0} to {1}.".format(extra_file_path, new_extra_path))
-                            xbmcvfs.rename(extra_file_path, new_extra_path)
-            debug(u"Finished searching for related files.")
-        else:
-            debug(u"Cleaning of related files is disabled.")
-
     def move_file(self, source, dest_folder):
         """Move a file to a new destination. Will create destination if it does not exist.
 
@@ -546,68 +1356,108 @@ class Cleaner(object):
         :type dest_folder: unicode
         :param dest_folder: the destination path (absolute)
         :rtype: int
-        :return: 1 if (all stacked) files were moved, 0 if not, -1 if errors occurred
+        :return: 1 if (all stacked) files were moved, 0 if not, e.g. because copying was canceled, -1 if errors occurred
         """
         paths = self.unstack(source)
         files_moved_successfully = 0
         dest_folder = unicode(xbmc.makeLegalFilename(dest_folder), encoding="utf-8")
 
         for p in paths:
-            debug(u"Attempting to move {0} to {1}.".format(p, dest_folder))
-            if xbmcvfs.exists(p):
-                if not xbmcvfs.exists(dest_folder):
-                    if xbmcvfs.mkdirs(dest_folder):
-                        debug(u"Created destination {0}.".format(dest_folder))
+            debug(u"Attempting to move {source} to {dest}.", source=p, dest=dest_folder)
+            if self.directory_index.exists(p):
+                if not self.directory_index.exists(dest_folder):
+                    # The destination may have been created by another job in the meantime
+                    if (self.metrics.call(u"mkdirs", xbmcvfs.mkdirs, dest_folder) or
+                            self.metrics.call(u"exists", xbmcvfs.exists, dest_folder)):
+                        debug(u"Created destination {dest}.", dest=dest_folder)
+                        self.directory_index.forget(dest_folder)
                     else:
-                        debug(u"Destination {0} could not be created.".format(dest_folder), xbmc.LOGERROR)
+                        debug(u"Destination {dest} could not be created.", xbmc.LOGERROR, dest=dest_folder)
                         return -1
 
                 new_path = os.path.join(dest_folder, os.path.basename(p))
 
-                if xbmcvfs.exists(new_path):
+                size = self.directory_index.stat(p).size
+
+                if self.directory_index.contains(new_path):
                     debug(u"A file with the same name already exists in the holding folder. Checking file sizes.")
-                    existing_file = xbmcvfs.File(new_path)
-                    file_to_move = xbmcvfs.File(p)
-                    if file_to_move.size() > existing_file.size():
+                    existing_size = self.holding.size(new_path)
+                    if existing_size is None:
+                        existing_size = self.directory_index.stat(new_path).size
+                    if size > existing_size:
                         debug(u"This file is larger than the existing file. Replacing it with this one.")
-                        existing_file.close()
-                        file_to_move.close()
-                        if bool(xbmcvfs.delete(new_path) and bool(xbmcvfs.rename(p, new_path))):
+                        self.holding.make_room(new_path, size)
+                        if (self.metrics.call(u"delete", xbmcvfs.delete, new_path) and
+                                self.metrics.call(u"rename", xbmcvfs.rename, p, new_path)):
+                            self.holding.arrived(new_path, size)
+                            self.directory_index.remove(p)
+                            self.directory_index.add(new_path)
                             files_moved_successfully += 1
                         else:
+                            self.holding.left(new_path)
                             return -1
                     else:
                         debug(u"This file isn't larger than the existing file. Deleting it instead of moving.")
-                        existing_file.close()
-                        file_to_move.close()
-                        if bool(xbmcvfs.delete(p)):
+                        if bool(self.metrics.call(u"delete", xbmcvfs.delete, p)):
+                            self.directory_index.remove(p)
                             files_moved_successfully += 1
                         else:
                             return -1
                 else:
-                    debug(u"Moving {0} to {1}.".format(p, new_path))
-                    move_success = bool(xbmcvfs.rename(p, new_path))
+                    debug(u"Moving {source} to {dest}.", source=p, dest=new_path)
+                    self.holding.make_room(new_path, size)
+                    move_success = bool(self.metrics.call(u"rename", xbmcvfs.rename, p, new_path))
                     copy_success, delete_success = False, False
-                    if not move_success:
+                    if move_success:
+                        self.holding.arrived(new_path, size)
+                    else:
                         debug(u"Move failed, falling back to copy and delete.", xbmc.LOGWARNING)
-                        copy_success = bool(xbmcvfs.copy(p, new_path))
+                        self.metrics.count(u"retries")
+                        copy_result = self.metrics.call(u"copy", self.copy_file, p, new_path)
+                        if copy_result is CopyEngine.CANCELED:
+                            debug(u"Copying was canceled. Leaving {source} where it is.", source=p)
+                            self.holding.left(new_path)
+                            return 0
+                        copy_success = bool(copy_result)
                         if copy_success:
                             debug(u"Copied successfully, attempting delete of source file.")
-                            delete_success = bool(xbmcvfs.delete(p))
+                            self.holding.arrived(new_path, size)
+                            delete_success = bool(self.metrics.call(u"delete", xbmcvfs.delete, p))
                             if not delete_success:
                                 debug(u"Could not remove source file. Please remove the file manually.", xbmc.LOGWARNING)
                         else:
                             debug(u"Copying failed, please make sure you have appropriate permissions.", xbmc.LOGFATAL)
+                            self.holding.left(new_path)
                             return -1
 
                     if move_success or (copy_success and delete_success):
+                        self.directory_index.remove(p)
+                        self.directory_index.add(new_path)
                         files_moved_successfully += 1
 
             else:
-                debug(u"File {0} is no longer available.".format(p), xbmc.LOGWARNING)
+                debug(u"File {path} is no longer available.", xbmc.LOGWARNING, path=p)
 
         return 1 if len(paths) == files_moved_successfully else -1
 
+    def copy_file(self, source, destination):
+        """
+        Copy a file. Local files are copied by the CopyEngine, which is faster, can be canceled and resumes where it left
+        off. Other files are copied by Kodi.
+
+        :type source: unicode
+        :param source: The file to copy.
+        :type destination: unicode
+        :param destination: The path to copy the file to.
+        :rtype: bool
+        :return: True if the file was copied, ``CopyEngine.CANCELED`` if copying was canceled, False otherwise.
+        """
+        if CopyEngine.supports(source) and CopyEngine.supports(destination):
+            engine = CopyEngine(get_setting(move_bandwidth_limit) * 1024 ** 2, get_setting(move_verification),
+                                lambda: self.__is_canceled() or self.monitor.abortRequested())
+            return engine.copy(source, destination)
+        return xbmcvfs.copy(source, destination)
+
     def has_no_hard_links(self, filename):
         """
         Tests the provided filename for hard links and only returns True if the number of hard links is exactly 1.
@@ -619,8 +1469,9 @@ class Cleaner(object):
         """
         if get_setting(keep_hard_linked):
             debug(u"Making sure the number of hard links is exactly one.")
-            is_hard_linked = all(i == 1 for i in map(xbmcvfs.Stat.st_nlink, map(xbmcvfs.Stat, self.unstack(filename))))
-            debug(u"No hard links detected." if is_hard_linked else u"Hard links detected. Skipping.")
+            has_no_hard_links = all(self.directory_index.stat(p).nlink == 1 for p in self.unstack(filename))
+            debug(u"No hard links detected." if has_no_hard_links else u"Hard links detected. Skipping.")
+            return has_no_hard_links
         else:
             debug(u"Not checking for hard links.")
             return True
@@ -628,11 +1479,17 @@ class Cleaner(object):
 
 if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[1] == u"log":
+        from viewer import LogViewerDialog
         win = LogViewerDialog("JanitorLogViewer.xml", ADDON.getAddonInfo(u"path"))
         win.doModal()
         del win
     elif len(sys.argv) > 1 and sys.argv[1] == u"reset":
+        from reset_exclusions import reset_exclusions
         reset_exclusions()
+    elif len(sys.argv) > 1 and sys.argv[1] == u"exclusions":
+        manage_exclusions()
+    elif len(sys.argv) > 1 and sys.argv[1] == u"preview":
+        xbmcgui.Dialog().textviewer(translate(32633), Cleaner().preview().describe())
     else:
         cleaner = Cleaner()
         if get_setting(default_action) == cleaner.DEFAULT_ACTION_LOG:
@@ -0,0 +1,284 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import re
+import threading
+from collections import deque
+from fnmatch import translate as glob_to_regex
+
+import xbmc
+from utils import ADDON, ADDON_PROFILE, debug, translate
+from settings import *
+from xbmcgui import Dialog
+
+PREFIX = u"prefix"
+SUBSTRING = u"substring"
+GLOB = u"glob"
+
+# The settings that held exclusions before they were stored in the addon profile
+LEGACY_SETTINGS = [exclusion1, exclusion2, exclusion3, exclusion4, exclusion5]
+
+
+def normalize(path):
+    """
+    Bring a path into the form that exclusion rules are matched against: lowercase, with forward slashes only and
+    without credentials.
+
+    :type path: unicode
+    :param path: The path to normalize.
+    :rtype: unicode
+    :return: The normalized path.
+    """
+    path = re.sub(u"^([a-z0-9]+://)[^/@]+@", u"\\1", path, flags=re.I | re.U)
+    return path.replace(u"\\", u"/").lower()
+
+
+class ExclusionMatcher(object):
+    """
+    The ExclusionMatcher class tests paths against many exclusion rules at once.
+
+    All rules are compiled into a single Aho-Corasick automaton, so a path is scanned only once, no matter how many
+    rules there are. Prefix and substring rules are matched by the automaton directly. Glob rules are looked up by the
+    longest fixed part of their pattern, and only matched with a regular expression if that part occurs in the path.
+
+    Rules are matched against the full path of a file. Matching is case-insensitive, and ignores the direction of
+    slashes and any credentials in network paths.
+
+    *Example*
+      ``ExclusionMatcher([(PREFIX, u"/media/keep/"), (GLOB, u"*/sample/*")]).matches(u"/media/keep/movie.mkv")``
+    """
+
+    def __init__(self, rules):
+        self.__goto = [{}]
+        self.__fail = [0]
+        self.__output = [[]]
+        self.__globs = []
+        self.__unanchored_globs = []
+
+        for rule_type, pattern in rules:
+            pattern = normalize(pattern)
+            if not pattern:
+                continue
+            if rule_type == GLOB:
+                regex = re.compile(glob_to_regex(pattern), flags=re.U)
+                fragment = max(re.split(u"[*?]|\\[[^\\]]*\\]", pattern), key=len)
+                if fragment:
+                    self.__insert(fragment, (GLOB, len(self.__globs)))
+                    self.__globs.append(regex)
+                else:
+                    self.__unanchored_globs.append(regex)
+            elif rule_type == PREFIX:
+                if not pattern.endswith(u"/"):
+                    pattern += u"/"  # Do not match other folders that merely start with the same name
+                self.__insert(pattern, (PREFIX, len(pattern)))
+            else:
+                self.__insert(pattern, (SUBSTRING, None))
+        self.__link()
+
+    def __insert(self, pattern, output):
+        state = 0
+        for char in pattern:
+            if char not in self.__goto[state]:
+                self.__goto.append({})
+                self.__fail.append(0)
+                self.__output.append([])
+                self.__goto[state][char] = len(self.__goto) - 1
+            state = self.__goto[state][char]
+        self.__output[state].append(output)
+
+    def __link(self):
+        """
+        Compute the failure links of the automaton with a breadth-first traversal of the trie.
+        """
+        queue = deque(self.__goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.__goto[state].iteritems():
+                queue.append(child)
+                fallback = self.__fail[state]
+                while fallback and char not in self.__goto[fallback]:
+                    fallback = self.__fail[fallback]
+                self.__fail[child] = self.__goto[fallback].get(char, 0)
+                self.__output[child].extend(self.__output[self.__fail[child]])
+
+    def matches(self, path):
+        """
+        :type path: unicode
+        :param path: The path of the file to test.
+        :rtype: bool
+        :return: True if any rule matches the path, False otherwise.
+        """
+        text = normalize(path)
+        goto, fail, output = self.__goto, self.__fail, self.__output
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for rule_type, value in output[state]:
+                if rule_type == SUBSTRING:
+                    return True
+                elif rule_type == PREFIX:
+                    if i + 1 == value:
+                        return True
+                elif self.__globs[value].match(text):
+                    return True
+        return any(regex.match(text) for regex in self.__unanchored_globs)
+
+
+class ExclusionList(object):
+    """
+    The ExclusionList class manages the exclusion rules set up by the user. There is no limit to the number of rules.
+
+    Each rule consists of a type (``PREFIX``, ``SUBSTRING`` or ``GLOB``) and a pattern. The rules are saved in the addon
+    profile. Exclusions set up in the addon settings by earlier versions are converted to substring rules once.
+
+    *Example*
+      ``ExclusionList().matcher().matches(path)``
+    """
+
+    def __init__(self):
+        self.path = os.path.join(ADDON_PROFILE, "exclusions.json")
+        self.__lock = threading.Lock()
+        self.__matcher = None
+        self.__modified = None
+
+    def rules(self):
+        """
+        :rtype: list
+        :return: All exclusion rules as (type, pattern) tuples.
+        """
+        with self.__lock:
+            return self.__load()
+
+    def __load(self):
+        if not os.path.exists(self.path):
+            return self.__migrate()
+        try:
+            with open(self.path) as f:
+                return [(rule[u"type"], rule[u"pattern"]) for rule in json.load(f)]
+        except (IOError, OSError, ValueError, KeyError, TypeError) as err:
+            debug(u"Could not load the exclusions: {error}", xbmc.LOGERROR, error=err)
+            return []
+
+    def __migrate(self):
+        rules = [(SUBSTRING, get_setting(setting)) for setting in LEGACY_SETTINGS if get_setting(setting)]
+        if rules:
+            debug(u"Converting {amount:d} exclusions from the addon settings.", amount=len(rules))
+            self.__save(rules)
+            for setting in LEGACY_SETTINGS:
+                ADDON.setSetting(id=setting, value="")
+        return rules
+
+    def __save(self, rules):
+        try:
+            if not os.path.isdir(ADDON_PROFILE):
+                os.makedirs(ADDON_PROFILE)
+            with open(self.path + ".tmp", "w") as f:
+                json.dump([{u"type": rule_type, u"pattern": pattern} for rule_type, pattern in rules], f, indent=1)
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            os.rename(self.path + ".tmp", self.path)
+        except (IOError, OSError) as err:
+            debug(u"Could not save the exclusions: {error}", xbmc.LOGERROR, error=err)
+
+    def add(self, rule_type, pattern):
+        """
+        Add a rule, unless it already exists.
+
+        :type rule_type: unicode
+        :param rule_type: The type of rule (one of PREFIX, SUBSTRING or GLOB).
+        :type pattern: unicode
+        :param pattern: The path, text or pattern to exclude.
+        """
+        with self.__lock:
+            rules = self.__load()
+            if (rule_type, pattern) not in rules:
+                rules.append((rule_type, pattern))
+                self.__save(rules)
+
+    def remove(self, rule):
+        """
+        Remove a rule.
+
+        :type rule: (unicode, unicode)
+        :param rule: The type and pattern of the rule to remove.
+        """
+        with self.__lock:
+            rules = self.__load()
+            if rule in rules:
+                rules.remove(rule)
+                self.__save(rules)
+
+    def clear(self):
+        """
+        Remove all rules, including any left in the addon settings by earlier versions.
+        """
+        with self.__lock:
+            self.__save([])
+            for setting in LEGACY_SETTINGS:
+                ADDON.setSetting(id=setting, value="")
+
+    def __last_modified(self):
+        try:
+            st = os.stat(self.path)
+            return st.st_mtime, st.st_size
+        except OSError:
+            return None
+
+    def matcher(self):
+        """
+        Get a matcher for all rules. The rules are only compiled again if they were changed since the last call.
+
+        :rtype: ExclusionMatcher
+        :return: The compiled rules.
+        """
+        with self.__lock:
+            modified = self.__last_modified()
+            if self.__matcher is None or modified != self.__modified:
+                rules = self.__load()
+                modified = self.__last_modified()
+                debug(u"Compiling {amount:d} exclusion rules.", amount=len(rules))
+                self.__matcher = ExclusionMatcher(rules)
+                self.__modified = modified
+            return self.__matcher
+
+
+def describe(rule):
+    """
+    :type rule: (unicode, unicode)
+    :param rule: The type and pattern of a rule.
+    :rtype: unicode
+    :return: A (localized) description of the rule to show in a list.
+    """
+    rule_type, pattern = rule
+    return u"{type}: {pattern}".format(type=translate({PREFIX: 32412, SUBSTRING: 32413, GLOB: 32414}[rule_type]),
+                                      pattern=pattern)
+
+
+def manage_exclusions():
+    """
+    Let the user add and remove exclusion rules through a series of dialogs.
+    """
+    exclusions = ExclusionList()
+    while True:
+        rules = exclusions.rules()
+        choice = Dialog().select(translate(32406), [translate(32407)] + [describe(rule) for rule in rules])
+        if choice < 0:
+            return
+        elif choice == 0:
+            rule_type = Dialog().select(translate(32407), map(translate, (32408, 32409, 32410)))
+            if rule_type == 0:
+                pattern = Dialog().browse(0, translate(32408), "files")
+            elif rule_type > 0:
+                pattern = Dialog().input(translate(32409 if rule_type == 1 else 32410))
+            else:
+                continue
+
+            if pattern:
+                pattern = pattern if isinstance(pattern, unicode) else unicode(pattern, encoding="utf-8")
+                exclusions.add([PREFIX, SUBSTRING, GLOB][rule_type], pattern)
+        elif Dialog().yesno(translate(32406), translate(32411), describe(rules[choice - 1])):
+            exclusions.remove(rules[choice - 1])
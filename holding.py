@@ -0,0 +1,209 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import threading
+import time
+
+import xbmc
+import xbmcvfs
+from metrics import RunMetrics
+from utils import ADDON_PROFILE, debug, get_disk_usage
+from settings import *
+from vfs import DirectoryIndex
+
+
+class HoldingFolder(object):
+    """
+    The HoldingFolder class manages the holding folder as a cache of limited size.
+
+    An index of all files in the holding folder, with their sizes and the time they arrived, is kept in the addon
+    profile. It is built by scanning the holding folder once, and rebuilt every ``RESCAN_INTERVAL`` seconds to pick up
+    any changes made outside of the addon. Afterwards it is kept up to date as files are moved in or evicted.
+
+    Room is reserved for a file before it is moved, so concurrent moves cannot claim the same space. The file is only
+    added to the index once it arrived, so a failed move does not leave an entry behind.
+
+    The size of the holding folder can be limited to a number of bytes and to a percentage of the disk it is on. When
+    moving a file would exceed the limit, the files that arrived first are evicted until the file fits.
+
+    All methods are safe to call from multiple threads at once.
+
+    *Example*
+      ``holding.make_room(path, size); (move the file); holding.arrived(path, size)``
+    """
+    RESCAN_INTERVAL = 7 * 24 * 60 * 60
+
+    def __init__(self, root, directory_index=None, metrics=None):
+        self.root = root
+        self.path = os.path.join(ADDON_PROFILE, "holding.json")
+        self.directory_index = directory_index or DirectoryIndex()
+        self.metrics = metrics or RunMetrics()
+        self.__files = None
+        self.__scanned = 0
+        self.__capacity = None
+        self.__reserved = {}
+        self.__changed = False
+        self.__lock = threading.RLock()
+
+    def __load(self):
+        """
+        Load the index, or scan the holding folder if there is no recent index for it. Must be called while holding the
+        lock.
+        """
+        if self.__files is not None:
+            return
+
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data[u"root"] == self.root and time.time() - data[u"scanned"] < self.RESCAN_INTERVAL:
+                self.__files = dict((path, tuple(entry)) for path, entry in data[u"files"].iteritems())
+                self.__scanned = data[u"scanned"]
+        except (IOError, OSError, ValueError, KeyError, TypeError) as err:
+            if os.path.exists(self.path):
+                debug(u"Could not load the index of the holding folder: {error}", xbmc.LOGWARNING, error=err)
+
+        if self.__files is None:
+            self.__scan()
+        self.__capacity = self.__compute_capacity()
+
+    def __scan(self):
+        debug(u"Scanning the holding folder {path}.", path=self.root)
+        self.__files = {}
+        folders = [self.root]
+        while folders:
+            folder = folders.pop()
+            subfolders, files = self.directory_index.listdir(folder)
+            folders.extend(os.path.join(folder, name) for name in subfolders)
+            for name in files:
+                metadata = self.directory_index.stat(os.path.join(folder, name))
+                if metadata.exists:
+                    self.__files[os.path.join(folder, name)] = (metadata.size, metadata.mtime)
+        self.__scanned = time.time()
+        self.__changed = True
+        debug(u"Found {amount:d} files in the holding folder.", amount=len(self.__files))
+
+    def __compute_capacity(self):
+        """
+        :rtype: int
+        :return: The maximum number of bytes the holding folder may use, or None if there is no limit.
+        """
+        limits = []
+        if get_setting(holding_folder_max_size):
+            limits.append(int(get_setting(holding_folder_max_size) * 1024 ** 3))
+        if get_setting(holding_folder_max_percentage):
+            usage = get_disk_usage(self.root)
+            if usage is not None:
+                limits.append(int(usage[1] * get_setting(holding_folder_max_percentage) / 100))
+        return min(limits) if limits else None
+
+    def size(self, path):
+        """
+        :type path: unicode
+        :param path: The path of a file in the holding folder.
+        :rtype: int
+        :return: The size of the file in bytes according to the index, or None if it is not in the index.
+        """
+        with self.__lock:
+            self.__load()
+            entry = self.__files.get(path)
+            return entry[0] if entry is not None else None
+
+    def make_room(self, path, size):
+        """
+        Evict the files that arrived first until a file fits in the holding folder without exceeding its size limit. The
+        room is reserved until ``arrived()`` or ``left()`` is called for the file.
+
+        :type path: unicode
+        :param path: The path the file will be moved to.
+        :type size: int
+        :param size: The size of the file in bytes.
+        """
+        with self.__lock:
+            self.__load()
+            if self.__files.pop(path, None) is not None:
+                self.__changed = True
+            if self.__capacity is not None:
+                used = sum(entry[0] for entry in self.__files.itervalues()) + sum(self.__reserved.itervalues())
+                if used + size > self.__capacity:
+                    debug(u"The holding folder uses {used:d} of {capacity:d} bytes. Making room for {size:d} bytes.",
+                          used=used, capacity=self.__capacity, size=size)
+                    for evicted, (evicted_size, _) in sorted(self.__files.items(), key=lambda item: item[1][1]):
+                        if used + size <= self.__capacity:
+                            break
+                        if self.__evict(evicted):
+                            used -= evicted_size
+                    if used + size > self.__capacity:
+                        debug(u"Could not make enough room in the holding folder.", xbmc.LOGWARNING)
+            self.__reserved[path] = size
+
+    def __evict(self, path):
+        """
+        Delete a file from the holding folder, and its folder if that became empty. Must be called while holding the
+        lock.
+
+        :rtype: bool
+        :return: True if the file is gone, False otherwise.
+        """
+        debug(u"Evicting {path} from the holding folder.", path=path)
+        if not self.metrics.call(u"delete", xbmcvfs.delete, path) and self.directory_index.stat(path).exists:
+            debug(u"Could not evict {path}.", xbmc.LOGWARNING, path=path)
+            return False
+
+        self.metrics.count(u"files_evicted")
+        self.metrics.count(u"bytes_evicted", self.__files.pop(path)[0])
+        self.directory_index.remove(path)
+
+        folder = os.path.dirname(path)
+        if folder.rstrip(u"/\\") != self.root.rstrip(u"/\\") and self.directory_index.listdir(folder) == ([], []):
+            if self.metrics.call(u"rmdir", xbmcvfs.rmdir, folder):
+                self.directory_index.remove_folder(folder)
+        return True
+
+    def arrived(self, path, size):
+        """
+        Report that a file was moved to the holding folder.
+
+        :type path: unicode
+        :param path: The path of the file in the holding folder.
+        :type size: int
+        :param size: The size of the file in bytes.
+        """
+        with self.__lock:
+            self.__load()
+            self.__reserved.pop(path, None)
+            self.__files[path] = (size, time.time())
+            self.__changed = True
+
+    def left(self, path):
+        """
+        Report that a file is no longer in the holding folder, e.g. because moving it there failed.
+
+        :type path: unicode
+        :param path: The path of the file in the holding folder.
+        """
+        with self.__lock:
+            self.__reserved.pop(path, None)
+            if self.__files is not None and self.__files.pop(path, None) is not None:
+                self.__changed = True
+
+    def save(self):
+        """
+        Write the index to the addon profile, if it changed.
+        """
+        with self.__lock:
+            if not self.__changed:
+                return
+            try:
+                if not os.path.isdir(ADDON_PROFILE):
+                    os.makedirs(ADDON_PROFILE)
+                with open(self.path + ".tmp", "w") as f:
+                    json.dump({u"root": self.root, u"scanned": self.__scanned, u"files": self.__files}, f)
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                os.rename(self.path + ".tmp", self.path)
+                self.__changed = False
+            except (IOError, OSError) as err:
+                debug(u"Could not save the index of the holding folder: {error}", xbmc.LOGERROR, error=err)
@@ -0,0 +1,182 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import xbmc
+import xbmcgui
+from executor import get_share
+from utils import ADDON_PROFILE, debug
+
+# The window that skins can read the properties of the last run from
+HOME_WINDOW = 10000
+
+
+class RunMetrics(object):
+    """
+    The RunMetrics class measures where the time of a cleaning run goes, and counts what the run achieved.
+
+    The time spent in each phase of a run is measured with spans, such as querying the library or deleting files.
+    Spans of file operations are kept per network share, so slow shares stand out. Counters keep track of the files
+    cleaned, the bytes freed, errors and retries.
+
+    After a run, everything can be exported to the addon profile, both as JSON and as a textfile for the Prometheus node
+    exporter, and to window properties for skins.
+
+    All methods are safe to call from multiple threads at once.
+
+    *Example*
+      ``with metrics.span(u"vfs.delete", path): xbmcvfs.delete(path)``
+    """
+    COUNTERS = [u"videos_cleaned", u"files_deleted", u"files_moved", u"folders_removed", u"bytes_freed",
+                u"bytes_moved", u"files_evicted", u"bytes_evicted", u"errors", u"retries"]
+
+    def __init__(self):
+        self.started = time.time()
+        self.finished = None
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.spans = {}
+        self.__lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, path=None):
+        """
+        Measure the time spent in a block of code.
+
+        :type name: unicode
+        :param name: The name of the phase, e.g. ``jsonrpc.query`` or ``vfs.delete``.
+        :type path: unicode
+        :param path: (Optional) The path being operated on, to keep the time per network share.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(name, time.time() - start, get_share(path) if path else u"")
+
+    def record(self, name, duration, share=u""):
+        """
+        Add a measured duration to a span.
+
+        :type name: unicode
+        :param name: The name of the phase.
+        :type duration: float
+        :param duration: The time spent in seconds.
+        :type share: unicode
+        :param share: (Optional) The network share that was operated on. Defaults to an empty string for local paths.
+        """
+        with self.__lock:
+            calls, total, longest = self.spans.get((name, share), (0, 0.0, 0.0))
+            self.spans[(name, share)] = (calls + 1, total + duration, max(longest, duration))
+
+    def call(self, name, function, path, *args):
+        """
+        Call a file operation and measure the time it takes.
+
+        :type name: unicode
+        :param name: The name of the operation, e.g. ``delete``. Recorded as the span ``vfs.<name>``.
+        :type function: callable
+        :param function: The function to call, e.g. ``xbmcvfs.delete``.
+        :type path: unicode
+        :param path: The path to operate on, passed as the first argument.
+        :return: The result of the function.
+        """
+        with self.span(u"vfs." + name, path):
+            return function(path, *args)
+
+    def count(self, counter, amount=1):
+        """
+        Increase a counter.
+
+        :type counter: unicode
+        :param counter: The counter to increase (one of ``COUNTERS``).
+        :type amount: int
+        :param amount: (Optional) The amount to add. Defaults to 1.
+        """
+        with self.__lock:
+            self.counters[counter] += amount
+
+    def finish(self):
+        """
+        Mark the end of the run.
+        """
+        self.finished = time.time()
+
+    def to_dict(self):
+        """
+        :rtype: dict
+        :return: All metrics of the run.
+        """
+        with self.__lock:
+            return {
+                u"started": self.started,
+                u"duration": (self.finished or time.time()) - self.started,
+                u"counters": dict(self.counters),
+                u"spans": [{u"name": name, u"share": share, u"calls": calls, u"seconds": total, u"longest": longest}
+                           for (name, share), (calls, total, longest) in sorted(self.spans.items())]
+            }
+
+    @staticmethod
+    def __label(value):
+        return value.replace(u"\\", u"\\\\").replace(u"\"", u"\\\"").replace(u"\n", u"\\n")
+
+    def to_prometheus(self):
+        """
+        :rtype: unicode
+        :return: The metrics of the run in the Prometheus text format.
+        """
+        metrics = self.to_dict()
+        lines = [u"# HELP janitor_last_run_timestamp_seconds When the last cleaning run started.",
+                 u"# TYPE janitor_last_run_timestamp_seconds gauge",
+                 u"janitor_last_run_timestamp_seconds {0:f}".format(metrics[u"started"]),
+                 u"# HELP janitor_last_run_duration_seconds How long the last cleaning run took.",
+                 u"# TYPE janitor_last_run_duration_seconds gauge",
+                 u"janitor_last_run_duration_seconds {0:f}".format(metrics[u"duration"])]
+
+        for counter, value in sorted(metrics[u"counters"].items()):
+            lines.extend([u"# HELP janitor_last_run_{0} The {1} during the last cleaning run.".format(
+                counter, counter.replace(u"_", u" ")), u"# TYPE janitor_last_run_{0} gauge".format(counter),
+                u"janitor_last_run_{0} {1:d}".format(counter, value)])
+
+        for metric, key, description in [(u"phase_calls", u"calls", u"The number of times a phase ran"),
+                                         (u"phase_seconds", u"seconds", u"The time spent in a phase"),
+                                         (u"phase_longest_seconds", u"longest", u"The longest time a phase took")]:
+            lines.extend([u"# HELP janitor_last_run_{0} {1} during the last cleaning run.".format(metric, description),
+                          u"# TYPE janitor_last_run_{0} gauge".format(metric)])
+            for span in metrics[u"spans"]:
+                lines.append(u"janitor_last_run_{metric}{{phase=\"{name}\",share=\"{share}\"}} {value}".format(
+                    metric=metric, name=self.__label(span[u"name"]), share=self.__label(span[u"share"]),
+                    value=span[key]))
+        return u"\n".join(lines) + u"\n"
+
+    def export(self):
+        """
+        Write the metrics of the run to ``stats.json`` and ``janitor.prom`` in the addon profile, and publish a summary
+        through properties of the home window, e.g. ``Window(Home).Property(Janitor.BytesFreed)``.
+        """
+        metrics = self.to_dict()
+        for name, contents in [("stats.json", json.dumps(metrics, indent=1)),
+                               ("janitor.prom", self.to_prometheus().encode("utf-8"))]:
+            path = os.path.join(ADDON_PROFILE, name)
+            try:
+                if not os.path.isdir(ADDON_PROFILE):
+                    os.makedirs(ADDON_PROFILE)
+                with open(path + ".tmp", "w") as f:
+                    f.write(contents)
+                if os.path.exists(path):
+                    os.remove(path)
+                os.rename(path + ".tmp", path)
+            except (IOError, OSError) as err:
+                debug(u"Could not export the metrics to {path}: {error}", xbmc.LOGERROR, path=path, error=err)
+
+        window = xbmcgui.Window(HOME_WINDOW)
+        window.setProperty(u"Janitor.LastRun", time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started)))
+        window.setProperty(u"Janitor.Duration", u"{0:.1f}".format(metrics[u"duration"]))
+        for counter, value in metrics[u"counters"].items():
+            window.setProperty(u"Janitor." + u"".join(word.capitalize() for word in counter.split(u"_")),
+                               unicode(value))
+        debug(u"Run metrics: {counters}", counters=metrics[u"counters"])
@@ -0,0 +1,191 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import time
+
+import xbmc
+from utils import ADDON_PROFILE, debug, translate
+
+# The actions an operation can perform
+DELETE = u"delete"
+MOVE = u"move"
+REMOVE_FOLDER = u"remove_folder"
+
+
+def format_size(amount):
+    """
+    :type amount: int
+    :param amount: A number of bytes.
+    :rtype: unicode
+    :return: The number of bytes in a human readable form, e.g. ``u"1.4 GB"``.
+    """
+    amount = float(amount)
+    for unit in [u"B", u"KB", u"MB", u"GB"]:
+        if amount < 1024:
+            break
+        amount /= 1024
+    else:
+        unit = u"TB"
+    return u"{0:.1f} {1}".format(amount, unit)
+
+
+class CleaningPlan(object):
+    """
+    The CleaningPlan class describes everything a cleaning run is going to do, without doing any of it.
+
+    A plan lists the videos to clean, and the operations needed to clean them: files to delete or move to the holding
+    folder, and folders to remove once they are empty. An operation can depend on others. Related files are only cleaned
+    after the video itself, and a folder is only removed after the files in it. Apart from that, operations can be
+    carried out in any order.
+
+    Plans only contain plain values, so they can be saved to the addon profile and loaded again. A plan can also be
+    shown to the user to preview a cleaning run.
+
+    *Example*
+      ``video = plan.add_video(u"movies", path, title); plan.add_operation(DELETE, path, size=size, video=video)``
+    """
+
+    def __init__(self, videos=None, operations=None, created=None):
+        self.videos = videos or []
+        self.operations = operations or []
+        self.created = created or time.time()
+
+    def add_video(self, video_type, filename, title, library_id=None):
+        """
+        Add a video to clean.
+
+        :type video_type: unicode
+        :param video_type: The type of the video (one of the video types used by the cleaner).
+        :type filename: unicode
+        :param filename: The (possibly stacked) path of the video.
+        :type title: unicode
+        :param title: The title of the video.
+        :type library_id: int
+        :param library_id: (Optional) The id of the video in the Kodi library, e.g. its ``movieid``.
+        :rtype: dict
+        :return: The video, to add operations to.
+        """
+        self.videos.append({u"type": video_type, u"path": filename, u"title": title, u"library_id": library_id,
+                            u"operations": []})
+        return self.videos[-1]
+
+    def add_operation(self, action, path, destination=None, size=None, depends=(), video=None):
+        """
+        Add an operation to the plan.
+
+        :type action: unicode
+        :param action: The action to perform (one of DELETE, MOVE or REMOVE_FOLDER).
+        :type path: unicode
+        :param path: The file or folder to perform the action on.
+        :type destination: unicode
+        :param destination: (Optional) The folder to move the file to. Only used by MOVE operations.
+        :type size: int
+        :param size: (Optional) The size of the file in bytes, if known.
+        :type depends: list
+        :param depends: (Optional) The indexes of the operations that should be performed before this one.
+        :type video: dict
+        :param video: (Optional) The video this operation belongs to, as returned by ``add_video()``.
+        :rtype: int
+        :return: The index of the new operation.
+        """
+        operation = {u"action": action, u"path": path, u"size": size, u"depends": list(depends)}
+        if destination is not None:
+            operation[u"destination"] = destination
+        self.operations.append(operation)
+        index = len(self.operations) - 1
+        if video is not None:
+            video[u"operations"].append(index)
+        return index
+
+    def operations_of(self, video):
+        """
+        :type video: dict
+        :param video: One of the videos in the plan.
+        :rtype: list
+        :return: The (index, operation) tuples of all operations that belong to the video.
+        """
+        return [(index, self.operations[index]) for index in video[u"operations"]]
+
+    def totals(self):
+        """
+        :rtype: dict
+        :return: The number of videos, the number of files and bytes to delete and to move, and the number of folders
+            to remove.
+        """
+        totals = {u"videos": len(self.videos), u"folders": 0}
+        for action in [DELETE, MOVE]:
+            totals[action] = {u"files": 0, u"bytes": 0}
+        for operation in self.operations:
+            if operation[u"action"] == REMOVE_FOLDER:
+                totals[u"folders"] += 1
+            else:
+                totals[operation[u"action"]][u"files"] += 1
+                totals[operation[u"action"]][u"bytes"] += operation[u"size"] or 0
+        return totals
+
+    def describe(self):
+        """
+        :rtype: unicode
+        :return: A (localized) description of the totals and all operations of the plan, to show to the user.
+        """
+        totals = self.totals()
+        if not totals[u"videos"]:
+            return translate(32634)  # Nothing to clean
+
+        lines = [translate(32635).format(videos=totals[u"videos"])]
+        for action, msg_id in [(DELETE, 32636), (MOVE, 32637)]:
+            if totals[action][u"files"]:
+                lines.append(translate(msg_id).format(files=totals[action][u"files"],
+                                                      size=format_size(totals[action][u"bytes"])))
+        if totals[u"folders"]:
+            lines.append(translate(32638).format(folders=totals[u"folders"]))
+
+        for video in self.videos:
+            lines.extend([u"", u"[B]{0}[/B]".format(video[u"title"])])
+            lines.extend(u"  {0}".format(operation[u"path"]) for _, operation in self.operations_of(video))
+        folders = [operation[u"path"] for operation in self.operations if operation[u"action"] == REMOVE_FOLDER]
+        if folders:
+            lines.extend([u"", u"[B]{0}[/B]".format(translate(32639))])
+            lines.extend(u"  {0}".format(folder) for folder in folders)
+        return u"\n".join(lines)
+
+    def save(self, path=None):
+        """
+        Write the plan to a file.
+
+        :type path: unicode
+        :param path: (Optional) The file to write to. Defaults to ``plan.json`` in the addon profile.
+        """
+        path = path or os.path.join(ADDON_PROFILE, "plan.json")
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path + ".tmp", "w") as f:
+                json.dump({u"created": self.created, u"videos": self.videos, u"operations": self.operations}, f,
+                          indent=1)
+            if os.path.exists(path):
+                os.remove(path)
+            os.rename(path + ".tmp", path)
+        except (IOError, OSError) as err:
+            debug(u"Could not save the cleaning plan: {error}", xbmc.LOGERROR, error=err)
+
+    @classmethod
+    def load(cls, path=None):
+        """
+        Read a plan from a file.
+
+        :type path: unicode
+        :param path: (Optional) The file to read from. Defaults to ``plan.json`` in the addon profile.
+        :rtype: CleaningPlan
+        :return: The plan, or None if it could not be read.
+        """
+        path = path or os.path.join(ADDON_PROFILE, "plan.json")
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            return cls(data[u"videos"], data[u"operations"], data[u"created"])
+        except (IOError, OSError, ValueError, KeyError, TypeError) as err:
+            debug(u"Could not load the cleaning plan: {error}", xbmc.LOGWARNING, error=err)
+            return None
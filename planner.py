@@ -0,0 +1,139 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from collections import deque
+
+from utils import debug
+
+
+class SpacePlanner(object):
+    """
+    The SpacePlanner class decides which videos to clean when the disk is running low on free space.
+
+    Instead of cleaning every watched video as soon as disk space runs low, all candidates are ranked by the priority
+    the user chose, and only as many videos are selected as are needed to free the required number of bytes on each
+    volume that is low on free space. Videos on other volumes are left alone. The bytes freed by each cleaned video are
+    added up as cleaning progresses, so the free disk space does not have to be checked again after every file. If
+    some videos could not be cleaned, the next selection makes up for the difference.
+
+    File sizes are only looked up for videos that are about to be selected, except when the largest videos should be
+    cleaned first.
+
+    *Example*
+      ``planner = SpacePlanner(VolumeMonitor().bytes_to_free(), get_setting(cleaning_priority), DirectoryIndex())``
+    """
+    # Values of the cleaning_priority setting
+    LEAST_RECENTLY_WATCHED_FIRST = u"0"
+    LOWEST_RATED_FIRST = u"1"
+    LARGEST_FIRST = u"2"
+
+    # The properties needed to rank videos, in addition to the filename and title
+    PROPERTIES = [u"lastplayed", u"rating"]
+
+    def __init__(self, bytes_needed, priority, directory_index):
+        self.bytes_needed = dict(bytes_needed)
+        self.bytes_freed = dict.fromkeys(self.bytes_needed, 0)
+        self.priority = priority
+        self.directory_index = directory_index
+        self.__candidates = []
+        self.__ranked = None
+        self.__sizes = {}
+        self.__volumes = {}
+
+    def add(self, video_type, video, parts, volume=None):
+        """
+        Add a video to the candidates, unless it is stored on a volume that has enough free space.
+
+        :type video_type: unicode
+        :param video_type: The type of the video (one of the video types used by the cleaner).
+        :type video: tuple
+        :param video: The filename, title, library id, last played date and rating of the video.
+        :type parts: list
+        :param parts: The paths of all files the video consists of, i.e. all parts of a stacked video.
+        :type volume: unicode or int
+        :param volume: (Optional) The volume the video is stored on, as returned by ``VolumeMonitor.volume_of()``.
+            Defaults to ``None``.
+        """
+        if volume not in self.bytes_needed:
+            return
+
+        filename, title, library_id, lastplayed, rating = video
+        self.__candidates.append((video_type, filename, title, lastplayed or u"", float(rating or 0), parts, volume,
+                                  library_id))
+        for part in parts:
+            self.__volumes[part] = volume
+
+    def __file_size(self, path):
+        try:
+            return self.__sizes[path]
+        except KeyError:
+            size = self.directory_index.stat(path).size
+            self.__sizes[path] = size
+            return size
+
+    def size(self, parts):
+        """
+        :type parts: list
+        :param parts: The paths of all files a video consists of.
+        :rtype: int
+        :return: The combined size of all files in bytes.
+        """
+        return sum(self.__file_size(part) for part in parts)
+
+    def __rank(self):
+        if self.priority == self.LARGEST_FIRST:
+            key = lambda candidate: -self.size(candidate[5])
+        elif self.priority == self.LOWEST_RATED_FIRST:
+            key = lambda candidate: (candidate[4], candidate[3])
+        else:
+            key = lambda candidate: candidate[3]
+
+        debug(u"Ranking {amount:d} candidates.", amount=len(self.__candidates))
+        self.__ranked = deque(sorted(self.__candidates, key=key))
+        self.__candidates = []
+
+    def select(self):
+        """
+        Select the next videos to clean. Videos are taken in order of priority until, on each volume, the bytes already
+        freed plus the size of the selected videos reach the number of bytes needed.
+
+        :rtype: dict
+        :return: The selected videos as lists of (filename, title, library id) tuples, per video type. Empty if enough
+            bytes were freed or no candidates are left.
+        """
+        if self.__ranked is None:
+            self.__rank()
+
+        selection = {}
+        projected = dict(self.bytes_freed)
+        skipped = deque()
+        while self.__ranked and any(projected[v] < self.bytes_needed[v] for v in self.bytes_needed):
+            candidate = self.__ranked.popleft()
+            video_type, filename, title, _, _, parts, volume, library_id = candidate
+            if projected[volume] >= self.bytes_needed[volume]:
+                skipped.append(candidate)  # Keep it in case cleaning other videos on this volume fails
+                continue
+            size = self.size(parts)
+            if not size:
+                continue  # The file is missing, so cleaning it would not free any space
+            projected[volume] += size
+            selection.setdefault(video_type, []).append((filename, title, library_id))
+
+        skipped.extend(self.__ranked)
+        self.__ranked = skipped
+
+        debug(u"Selected {amount:d} videos to free {bytes:d} more bytes.",
+              amount=sum(len(videos) for videos in selection.values()),
+              bytes=sum(max(self.bytes_needed[v] - self.bytes_freed[v], 0) for v in self.bytes_needed))
+        return selection
+
+    def cleaned(self, paths):
+        """
+        Report files that were cleaned, to keep track of the bytes freed so far.
+
+        :type paths: list
+        :param paths: The paths of the files that were cleaned.
+        """
+        for path in paths:
+            if path in self.__volumes:
+                self.bytes_freed[self.__volumes[path]] += self.__sizes.get(path, 0)
@@ -0,0 +1,90 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import threading
+
+import xbmcgui
+
+
+class ProgressReporter(object):
+    """
+    The ProgressReporter class shows the progress of a cleaning run in a progress dialog, without slowing it down.
+
+    Calls to ``update()`` only record the latest progress. A background thread draws it in the dialog at most once every
+    ``INTERVAL`` seconds, and checks whether the user canceled. Reporting progress and checking for cancellation are
+    cheap enough to do between any two operations, so cleaning never has to wait for the dialog.
+
+    The methods are the same as those of ``xbmcgui.DialogProgress``.
+
+    *Example*
+      ``progress.create(ADDON_NAME); progress.update(50, u"Halfway there"); progress.close()``
+    """
+    INTERVAL = 0.2
+
+    def __init__(self):
+        self.__dialog = None
+        self.__thread = None
+        self.__state = None
+        self.__drawn = None
+        self.__canceled = False
+        self.__lock = threading.Lock()
+        self.__closed = threading.Event()
+
+    def create(self, heading, *lines):
+        """
+        Show the progress dialog and start drawing updates.
+
+        :type heading: unicode
+        :param heading: The heading of the dialog.
+        :type lines: unicode
+        :param lines: The initial lines of text to show.
+        """
+        self.close()
+        self.__dialog = xbmcgui.DialogProgress()
+        self.__dialog.create(heading, *lines)
+        self.__state, self.__drawn, self.__canceled = None, None, False
+        self.__closed.clear()
+        self.__thread = threading.Thread(target=self.__run)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def update(self, percent, *lines):
+        """
+        Record the latest progress. It is drawn within ``INTERVAL`` seconds, unless newer progress is recorded first.
+
+        :type percent: int
+        :param percent: The percentage of the work done.
+        :type lines: unicode
+        :param lines: The lines of text to show.
+        """
+        with self.__lock:
+            self.__state = (percent, lines)
+
+    def iscanceled(self):
+        """
+        :rtype: bool
+        :return: True if the user canceled the dialog, False otherwise.
+        """
+        return self.__canceled
+
+    def close(self):
+        """
+        Stop drawing updates and close the dialog.
+        """
+        if self.__thread is not None:
+            self.__closed.set()
+            self.__thread.join()
+            self.__thread = None
+        if self.__dialog is not None:
+            self.__dialog.close()
+            self.__dialog = None
+
+    def __run(self):
+        while not self.__closed.wait(self.INTERVAL):
+            with self.__lock:
+                state = self.__state
+            if state is not None and state != self.__drawn:
+                self.__dialog.update(state[0], *state[1])
+                self.__drawn = state
+            if self.__dialog.iscanceled():
+                self.__canceled = True
@@ -0,0 +1,142 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+
+import xbmc
+import xbmcvfs
+from metrics import RunMetrics
+from utils import debug
+from vfs import DirectoryIndex, native_path
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None  # Not available before Python 3.5, unless the scandir module is installed
+
+
+class FolderPruner(object):
+    """
+    The FolderPruner class removes the folders that were left empty by a cleaning run.
+
+    While cleaning, the folders of the cleaned files are collected with ``touch()``. Once the run is over, ``prune()``
+    removes those that are empty, deepest first, so a folder is only looked at after its subfolders. Every folder is
+    listed at most once, no matter how many files were cleaned from it. Files with an ignored extension, or without an
+    extension, do not count and are deleted along with their folder.
+
+    Local folders are listed with ``scandir()`` if it is available, other folders through Kodi.
+
+    *Example*
+      ``pruner.touch(os.path.dirname(path)); (clean more files); pruner.prune()``
+    """
+
+    def __init__(self, ignored_extensions=u"", directory_index=None, metrics=None):
+        """
+        :type ignored_extensions: unicode
+        :param ignored_extensions: (Optional) The comma-separated file extensions to ignore, e.g. ``u".nfo, .jpg"``.
+        :type directory_index: DirectoryIndex
+        :param directory_index: (Optional) The index to list non-local folders with and to keep up to date.
+        :type metrics: RunMetrics
+        :param metrics: (Optional) The metrics to record file operations and removed folders in.
+        """
+        self.ignored = frozenset(ext.strip() for ext in ignored_extensions.split(u","))
+        self.directory_index = directory_index or DirectoryIndex()
+        self.metrics = metrics or RunMetrics()
+        self.__touched = set()
+        self.__removed = {}
+        self.__lock = threading.Lock()
+
+    def is_ignored(self, filename):
+        """
+        :type filename: unicode
+        :param filename: The name or path of a file.
+        :rtype: bool
+        :return: True if the file does not keep its folder from being removed, False otherwise.
+        """
+        _, ext = os.path.splitext(filename)
+        return not ext or ext in self.ignored
+
+    def touch(self, folder):
+        """
+        Report that files were cleaned from a folder, so it should be removed at the end of the run if it is empty.
+
+        This is safe to call from multiple threads at once.
+
+        :type folder: unicode
+        :param folder: The path of the folder.
+        """
+        with self.__lock:
+            self.__touched.add(folder.rstrip(u"/\\") or folder)
+
+    def prune(self, is_canceled=lambda: False):
+        """
+        Remove all touched folders that are empty, deepest first.
+
+        :type is_canceled: callable
+        :param is_canceled: (Optional) Called between folders. Returns True to stop pruning.
+        :rtype: list
+        :return: The touched folders that were removed.
+        """
+        with self.__lock:
+            touched, self.__touched = self.__touched, set()
+        debug(u"Pruning {amount:d} folders. Ignoring file types {types}", amount=len(touched),
+              types=sorted(self.ignored))
+
+        pruned = []
+        for folder in sorted(touched, key=lambda f: f.count(u"/") + f.count(u"\\"), reverse=True):
+            if is_canceled():
+                break
+            with self.metrics.span(u"prune", folder):
+                if self.__prune(folder):
+                    pruned.append(folder)
+        return pruned
+
+    def __prune(self, folder):
+        """
+        Remove a folder if it only contains ignored files and folders that can be removed themselves.
+
+        :rtype: bool
+        :return: True if the folder was removed, False otherwise.
+        """
+        if folder in self.__removed:
+            return self.__removed[folder]
+
+        subfolders, files = self.__listdir(folder)
+        self.__removed[folder] = False
+        if any(not self.is_ignored(f) for f in files):
+            debug(u"Directory {folder} is not empty and will not be removed", folder=folder)
+            return False
+        # Subfolders that are empty can be removed, even if their siblings cannot
+        if not all([self.__prune(os.path.join(folder, f)) for f in subfolders]):
+            return False
+
+        debug(u"Directory {folder} is empty and will be removed", folder=folder)
+        for f in files:
+            if self.metrics.call(u"delete", xbmcvfs.delete, os.path.join(folder, f)):
+                self.directory_index.remove(os.path.join(folder, f))
+        if self.metrics.call(u"rmdir", xbmcvfs.rmdir, folder):
+            self.directory_index.remove_folder(folder)
+            self.metrics.count(u"folders_removed")
+            self.__removed[folder] = True
+        return self.__removed[folder]
+
+    def __listdir(self, folder):
+        """
+        :rtype: (list, list)
+        :return: The names of the subfolders and the files in a folder.
+        """
+        if scandir is not None and u"://" not in folder:
+            try:
+                subfolders, files = [], []
+                for entry in scandir(native_path(folder)):
+                    name = entry.name if isinstance(entry.name, unicode) else entry.name.decode("utf-8")
+                    (subfolders if entry.is_dir() else files).append(name)
+                return subfolders, files
+            except (OSError, UnicodeDecodeError) as err:
+                debug(u"Could not scan {folder}, listing it through Kodi instead: {error}", xbmc.LOGWARNING,
+                      folder=folder, error=err)
+        return self.directory_index.listdir(folder)
@@ -1,21 +1,18 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-from utils import ADDON, translate
+from exclusions import ExclusionList
+from utils import translate
 from xbmcgui import Dialog
 
 
 def reset_exclusions():
     """
-    Reset all user-set exclusion paths to blanks.
+    Remove all exclusion rules set up by the user.
     :return:
     """
     if Dialog().yesno(translate(32604), translate(32610), translate(32607)):
-        ADDON.setSetting(id="exclusion1", value="")
-        ADDON.setSetting(id="exclusion2", value="")
-        ADDON.setSetting(id="exclusion3", value="")
-        ADDON.setSetting(id="exclusion4", value="")
-        ADDON.setSetting(id="exclusion5", value="")
+        ExclusionList().clear()
 
 if __name__ == "__main__":
     reset_exclusions()
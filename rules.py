@@ -0,0 +1,344 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import xbmc
+from utils import debug
+from settings import Snapshot
+
+# The estimated fraction of videos that satisfy a condition with each operator, until the actual fraction is known
+SELECTIVITY = {
+    u"is": 0.1,
+    u"isnot": 0.9,
+    u"contains": 0.2,
+    u"doesnotcontain": 0.8,
+    u"startswith": 0.2,
+    u"greaterthan": 0.5,
+    u"lessthan": 0.5,
+    u"inthelast": 0.2,
+    u"notinthelast": 0.8,
+    u"true": 0.1,
+    u"false": 0.9
+}
+
+# The relative cost of evaluating a condition on each field locally. Fields that are not listed cost 1.
+COSTS = {
+    u"lastplayed": 5,  # Parsing dates is slow
+    u"path": 2,
+    u"filename": 2
+}
+
+# The property of a video needed to evaluate a condition on each field locally, if it differs from the field
+PROPERTIES = {
+    u"inprogress": u"resume",
+    u"path": u"file",
+    u"filename": u"file"
+}
+
+# The operators that compare dates relative to the current time
+TIME_OPERATORS = frozenset([u"inthelast", u"notinthelast"])
+
+
+class Condition(object):
+    """
+    A condition on a single field of a video, using the fields and operators of Kodi's JSON-RPC filters.
+
+    Conditions are combined with ``And``. Both can be translated to a JSON-RPC filter, so Kodi only returns the videos
+    that satisfy them, or be evaluated locally against the properties of a video. Use ``compile_rule()`` to decide
+    which parts of a rule are evaluated where.
+
+    *Example*
+      ``Condition(u"rating", u"lessthan", u"5.0")``
+    """
+
+    def __init__(self, field, operator, value=u""):
+        self.field = field
+        self.operator = operator
+        self.value = value
+
+    def __repr__(self):
+        return u"{0} {1} {2}".format(self.field, self.operator, self.value).strip().encode("utf-8")
+
+    def pushable(self, fields):
+        """
+        :type fields: collections.Container
+        :param fields: The fields Kodi can filter the videos on.
+        :rtype: bool
+        :return: True if Kodi can evaluate the entire rule, False otherwise.
+        """
+        return self.field in fields
+
+    def to_filter(self):
+        """
+        :rtype: dict
+        :return: The rule as a JSON-RPC filter. Only valid if the rule is pushable.
+        """
+        return {u"field": self.field, u"operator": self.operator, u"value": self.value}
+
+    def matches(self, video):
+        """
+        :type video: dict
+        :param video: The properties of a video, as returned by Kodi.
+        :rtype: bool
+        :return: True if the video satisfies the rule, False otherwise.
+        """
+        field, operator, value = self.field, self.operator, self.value
+
+        if field == u"inprogress":
+            in_progress = video[u"resume"][u"position"] > 0
+            if operator in (u"true", u"false"):
+                return in_progress == (operator == u"true")
+        elif field == u"lastplayed":
+            if operator in TIME_OPERATORS:
+                if not video[u"lastplayed"]:
+                    in_the_last = False
+                else:
+                    played = time.mktime(time.strptime(video[u"lastplayed"], "%Y-%m-%d %H:%M:%S"))
+                    in_the_last = time.time() - played <= float(value) * 24 * 60 * 60
+                return in_the_last == (operator == u"inthelast")
+        elif field in (u"path", u"filename") or isinstance(video.get(field), basestring):
+            if field == u"path":
+                actual = os.path.dirname(video[u"file"]) + u"/"
+            elif field == u"filename":
+                actual = os.path.basename(video[u"file"])
+            else:
+                actual = video[field]
+            actual, value = actual.lower(), value.lower()
+            if operator in (u"is", u"isnot"):
+                return (actual == value) == (operator == u"is")
+            elif operator in (u"contains", u"doesnotcontain"):
+                return (value in actual) == (operator == u"contains")
+            elif operator == u"startswith":
+                return actual.startswith(value)
+        else:
+            actual, target = float(video[field] or 0), float(value)
+            if operator == u"greaterthan":
+                return actual > target
+            elif operator == u"lessthan":
+                return actual < target
+            elif operator in (u"is", u"isnot"):
+                return (actual == target) == (operator == u"is")
+
+        debug(u"Cannot evaluate {condition} locally.", xbmc.LOGWARNING, condition=self)
+        return False
+
+    def properties(self):
+        """
+        :rtype: set
+        :return: The properties of a video needed to evaluate the rule locally.
+        """
+        return set([PROPERTIES.get(self.field, self.field)])
+
+    def selectivity(self):
+        """
+        :rtype: float
+        :return: The estimated fraction of videos that satisfy the rule.
+        """
+        return SELECTIVITY.get(self.operator, 0.5)
+
+    def cost(self):
+        """
+        :rtype: float
+        :return: The estimated relative cost of evaluating the rule locally.
+        """
+        return COSTS.get(self.field, 1)
+
+    def time_dependent(self):
+        """
+        :rtype: bool
+        :return: True if whether a video satisfies the rule can change just because time passes.
+        """
+        return self.operator in TIME_OPERATORS
+
+
+class And(object):
+    """
+    A rule that is satisfied when all of its rules are. It has the same methods as ``Condition``.
+
+    *Example*
+      ``And(Condition(u"playcount", u"greaterthan", u"0"), Condition(u"inprogress", u"false"))``
+    """
+
+    def __init__(self, *rules):
+        self.rules = list(rules)
+
+    def __repr__(self):
+        return "(" + " AND ".join(repr(rule) for rule in self.rules) + ")"
+
+    def pushable(self, fields):
+        return all(rule.pushable(fields) for rule in self.rules)
+
+    def to_filter(self):
+        return {u"and": [rule.to_filter() for rule in self.rules]}
+
+    def matches(self, video):
+        return all(rule.matches(video) for rule in self.rules)
+
+    def properties(self):
+        return set().union(*[rule.properties() for rule in self.rules])
+
+    def selectivity(self):
+        return reduce(lambda total, rule: total * rule.selectivity(), self.rules, 1.0)
+
+    def cost(self):
+        return sum(rule.cost() for rule in self.rules)
+
+    def time_dependent(self):
+        return any(rule.time_dependent() for rule in self.rules)
+
+
+class RulePlan(object):
+    """
+    The RulePlan class describes how a rule is evaluated for one type of video: the part Kodi evaluates as a JSON-RPC
+    filter, and the predicates that are evaluated locally on the videos Kodi returns.
+
+    Local predicates are evaluated cheapest and most selective first, so most videos are rejected after a single cheap
+    check. The selectivity of each predicate starts out as an estimate and is replaced by the fraction of videos that
+    actually satisfied it, once enough videos were evaluated.
+
+    *Example*
+      ``plan = compile_rule(rule, Cleaner.movie_filter_fields); [v for v in videos if plan.matches(v)]``
+    """
+    MIN_SAMPLES = 50
+    REORDER_INTERVAL = 256
+
+    def __init__(self, pushed, local):
+        """
+        :type pushed: And
+        :param pushed: The part of the rule Kodi evaluates, or None if Kodi cannot evaluate any part of it.
+        :type local: list
+        :param local: The rules that must all be satisfied as well, evaluated locally.
+        """
+        self.filter = pushed.to_filter() if pushed is not None else None
+        self.local = list(local)
+        self.properties = sorted(set().union(*[rule.properties() for rule in self.local]))
+        self.__stats = dict((id(rule), [0, 0]) for rule in self.local)
+        self.__evaluations = 0
+        self.__lock = threading.Lock()
+        self.__reorder()
+
+    def __rank(self, rule):
+        evaluated, satisfied = self.__stats[id(rule)]
+        selectivity = float(satisfied) / evaluated if evaluated >= self.MIN_SAMPLES else rule.selectivity()
+        # Rejecting videos early pays off most for predicates that are cheap and rarely satisfied
+        return rule.cost() / max(1.0 - selectivity, 1e-6)
+
+    def __reorder(self):
+        self.local.sort(key=self.__rank)
+
+    def check(self, video):
+        """
+        Evaluate the local predicates against a video. Evaluation stops at the first predicate that is not satisfied and
+        cannot become satisfied over time.
+
+        :type video: dict
+        :param video: The properties of the video, as returned by Kodi. Must include ``properties``.
+        :rtype: (bool, bool)
+        :return: Whether the video satisfies all local predicates, and if not, whether it may do so later just because
+            time passes.
+        """
+        with self.__lock:
+            self.__evaluations += 1
+            if self.__evaluations % self.REORDER_INTERVAL == 0:
+                self.__reorder()
+            rules = list(self.local)
+
+        later = False
+        for rule in rules:
+            satisfied = rule.matches(video)
+            stats = self.__stats[id(rule)]
+            stats[0] += 1
+            stats[1] += satisfied
+            if not satisfied:
+                if not rule.time_dependent():
+                    return False, False
+                later = True
+        return not later, later
+
+    def matches(self, video):
+        """
+        :type video: dict
+        :param video: The properties of the video, as returned by Kodi. Must include ``properties``.
+        :rtype: bool
+        :return: True if the video satisfies all local predicates, False otherwise.
+        """
+        return self.check(video)[0]
+
+
+def compile_rule(rule, fields=()):
+    """
+    Decide which parts of a rule Kodi can evaluate, and which have to be evaluated locally. Of a rule that consists of
+    several rules that must all be satisfied, each part that Kodi can evaluate is pushed down to the JSON-RPC filter.
+
+    :type rule: Condition or And
+    :param rule: The rule to compile.
+    :type fields: collections.Container
+    :param fields: (Optional) The fields Kodi can filter videos of this type on. Defaults to none, which evaluates the
+        entire rule locally.
+    :rtype: RulePlan
+    :return: The plan to evaluate the rule.
+    """
+    clauses = rule.rules if isinstance(rule, And) else [rule]
+    pushed = [clause for clause in clauses if clause.pushable(fields)]
+    local = [clause for clause in clauses if not clause.pushable(fields)]
+    debug(u"Rule {rule} compiled to filter {pushed} and local predicates {local}", rule=rule, pushed=pushed,
+          local=local)
+    return RulePlan(And(*pushed) if pushed else None, local)
+
+
+class PlanCache(object):
+    """
+    The PlanCache class keeps compiled rule plans, so rules are only compiled again when the settings change.
+
+    Plans are keyed by a hash of the settings they were built from. Only the most recently used plans are kept.
+
+    *Example*
+      ``cache.get(settings, u"movies", lambda: compile_rule(build_rule(), fields))``
+    """
+    MAX_PLANS = 16
+
+    def __init__(self):
+        self.__plans = OrderedDict()
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def settings_hash(settings):
+        """
+        :type settings: Snapshot or dict
+        :param settings: The settings, as returned by ``snapshot()``, or their values.
+        :rtype: str
+        :return: A hash of the values of the settings. Equal values always have the same hash.
+        """
+        values = settings.as_dict() if isinstance(settings, Snapshot) else settings
+        return hashlib.sha1(json.dumps(values, sort_keys=True)).hexdigest()
+
+    def get(self, settings, key, build):
+        """
+        :type settings: dict
+        :param settings: The settings the plan depends on, as returned by ``snapshot()``.
+        :type key: tuple or unicode
+        :param key: What the plan is for, e.g. the type of videos.
+        :type build: callable
+        :param build: Called to build the plan if it is not cached.
+        :rtype: RulePlan
+        :return: The cached or newly built plan.
+        """
+        key = (self.settings_hash(settings), key)
+        with self.__lock:
+            if key in self.__plans:
+                plan = self.__plans.pop(key)
+                self.__plans[key] = plan
+                return plan
+
+        plan = build()
+        with self.__lock:
+            self.__plans[key] = plan
+            while len(self.__plans) > self.MAX_PLANS:
+                self.__plans.popitem(last=False)
+        return plan
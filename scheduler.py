@@ -0,0 +1,130 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import time
+
+from utils import Monitor, debug
+from settings import *
+
+
+class Scheduler(object):
+    """
+    The Scheduler class keeps track of when the next cleaning run is due.
+
+    Instead of waking up at a fixed interval to check the settings, the absolute time of the next run is computed once,
+    and the service sleeps until then. The schedule is only recomputed when something changes: after a run, when the
+    user changes the settings, or when Kodi reports that it became idle after a run had to be postponed.
+
+    With incremental cleaning enabled, most runs only look at the videos in the candidate queue. A full run that
+    considers the entire library is still done every ``full_scan_interval`` hours.
+
+    Kodi only delivers notifications while the service is waiting, and cannot interrupt a wait once it started. A single
+    wait therefore never exceeds ``MAX_SLEEP`` seconds, so a changed schedule takes effect in time.
+
+    *Example*
+      ``while scheduler.wait(): cleaner.clean_all(); scheduler.run_finished()``
+    """
+    MAX_SLEEP = 60
+
+    # Notifications indicating Kodi became idle, so a postponed run can start right away
+    IDLE_NOTIFICATIONS = [u"Player.OnStop", u"VideoLibrary.OnScanFinished"]
+
+    def __init__(self, monitor):
+        self.monitor = monitor
+        self.enabled = False
+        self.enabled_since = None
+        self.last_run = None
+        self.last_full_run = None
+        self.next_run = None
+        self.postponed = False
+        monitor.listeners.append(self.on_notification)
+        self.reschedule()
+
+    def reschedule(self):
+        """
+        Compute the time of the next run from the current settings.
+        """
+        settings = snapshot()
+        if not settings[service_enabled]:
+            self.enabled = False
+            self.next_run = None
+            debug(u"The cleaning service is disabled.")
+            return
+
+        if not self.enabled:
+            self.enabled = True
+            self.enabled_since = time.time()
+
+        if self.last_run is None:
+            self.next_run = self.enabled_since + settings[delayed_start] * 60
+        else:
+            self.next_run = self.last_run + settings[scan_interval] * 60
+        debug(u"Next cleaning run scheduled at {time}", time=time.ctime(self.next_run))
+
+    def on_notification(self, method, data):
+        """
+        Update the schedule based on a notification received by the monitor.
+
+        :type method: unicode
+        :param method: The notification that was received.
+        :type data: unicode
+        :param data: The JSON data sent along with the notification.
+        """
+        if method == Monitor.SETTINGS_CHANGED:
+            self.reschedule()
+        elif method in self.IDLE_NOTIFICATIONS and self.postponed and self.enabled:
+            debug(u"Kodi became idle ({method}). Starting the postponed run.", method=method)
+            self.next_run = time.time()
+
+    def seconds_until_next_run(self):
+        """
+        :rtype: float
+        :return: The number of seconds until the next run is due, or None if no run is scheduled.
+        """
+        return None if self.next_run is None else max(0, self.next_run - time.time())
+
+    def wait(self):
+        """
+        Sleep until the next run is due.
+
+        :rtype: bool
+        :return: True if a run is due, False if Kodi requested the service to stop.
+        """
+        while True:
+            remaining = self.seconds_until_next_run()
+            if remaining == 0:
+                return True
+            if self.monitor.waitForAbort(self.MAX_SLEEP if remaining is None else min(remaining, self.MAX_SLEEP)):
+                return False
+
+    def postpone(self):
+        """
+        Postpone the current run until Kodi becomes idle, or until the next regular run is due.
+        """
+        debug(u"Postponing cleaning until Kodi is idle.")
+        self.postponed = True
+        self.next_run = time.time() + get_setting(scan_interval) * 60
+
+    def full_run_due(self):
+        """
+        :rtype: bool
+        :return: True if the next run should consider the entire library, False if it should be incremental.
+        """
+        settings = snapshot()
+        if not settings[incremental_cleaning] or self.last_full_run is None:
+            return True
+        return time.time() - self.last_full_run >= settings[full_scan_interval] * 60 * 60
+
+    def run_finished(self, full=True):
+        """
+        Schedule the next run after a run has finished.
+
+        :type full: bool
+        :param full: (Optional) Whether the run considered the entire library. Defaults to ``True``.
+        """
+        self.last_run = time.time()
+        if full:
+            self.last_full_run = self.last_run
+        self.postponed = False
+        self.reschedule()
+
@@ -1,40 +1,39 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-from default import Cleaner
+import xbmc
+from candidates import CandidateQueue
+from scheduler import Scheduler
+from utils import Monitor, notify, debug
 from settings import *
-from utils import notify, debug
 
 
 def autostart():
     """
     Starts the cleaning service.
+
+    The service is started while Kodi boots, so only what is needed to keep track of the schedule and the candidate
+    queue is loaded right away. The cleaner and everything it depends on are loaded when the first run is due.
     """
-    cleaner = Cleaner()
-
-    service_sleep = 4  # Lower than 4 causes too much stress on resource limited systems such as RPi
-    ticker = 0
-    delayed_completed = False
-
-    while not cleaner.monitor.abortRequested():
-        if get_setting(service_enabled):
-            scan_interval_ticker = get_setting(scan_interval) * 60 / service_sleep
-            delayed_start_ticker = get_setting(delayed_start) * 60 / service_sleep
-
-            if delayed_completed and ticker >= scan_interval_ticker:
-                results, _ = cleaner.clean_all()
-                notify(results)
-                ticker = 0
-            elif not delayed_completed and ticker >= delayed_start_ticker:
-                delayed_completed = True
-                results, _ = cleaner.clean_all()
-                notify(results)
-                ticker = 0
-
-            cleaner.monitor.waitForAbort(service_sleep)
-            ticker += 1
-        else:
-            cleaner.monitor.waitForAbort(service_sleep)
+    monitor = Monitor()
+    candidate_queue = CandidateQueue()
+    monitor.listeners.append(candidate_queue.on_notification)
+    scheduler = Scheduler(monitor)
+    cleaner = None
+
+    while scheduler.wait():
+        if get_setting(clean_when_idle) and xbmc.Player().isPlaying():
+            scheduler.postpone()
+            continue
+
+        if cleaner is None:
+            from default import Cleaner
+            cleaner = Cleaner(monitor, candidate_queue)
+
+        full = scheduler.full_run_due()
+        results, _ = cleaner.clean_all(incremental=not full)
+        notify(results)
+        scheduler.run_finished(full)
 
     debug(u"Abort requested. Terminating.")
     return
@@ -10,8 +10,12 @@ delete_folders = u"delete_folders"
 ignore_extensions = u"ignore_extensions"
 
 clean_related = u"clean_related"
+concurrent_operations = u"concurrent_operations"
+concurrent_operations_per_share = u"concurrent_operations_per_share"
 delayed_start = u"delayed_start"
 scan_interval = u"scan_interval"
+incremental_cleaning = u"incremental_cleaning"
+full_scan_interval = u"full_scan_interval"
 
 notifications_enabled = u"notifications_enabled"
 notify_when_idle = u"notify_when_idle"
@@ -20,6 +24,8 @@ debugging_enabled = u"debugging_enabled"
 default_action = u"default_action"
 cleaning_type = u"cleaning_type"
 clean_kodi_library = u"clean_kodi_library"
+full_library_cleanup = u"full_library_cleanup"
+remember_library = u"remember_library"
 clean_movies = u"clean_movies"
 clean_tv_shows = u"clean_tv_shows"
 clean_music_videos = u"clean_music_videos"
@@ -35,9 +41,16 @@ ignore_no_rating = u"ignore_no_rating"
 clean_when_low_disk_space = u"clean_when_low_disk_space"
 disk_space_threshold = u"disk_space_threshold"
 disk_space_check_path = u"disk_space_check_path"
+disk_space_hysteresis = u"disk_space_hysteresis"
+check_all_volumes = u"check_all_volumes"
+cleaning_priority = u"cleaning_priority"
 
 holding_folder = u"holding_folder"
 create_subdirs = u"create_subdirs"
+move_bandwidth_limit = u"move_bandwidth_limit"
+move_verification = u"move_verification"
+holding_folder_max_size = u"holding_folder_max_size"
+holding_folder_max_percentage = u"holding_folder_max_percentage"
 
 not_in_progress = u"not_in_progress"
 
@@ -51,21 +64,106 @@ exclusion4 = u"exclusion4"
 exclusion5 = u"exclusion5"
 
 bools = [service_enabled, delete_folders, clean_related, notifications_enabled, notify_when_idle, debugging_enabled,
-         clean_kodi_library, clean_movies, clean_tv_shows, clean_music_videos, clean_when_idle, enable_expiration,
-         clean_when_low_rated, ignore_no_rating, clean_when_low_disk_space, create_subdirs,
-         not_in_progress, keep_hard_linked, exclusion_enabled]
-strings = [ignore_extensions, cleaning_type, default_action]
-numbers = [delayed_start, scan_interval, expire_after, minimum_rating, disk_space_threshold]
+         clean_kodi_library, full_library_cleanup, clean_movies, clean_tv_shows, clean_music_videos, clean_when_idle,
+         enable_expiration, clean_when_low_rated, ignore_no_rating, clean_when_low_disk_space, create_subdirs,
+         not_in_progress, keep_hard_linked, exclusion_enabled, incremental_cleaning, check_all_volumes,
+         remember_library]
+strings = [ignore_extensions, cleaning_type, default_action, cleaning_priority, move_verification]
+numbers = [delayed_start, scan_interval, expire_after, minimum_rating, disk_space_threshold, concurrent_operations,
+           concurrent_operations_per_share, full_scan_interval, disk_space_hysteresis, move_bandwidth_limit,
+           holding_folder_max_size, holding_folder_max_percentage]
 paths = [disk_space_check_path, holding_folder, create_subdirs, exclusion1, exclusion2, exclusion3, exclusion4,
          exclusion5]
 
 
+class Snapshot(object):
+    """
+    An immutable view of all settings, taken at a single point in time.
+
+    Values are already converted to their proper type and can be retrieved by key or as an attribute:
+
+    *Example*
+      ``snapshot()[clean_movies] == snapshot().clean_movies``
+    """
+    __slots__ = ("_values",)
+
+    def __init__(self, values):
+        object.__setattr__(self, "_values", dict(values))
+
+    def __getitem__(self, setting):
+        try:
+            return self._values[setting]
+        except KeyError:
+            raise ValueError(u"Failed loading {0} value. Type {1} cannot be handled."
+                             .format(setting, unicode(type(setting), encoding="utf-8")))
+
+    def __getattr__(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(u"Settings snapshots are read-only.")
+
+    def __contains__(self, setting):
+        return setting in self._values
+
+    def as_dict(self):
+        """
+        :rtype: dict
+        :return: A copy of the values of all settings, by setting.
+        """
+        return dict(self._values)
+
+
+_snapshot = None
+
+
+def snapshot():
+    """
+    Get the current snapshot of all settings. A new snapshot is taken if none exists yet or if the previous one was
+    invalidated.
+
+    :rtype: Snapshot
+    :return: The values of all settings.
+    """
+    global _snapshot
+    if _snapshot is None:
+        _snapshot = Snapshot(load_all())
+    return _snapshot
+
+
+def invalidate():
+    """
+    Discard the current settings snapshot, e.g. because the user changed the settings. The next call to ``snapshot()``
+    will read all settings again.
+    """
+    global _snapshot
+    _snapshot = None
+
+
 def get_setting(setting):
     """
     Get the value for a specified setting.
 
+    Values are read from the current snapshot if one has been taken, or directly from Kodi otherwise.
+
     Note: Make sure to check the return type of the setting you get.
 
+    :param setting: The setting you want to retrieve the value of.
+    :return: The value corresponding to the provided setting. This can be a float, a bool, a string or None.
+    """
+    current = _snapshot
+    if current is None:
+        return read_setting(setting)
+    return current[setting]
+
+
+def read_setting(setting):
+    """
+    Read the value for a specified setting directly from Kodi, bypassing any snapshot.
+
     :param setting: The setting you want to retrieve the value of.
     :return: The value corresponding to the provided setting. This can be a float, a bool, a string or None.
     """
@@ -93,5 +191,6 @@ def load_all():
     """
     settings = dict()
     for s in bools + strings + numbers + paths:
-        settings[s] = get_setting(s)
+        if s not in settings:
+            settings[s] = read_setting(s)
     return settings
@@ -1,10 +1,13 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
+import json
 import os
 import re
+import sys
 import time
-from ctypes import *
+from contextlib import closing
+from itertools import islice
 
 import xbmc
 import xbmcaddon
@@ -19,79 +22,256 @@ ADDON_NAME = ADDON.getAddonInfo("name").decode("utf-8")
 ADDON_PROFILE = xbmc.translatePath(ADDON.getAddonInfo("profile")).decode("utf-8")
 ADDON_ICON = xbmc.translatePath(ADDON.getAddonInfo("icon")).decode("utf-8")
 
+# Limits for debug messages, so large payloads cannot flood xbmc.log
+MAX_LOG_ITEMS = 10
+MAX_LOG_VALUE_LENGTH = 500
+MAX_LOG_MESSAGE_LENGTH = 4000
+RATE_LIMIT = 100  # messages per line of code ...
+RATE_LIMIT_PERIOD = 10  # ... per this many seconds
+
+_call_sites = {}
+
+
+class Monitor(xbmc.Monitor):
+    """
+    The Monitor class listens for changes to the addon settings and for notifications sent by Kodi.
+
+    Whenever the user changes the settings, the cached settings snapshot and localized strings are discarded, so the
+    next cleaning run picks up the new values.
+
+    Other parts of the addon can react to these events by adding a function to ``listeners``. Each listener is called
+    with the name of the notification and its data. Changed settings are reported as ``SETTINGS_CHANGED``.
+    """
+    SETTINGS_CHANGED = u"Settings.OnChanged"
+
+    def __init__(self):
+        xbmc.Monitor.__init__(self)
+        self.listeners = []
+
+    def onSettingsChanged(self):
+        debug(u"Settings changed. Discarding cached settings.")
+        invalidate()
+        clear_translations()
+        self.__notify_listeners(self.SETTINGS_CHANGED, None)
+
+    def onNotification(self, sender, method, data):
+        self.__notify_listeners(method, data)
+
+    def __notify_listeners(self, method, data):
+        for listener in self.listeners:
+            try:
+                listener(method, data)
+            except Exception as e:
+                debug(u"Error handling {method}: {error}", xbmc.LOGERROR, method=method, error=e)
+
 
 class Log(object):
     """
     The Log class will handle the writing of cleaned files to a log file in the addon settings.
 
-    This log file will be automatically created upon first prepending data to it.
+    The log is append-only: each cleaned file is written as a single line of JSON at the end of the current segment,
+    so the cost of writing does not depend on the size of the history. Once the current segment grows beyond
+    ``SEGMENT_SIZE`` bytes, it is rotated and (optionally) compressed. At most ``MAX_SEGMENTS`` rotated segments are
+    kept. Entries are read back newest first, without loading the entire history.
+
+    This log file will be automatically created upon first appending data to it.
 
-    Supported operations are prepend, trim, clear and get.
+    Supported operations are append, entries, pages, trim, clear and get.
     """
+    SEGMENT_SIZE = 256 * 1024
+    MAX_SEGMENTS = 20
+    COMPRESS_SEGMENTS = True
+    PAGE_SIZE = 100
+
     def __init__(self):
-        self.logpath = os.path.join(ADDON_PROFILE, "cleaner.log")
+        self.logpath = os.path.join(ADDON_PROFILE, "cleaner.jsonl")
+        self.legacy_logpath = os.path.join(ADDON_PROFILE, "cleaner.log")
+        if os.path.exists(self.legacy_logpath):
+            self.__migrate()
 
-    def prepend(self, data):
+    def __segments(self):
         """
-        Prepend the given data to the current log file. Will create a new log file if none exists.
+        Find all rotated segments of the log.
+
+        :rtype: list
+        :return: The paths of all rotated segments, newest first.
+        """
+        try:
+            names = os.listdir(ADDON_PROFILE)
+        except OSError:
+            return []
+        segments = []
+        for name in names:
+            match = re.match(r"^cleaner\.(\d+)\.jsonl(\.gz)?$", name)
+            if match:
+                segments.append((int(match.group(1)), os.path.join(ADDON_PROFILE, name)))
+        return [path for _, path in sorted(segments, reverse=True)]
+
+    def __rotate(self):
+        """
+        Turn the current segment into a rotated segment and remove the oldest segments if there are too many.
+        """
+        segments = self.__segments()
+        number = int(re.search(r"\.(\d+)\.", os.path.basename(segments[0])).group(1)) + 1 if segments else 1
+        rotated = os.path.join(ADDON_PROFILE, "cleaner.{0:05d}.jsonl".format(number))
+        debug(u"Rotating log file to {path}", path=rotated)
+        os.rename(self.logpath, rotated)
+
+        if self.COMPRESS_SEGMENTS:
+            import gzip
+            import shutil
+            with open(rotated, "rb") as source:
+                with gzip.open(rotated + ".gz", "wb") as target:
+                    shutil.copyfileobj(source, target)
+            os.remove(rotated)
+            rotated += ".gz"
+
+        for old_segment in ([rotated] + segments)[self.MAX_SEGMENTS:]:
+            debug(u"Removing old log segment {path}", path=old_segment)
+            os.remove(old_segment)
+
+    @staticmethod
+    def __read_backwards(path):
+        """
+        Read the lines of a file from the end to the start. Uncompressed files are memory mapped and scanned backwards
+        for line breaks, so only the pages containing the lines that are actually consumed are read from disk.
+        Compressed files are read entirely, since rotated segments are small enough to fit in memory.
+
+        :type path: str
+        :param path: The path to the file to read.
+        :rtype: generator
+        :return: The lines of the file in reverse order.
+        """
+        if path.endswith(".gz"):
+            import gzip
+            with gzip.open(path, "rb") as f:
+                for line in reversed(f.read().splitlines()):
+                    yield line
+            return
+
+        with open(path, "rb") as f:
+            if not os.fstat(f.fileno()).st_size:
+                return
+            import mmap
+            contents = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                end = len(contents)
+                while end > 0:
+                    start = contents.rfind("\n", 0, end)
+                    yield contents[start + 1:end]
+                    end = start
+            finally:
+                contents.close()
+
+    def __write(self, path, entries):
+        lines = "".join(json.dumps(entry, separators=(",", ":")) + "\n" for entry in entries)
+        with open(path, "ab") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def __migrate(self):
+        """
+        Convert a log file in the format used by previous versions into the oldest rotated segment.
+        """
+        debug(u"Converting {path} to the new log format.", path=self.legacy_logpath)
+        runs, timestamp = [[]], None
+        try:
+            with open(self.legacy_logpath) as f:
+                for line in f:
+                    line = line.decode("utf-8").rstrip(u"\n")
+                    header = re.match(r"^\[B\]\[(.+)\]\[/B\]$", line)
+                    if header:
+                        timestamp = int(time.mktime(time.strptime(header.group(1), "%d/%m/%Y  -  %H:%M:%S")))
+                        runs.append([])
+                    elif line.startswith(u" - ") and timestamp is not None:  # Skip entries that precede every header
+                        runs[-1].append({u"time": timestamp, u"type": None, u"path": line[3:], u"bytes": None})
+            # The old log has the most recent run at the top
+            self.__write(os.path.join(ADDON_PROFILE, "cleaner.00000.jsonl"),
+                         [entry for run in reversed(runs) for entry in run])
+            os.remove(self.legacy_logpath)
+        except (IOError, OSError, ValueError) as err:
+            debug(u"{error}", xbmc.LOGERROR, error=err)
+
+    def append(self, data):
+        """
+        Append the given data to the current log file. Will create a new log file if none exists.
 
         :type data: list
-        :param data: A list of strings to prepend to the log file.
+        :param data: A list of cleaned files. Each item is either a path or a dict with the keys ``path``, ``type``
+            (the type of video) and ``bytes`` (the size of the file).
         """
+        if not data:
+            debug(u"No data to write. Stopping.")
+            return
+
+        timestamp = int(time.time())
+        entries = []
+        for item in data:
+            if not isinstance(item, dict):
+                item = {u"path": item}
+            entries.append({u"time": timestamp, u"type": item.get(u"type"), u"path": item[u"path"],
+                            u"bytes": item.get(u"bytes")})
+
         try:
-            debug(u"Prepending the log file with new data.")
-            debug(u"Backing up current log.")
-            with open(self.logpath, "a+") as f:  # use append mode to make sure it is created if non-existent
-                previous_data = f.read().decode("utf-8")
+            debug(u"Writing {amount:d} new entries to the log file.", amount=len(entries))
+            if not os.path.isdir(ADDON_PROFILE):
+                os.makedirs(ADDON_PROFILE)
+            self.__write(self.logpath, entries)
+            if os.path.getsize(self.logpath) > self.SEGMENT_SIZE:
+                self.__rotate()
         except (IOError, OSError) as err:
-            debug(u"{0}".format(err, xbmc.LOGERROR))
-        else:
-            try:
-                debug(u"Writing new log data.")
-                with open(self.logpath, "w") as f:
-                    if data:
-                        f.write("[B][{time}][/B]\n".format(time=time.strftime("%d/%m/%Y  -  %H:%M:%S")))
-                        for line in data:
-                            line = line.encode("utf-8")
-                            f.write(" - {0}\n".format(line))
-                        f.write("\n")
-                        debug(u"New data written to log file.")
-                    else:
-                        debug(u"No data to write. Stopping.")
-
-                    debug(u"Appending previous log file contents.")
-                    f.writelines(previous_data.encode("utf-8"))
-            except (IOError, OSError) as err:
-                debug(u"{0}".format(err), xbmc.LOGERROR)
+            debug(u"{error}", xbmc.LOGERROR, error=err)
+
+    def entries(self):
+        """
+        Read the entries in the log file, newest first. Only the parts of the log needed to yield the next entry are
+        read, so reading the most recent entries is fast regardless of the size of the history.
+
+        :rtype: generator
+        :return: Each entry as a dict with the keys ``time``, ``type``, ``path`` and ``bytes``.
+        """
+        for segment in [self.logpath] + self.__segments():
+            if not os.path.exists(segment):
+                continue
+            # Close the segment right away when the generator is closed, so it can be trimmed or cleared
+            with closing(self.__read_backwards(segment)) as lines:
+                for line in lines:
+                    if not line.strip():
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        debug(u"Skipping damaged log entry {line}", xbmc.LOGWARNING, line=line)
 
     def trim(self, lines_to_keep=25):
         """
-        Trim the log file to contain a maximum number of lines.
+        Trim the log file to contain a maximum number of entries. Only the entries to keep are read.
 
         :type lines_to_keep: int
-        :param lines_to_keep: The number of lines to preserve. Any lines beyond this number get erased. Defaults to 25.
+        :param lines_to_keep: The number of entries to preserve. Any older entries get erased. Defaults to 25.
         :rtype: unicode
         :return: The contents of the log file after trimming.
         """
         try:
-            debug(u"Trimming log file contents.")
-            with open(self.logpath) as f:
-                debug(u"Saving the top {0} lines.".format(lines_to_keep))
-                lines = []
-                for i in range(lines_to_keep):
-                    lines.append(f.readline())
+            debug(u"Saving the newest {amount:d} entries.", amount=lines_to_keep)
+            with closing(self.entries()) as entries:
+                entries = list(islice(entries, lines_to_keep))
+            trimmed = self.logpath + ".tmp"
+            if os.path.exists(trimmed):
+                os.remove(trimmed)
+            self.__write(trimmed, reversed(entries))
+
+            debug(u"Removing all log contents.")
+            for segment in self.__segments():
+                os.remove(segment)
+            if os.path.exists(self.logpath):
+                os.remove(self.logpath)
+            os.rename(trimmed, self.logpath)
         except (IOError, OSError) as err:
-            debug(u"{0}".format(err, xbmc.LOGERROR))
+            debug(u"{error}", xbmc.LOGERROR, error=err)
         else:
-            try:
-                debug(u"Removing all log contents.")
-                with open(self.logpath, "w") as f:
-                    debug(u"Restoring saved log contents.")
-                    f.writelines(lines)
-            except (IOError, OSError) as err:
-                debug(u"{0}".format(err, xbmc.LOGERROR))
-            else:
-                return self.get()
+            return self.get()
 
     def clear(self):
         """
@@ -102,28 +282,82 @@ class Log(object):
         """
         try:
             debug(u"Clearing log file contents.")
-            with open(self.logpath, "r+") as f:
-                f.truncate()
+            for segment in [self.logpath] + self.__segments():
+                if os.path.exists(segment):
+                    os.remove(segment)
         except (IOError, OSError) as err:
-            debug(u"{0}".format(err, xbmc.LOGERROR))
+            debug(u"{error}", xbmc.LOGERROR, error=err)
         else:
             return self.get()
 
     def get(self):
         """
-        Retrieve the contents of the log file. Creates a new log if none is found.
+        Retrieve the entire contents of the log file, formatted for display. Files cleaned during the same run are
+        grouped under the time of that run, with the most recent run on top.
+
+        Use ``pages()`` to display large logs.
 
         :rtype: unicode
         :return: The contents of the log file.
         """
         try:
             debug(u"Retrieving log file contents.")
-            with open(self.logpath, "a+") as f:
-                contents = f.read().decode("utf-8")
+            return u"".join(self.format(run) for run in self.runs(self.entries()))
         except (IOError, OSError) as err:
-            debug(u"{0}".format(err, xbmc.LOGERROR))
-        else:
-            return contents
+            debug(u"{error}", xbmc.LOGERROR, error=err)
+
+    def pages(self, entries_per_page=PAGE_SIZE):
+        """
+        Retrieve the contents of the log file one page at a time, most recent entries first. Each page is only read
+        from the log once it is requested, so the first page is available immediately, regardless of the size of the
+        history.
+
+        :type entries_per_page: int
+        :param entries_per_page: The maximum number of entries on a single page.
+        :rtype: generator
+        :return: The contents of each page, formatted for display. Close the generator to close the log files before
+            trimming or clearing the log.
+        """
+        with closing(self.entries()) as entries:
+            while True:
+                page = list(islice(entries, entries_per_page))
+                if not page:
+                    return
+                yield u"".join(self.format(run) for run in self.runs(page))
+
+    @staticmethod
+    def runs(entries):
+        """
+        Group entries by the cleaning run they were written in.
+
+        :type entries: iterable
+        :param entries: The entries to group, newest first.
+        :rtype: generator
+        :return: The entries of each run as a list, in the order they were cleaned. Most recent run first.
+        """
+        run = []
+        for entry in entries:
+            if run and run[0][u"time"] != entry[u"time"]:
+                yield run[::-1]
+                run = []
+            run.append(entry)
+        if run:
+            yield run[::-1]
+
+    @staticmethod
+    def format(run):
+        """
+        Format the entries of a single run for display.
+
+        :type run: list
+        :param run: The entries of a single run.
+        :rtype: unicode
+        :return: The time of the run followed by the path of each file cleaned.
+        """
+        lines = [u"[B][{time}][/B]".format(time=time.strftime("%d/%m/%Y  -  %H:%M:%S",
+                                                                time.localtime(run[0][u"time"])).decode("utf-8"))]
+        lines.extend(u" - {0}".format(entry[u"path"]) for entry in run)
+        return u"\n".join(lines) + u"\n\n"
 
 
 def anonymize_path(path):
@@ -134,7 +368,7 @@ def anonymize_path(path):
     :return: The network path without the credentials.
     """
     if "://" in path:
-        debug(u"Anonymizing {path}".format(path=path.decode("utf-8")))
+        debug(u"Anonymizing {path}", path=path)
         # Look for anything matching a protocol followed by credentials
         # This regex assumes there is no @ in the remainder of the path
         regex = u"^(?P<protocol>smb|nfs|afp|upnp|http|https):\/\/(.+:.+@)?(?P<path>[^@]+?)$"
@@ -142,21 +376,21 @@ def anonymize_path(path):
 
         # Keep only the protocol and the actual path
         path = u"{protocol}://{path}".format(protocol=results["protocol"].decode("utf-8"), path=results["path"].decode("utf-8"))
-        debug(u"Result: {newpath}".format(newpath=path.decode("utf-8")))
+        debug(u"Result: {newpath}", newpath=path)
 
     return path
 
 
-def get_free_disk_space(path):
-    """Determine the percentage of free disk space.
+def get_disk_usage(path):
+    """Determine the amount of free and total disk space.
 
     :type path: unicode
     :param path: The path to the drive to check. This can be any path of any depth on the desired drive.
-    :rtype: float
-    :return: The percentage of free space on the disk; 100% if errors occur.
+    :rtype: (int, int)
+    :return: The number of free bytes and the total number of bytes on the disk, or None if errors occur.
     """
-    percentage = float(100)
-    debug(u"Checking for disk space on path: {0}".format(path.decode("utf-8")))
+    usage = None
+    debug(u"Checking for disk space on path: {path}", path=path)
     if xbmcvfs.exists(path.encode("utf-8")):
         if xbmc.getCondVisibility("System.Platform.Windows"):
             debug(u"We are checking disk space from a Windows file system")
@@ -175,7 +409,7 @@ def get_free_disk_space(path):
                           share[u"type"], share[u"user"], share[u"pass"], share[u"host"], share[u"share"]))
                 except KeyError as ke:
                     debug(u"Could not parse {0} from {1}.".format(ke, path), xbmc.LOGERROR)
-                    return percentage
+                    return usage
 
                 debug(u"Creating UNC paths so Windows understands the shares")
                 path = os.path.normcase(os.sep + os.sep + share[u"host"] + os.sep + share[u"share"])
@@ -189,17 +423,15 @@ def get_free_disk_space(path):
                 path = path.decode("mbcs")
                 debug(u"New path: {0}".format(path))
 
+            from ctypes import byref, c_ulonglong, c_wchar_p, windll
             bytes_total = c_ulonglong(0)
             bytes_free = c_ulonglong(0)
             windll.kernel32.GetDiskFreeSpaceExW(c_wchar_p(path), byref(bytes_free), byref(bytes_total), None)
 
-            try:
-                percentage = float(bytes_free.value) / float(bytes_total.value) * 100
-                debug(u"Hard disk check results:")
-                debug(u"Bytes free: {0}".format(bytes_free.value))
-                debug(u"Bytes total: {0}".format(bytes_total.value))
-            except ZeroDivisionError:
-                notify(translate(32511), 15000, level=xbmc.LOGERROR)
+            usage = bytes_free.value, bytes_total.value
+            debug(u"Hard disk check results:")
+            debug(u"Bytes free: {0}".format(bytes_free.value))
+            debug(u"Bytes total: {0}".format(bytes_total.value))
         else:
             debug(u"We are checking disk space from a non-Windows file system")
             debug(u"Stripping {0} of all redundant stuff.".format(path))
@@ -208,43 +440,50 @@ def get_free_disk_space(path):
 
             try:
                 diskstats = os.statvfs(path)
-                percentage = float(diskstats.f_bfree) / float(diskstats.f_blocks) * 100
+                usage = diskstats.f_bfree * diskstats.f_frsize, diskstats.f_blocks * diskstats.f_frsize
                 debug(u"Hard disk check results:")
-                debug(u"Bytes free: {0}".format(diskstats.f_bfree))
-                debug(u"Bytes total: {0}".format(diskstats.f_blocks))
+                debug(u"Bytes free: {0}".format(usage[0]))
+                debug(u"Bytes total: {0}".format(usage[1]))
             except OSError as ose:
                 # TODO: Linux cannot check remote share disk space yet
                 # notify(translate(32512), 15000, level=xbmc.LOGERROR)
                 notify(translate(32524), 15000, level=xbmc.LOGERROR)
                 debug(u"Error accessing {0}: {1}".format(path, ose))
-            except ZeroDivisionError:
-                notify(translate(32511), 15000, level=xbmc.LOGERROR)
     else:
         notify(translate(32513), 15000, level=xbmc.LOGERROR)
 
-    debug(u"Free space: {0:.2f}%".format(percentage))
-    return percentage
+    if usage is not None and not usage[1]:
+        notify(translate(32511), 15000, level=xbmc.LOGERROR)
+        return None
+    return usage
 
 
-def disk_space_low():
-    """Check whether the disk is running low on free space.
-
-    :rtype: bool
-    :return: True if disk space is below threshold (set through addon settings), False otherwise.
-    """
-    return get_free_disk_space(get_setting(disk_space_check_path)) <= get_setting(disk_space_threshold)
+_translations = {}
 
 
 def translate(msg_id):
     """
-    Retrieve a localized string by id.
+    Retrieve a localized string by id. Strings are cached until ``clear_translations()`` is called.
 
     :type msg_id: int
     :param msg_id: The id of the localized string.
     :rtype: unicode
     :return: The localized string. Empty if msg_id is not an integer.
     """
-    return ADDON.getLocalizedString(msg_id) if isinstance(msg_id, int) else u""
+    try:
+        return _translations[msg_id]
+    except KeyError:
+        if not isinstance(msg_id, int):
+            return u""
+        _translations[msg_id] = ADDON.getLocalizedString(msg_id)
+        return _translations[msg_id]
+
+
+def clear_translations():
+    """
+    Discard all cached localized strings.
+    """
+    _translations.clear()
 
 
 def notify(message, duration=5000, image=ADDON_ICON, level=xbmc.LOGDEBUG, sound=True):
@@ -269,15 +508,100 @@ def notify(message, duration=5000, image=ADDON_ICON, level=xbmc.LOGDEBUG, sound=
                                           duration, sound)
 
 
-def debug(message, level=xbmc.LOGDEBUG):
+def summarize(value):
+    """
+    Shorten a value so it can be safely written to the log. Collections are cut off after ``MAX_LOG_ITEMS`` items and
+    text after ``MAX_LOG_VALUE_LENGTH`` characters. Numbers are returned as is, so they can still be formatted.
+
+    :param value: The value to shorten.
+    :return: A (possibly shortened) unicode representation of the value, or the value itself if it is a number.
+    """
+    if isinstance(value, (int, long, float)):
+        return value
+
+    more = 0
+    if isinstance(value, (list, tuple, set, frozenset, dict)) and len(value) > MAX_LOG_ITEMS:
+        more = len(value) - MAX_LOG_ITEMS
+        value = list(islice(value.iteritems() if isinstance(value, dict) else value, MAX_LOG_ITEMS))
+
+    if isinstance(value, str):
+        text = value.decode("utf-8", "replace")
+    elif isinstance(value, unicode):
+        text = value
+    else:
+        text = u"{0}".format(value)
+
+    if more:
+        text = u"{0} ... ({1:d} more)".format(text, more)
+    if len(text) > MAX_LOG_VALUE_LENGTH:
+        text = u"{0}... ({1:d} more characters)".format(text[:MAX_LOG_VALUE_LENGTH], len(text) - MAX_LOG_VALUE_LENGTH)
+    return text
+
+
+def _rate_limit(call_site, level):
+    """
+    Keep track of how many messages were logged from a single line of code in the current period.
+
+    Warnings and errors are never suppressed.
+
+    :type call_site: tuple
+    :param call_site: The file name and line number the message was logged from.
+    :type level: int
+    :param level: The log level of the message.
+    :rtype: int
+    :return: The number of messages suppressed since the last logged message, or None if this message should be
+        suppressed as well.
+    """
+    if level >= xbmc.LOGWARNING:
+        return 0
+
+    now = time.time()
+    period_start, count, suppressed = _call_sites.get(call_site, (now, 0, 0))
+    if now - period_start >= RATE_LIMIT_PERIOD:
+        period_start, count = now, 0
+
+    if count >= RATE_LIMIT:
+        _call_sites[call_site] = (period_start, count, suppressed + 1)
+        return None
+
+    _call_sites[call_site] = (period_start, count + 1, 0)
+    return suppressed
+
+
+def debug(message, level=xbmc.LOGDEBUG, **kwargs):
     """
     Write a debug message to xbmc.log
 
+    Formatting is deferred until we know the message will be written. Pass the values to format as keyword
+    arguments, and they will be shortened using ``summarize()`` before being formatted into the message.
+
+    *Example*
+      ``debug(u"Found {amount} videos: {videos}", amount=len(videos), videos=videos)``
+
+    To prevent flooding the log, at most ``RATE_LIMIT`` messages per ``RATE_LIMIT_PERIOD`` seconds are written from
+    any line of code.
+
     :type message: unicode
     :param message: the message to log
     :type level: int
     :param level: (Optional) the log level (supported values are found at xbmc.LOG...)
     """
-    if get_setting(debugging_enabled):
-        for line in message.splitlines():
-            xbmc.log(msg="{0}: {1}".format(ADDON_NAME.encode("utf-8"), line.encode("utf-8")), level=level)
+    if not get_setting(debugging_enabled):
+        return
+
+    caller = sys._getframe(1)
+    suppressed = _rate_limit((caller.f_code.co_filename, caller.f_lineno), level)
+    if suppressed is None:
+        return
+
+    if kwargs:
+        message = message.format(**dict((key, summarize(value)) for key, value in kwargs.iteritems()))
+    if len(message) > MAX_LOG_MESSAGE_LENGTH:
+        message = u"{0}... ({1:d} more characters)".format(message[:MAX_LOG_MESSAGE_LENGTH],
+                                                            len(message) - MAX_LOG_MESSAGE_LENGTH)
+    if suppressed:
+        message = u"{0} ({1:d} similar messages were suppressed)".format(message, suppressed)
+
+    if isinstance(message, unicode):
+        message = message.encode("utf-8")
+    xbmc.log(msg="{0}: {1}".format(ADDON_NAME.encode("utf-8"), message), level=level)
@@ -0,0 +1,246 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+from bisect import bisect_left, insort
+from collections import namedtuple
+
+import xbmcvfs
+from executor import get_share
+from metrics import RunMetrics
+from utils import debug
+
+# The metadata of a file or folder, as cached by the DirectoryIndex
+Metadata = namedtuple("Metadata", ["exists", "size", "nlink", "mtime", "device"])
+
+MISSING = Metadata(False, 0, 0, 0, 0)
+
+
+def native_path(path):
+    """
+    :type path: unicode
+    :param path: A local path.
+    :rtype: str
+    :return: The path as accepted by the ``os`` module. Encoded as UTF-8, except on Windows.
+    """
+    return path if os.name == "nt" or not isinstance(path, unicode) else path.encode("utf-8")
+
+
+class DirectoryIndex(object):
+    """
+    The DirectoryIndex class caches directory listings and file metadata for the duration of a single cleaning run.
+
+    Each folder is only listed once. Afterwards the cached listing is kept up to date by reporting any files that are
+    added or removed through ``add()`` and ``remove()``, instead of listing the folder again. File names are kept
+    sorted, so looking up all files that start with a given prefix takes a binary search instead of a full scan.
+
+    Likewise, each path is only inspected once to find out whether it exists, along with its size, number of hard links,
+    modification time and device. Reporting a file as removed marks it as missing, and reporting a file as added makes
+    sure it is inspected again when needed. On network shares every inspection is a round trip, so the metadata of
+    many files can be fetched concurrently up front through ``prefetch()``.
+
+    The time spent on each inspection and listing is measured through the RunMetrics of the cleaning run, if given.
+
+    All methods are safe to call from multiple threads at once.
+    """
+
+    def __init__(self, metrics=None):
+        self.metrics = metrics or RunMetrics()
+        self.__listings = {}
+        self.__metadata = {}
+        self.__lock = threading.RLock()
+
+    @staticmethod
+    def __key(folder):
+        return folder.rstrip(u"/\\") or folder
+
+    def __listing(self, folder):
+        """
+        Get the cached listing of a folder, listing it first if needed. Must be called while holding the lock.
+
+        :rtype: (list, list)
+        :return: The sorted names of the subfolders and the files in the folder.
+        """
+        key = self.__key(folder)
+        try:
+            return self.__listings[key]
+        except KeyError:
+            debug(u"Listing the contents of {folder}", folder=folder)
+            subfolders, files = self.metrics.call(u"listdir", xbmcvfs.listdir, folder)
+            listing = (sorted(self.__decode(subfolders)), sorted(self.__decode(files)))
+            self.__listings[key] = listing
+            return listing
+
+    @staticmethod
+    def __decode(names):
+        return [name if isinstance(name, unicode) else unicode(name, encoding="utf-8") for name in names]
+
+    def listdir(self, folder):
+        """
+        Get the contents of a folder.
+
+        :type folder: unicode
+        :param folder: The folder to list.
+        :rtype: (list, list)
+        :return: The sorted names of the subfolders and the files in the folder.
+        """
+        with self.__lock:
+            subfolders, files = self.__listing(folder)
+            return list(subfolders), list(files)
+
+    def files_with_prefix(self, folder, prefix):
+        """
+        Find all files in a folder whose name starts with the given prefix.
+
+        :type folder: unicode
+        :param folder: The folder to search in.
+        :type prefix: unicode
+        :param prefix: The prefix the file names should start with.
+        :rtype: list
+        :return: The names of the matching files.
+        """
+        with self.__lock:
+            files = self.__listing(folder)[1]
+            matches = []
+            for i in xrange(bisect_left(files, prefix), len(files)):
+                if not files[i].startswith(prefix):
+                    break
+                matches.append(files[i])
+            return matches
+
+    def contains(self, path):
+        """
+        Check whether a file exists by looking it up in the listing of its folder. This is cheaper than ``exists()`` when
+        many files in the same folder are checked, e.g. when moving files to the holding folder.
+
+        :type path: unicode
+        :param path: The path of the file to check.
+        :rtype: bool
+        :return: True if the folder contains the file, False otherwise.
+        """
+        folder, name = os.path.split(path)
+        with self.__lock:
+            files = self.__listing(folder)[1]
+            i = bisect_left(files, name)
+            return i < len(files) and files[i] == name
+
+    def stat(self, path):
+        """
+        Get the metadata of a file or folder, inspecting it first if needed.
+
+        :type path: unicode
+        :param path: The path to inspect.
+        :rtype: Metadata
+        :return: Whether the path exists, and its size, number of hard links, modification time and device.
+        """
+        with self.__lock:
+            metadata = self.__metadata.get(path)
+        if metadata is not None:
+            return metadata
+
+        st = self.metrics.call(u"stat", xbmcvfs.Stat, path)
+        if st.st_mode() or st.st_mtime():
+            metadata = Metadata(True, st.st_size(), st.st_nlink(), st.st_mtime(), st.st_dev())
+        elif self.metrics.call(u"exists", xbmcvfs.exists, path):
+            # Not every protocol reports a mode or modification time, so only trust an empty result if it is missing
+            metadata = Metadata(True, st.st_size(), st.st_nlink(), st.st_mtime(), st.st_dev())
+        else:
+            metadata = MISSING
+
+        with self.__lock:
+            return self.__metadata.setdefault(path, metadata)
+
+    def exists(self, path):
+        """
+        :type path: unicode
+        :param path: The path to check.
+        :rtype: bool
+        :return: True if the file or folder exists, False otherwise.
+        """
+        return self.stat(path).exists
+
+    def prefetch(self, paths, executor, is_canceled=lambda: False):
+        """
+        Inspect many paths at once, so their metadata is cached by the time it is needed.
+
+        :type paths: list
+        :param paths: The paths to inspect. Paths whose metadata is already cached are skipped.
+        :type executor: Executor
+        :param executor: The executor to inspect the paths with. Respects its limits on concurrent operations.
+        :type is_canceled: callable
+        :param is_canceled: (Optional) Returns True to stop inspecting paths.
+        """
+        with self.__lock:
+            paths = [p for p in set(paths) if p not in self.__metadata]
+        if paths:
+            debug(u"Prefetching the metadata of {amount:d} paths.", amount=len(paths))
+            for _ in executor.run(self.stat, ((get_share(p), (p,)) for p in paths), is_canceled):
+                pass
+
+    def forget(self, path):
+        """
+        Discard the cached metadata of a path, e.g. because it was created or changed. It will be inspected again when
+        needed.
+
+        :type path: unicode
+        :param path: The path to forget.
+        """
+        with self.__lock:
+            self.__metadata.pop(path, None)
+
+    def add(self, path):
+        """
+        Report that a file was created. Its metadata will be inspected again when needed, and it is added to the listing
+        of its folder if that is already cached.
+
+        :type path: unicode
+        :param path: The path of the new file.
+        """
+        folder, name = os.path.split(path)
+        with self.__lock:
+            self.__metadata.pop(path, None)
+            listing = self.__listings.get(self.__key(folder))
+            if listing is not None:
+                files = listing[1]
+                i = bisect_left(files, name)
+                if i == len(files) or files[i] != name:
+                    insort(files, name)
+
+    def remove(self, path):
+        """
+        Report that a file was deleted or moved elsewhere. It is marked as missing, and removed from the listing of its
+        folder if that is already cached.
+
+        :type path: unicode
+        :param path: The path of the removed file.
+        """
+        folder, name = os.path.split(path)
+        with self.__lock:
+            self.__metadata[path] = MISSING
+            listing = self.__listings.get(self.__key(folder))
+            if listing is not None:
+                files = listing[1]
+                i = bisect_left(files, name)
+                if i < len(files) and files[i] == name:
+                    del files[i]
+
+    def remove_folder(self, folder):
+        """
+        Report that a folder was deleted. It is marked as missing, its listing is discarded and it is removed from the
+        listing of its parent.
+
+        :type folder: unicode
+        :param folder: The path of the removed folder.
+        """
+        key = self.__key(folder)
+        parent, name = os.path.split(key)
+        with self.__lock:
+            self.__listings.pop(key, None)
+            self.__metadata[folder] = self.__metadata[key] = MISSING
+            listing = self.__listings.get(self.__key(parent))
+            if listing is not None:
+                subfolders = listing[0]
+                i = bisect_left(subfolders, name)
+                if i < len(subfolders) and subfolders[i] == name:
+                    del subfolders[i]
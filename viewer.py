@@ -11,25 +11,80 @@ class LogViewerDialog(WindowXMLDialog):
 
     It is used to display the contents of a log file, and as such uses a fullscreen window to show as much text as
     possible. It also contains two buttons for trimming and clearing the contents of the log file.
+
+    The log is shown one page at a time, starting with the most recent entries. Pages are only read from the log when
+    the user navigates to them, and pages that were read before are remembered.
     """
     TEXTBOXID = 202
     TRIMBUTTONID = 301
     CLEARBUTTONID = 302
+    NEWERBUTTONID = 303
+    OLDERBUTTONID = 304
 
     def __init__(self, xml_filename, script_path, default_skin="Default", default_res="720p", *args, **kwargs):
         self.log = utils.Log()
+        self.pages = []
+        self.page_reader = None
+        self.current_page = 0
         WindowXMLDialog.__init__(self)
 
     def onInit(self):
-        self.getControl(self.TEXTBOXID).setText(self.log.get())
+        self.reload()
 
     def onClick(self, control_id, *args):
         if control_id == self.TRIMBUTTONID:
             if Dialog().yesno(utils.translate(32604), utils.translate(32605), utils.translate(32607)):
-                self.getControl(self.TEXTBOXID).setText(self.log.trim())
+                self.close_pages()
+                self.log.trim()
+                self.reload()
         elif control_id == self.CLEARBUTTONID:
             if Dialog().yesno(utils.translate(32604), utils.translate(32606), utils.translate(32607)):
-                self.getControl(self.TEXTBOXID).setText(self.log.clear())
+                self.close_pages()
+                self.log.clear()
+                self.reload()
+        elif control_id == self.NEWERBUTTONID:
+            self.show_page(self.current_page - 1)
+        elif control_id == self.OLDERBUTTONID:
+            self.show_page(self.current_page + 1)
         else:
             raise ValueError("Unknown button pressed")
 
+    def reload(self):
+        """
+        Forget all pages read so far and show the most recent page of the log.
+        """
+        self.close_pages()
+        self.pages = []
+        self.page_reader = self.log.pages()
+        self.current_page = 0
+        self.show_page(0)
+
+    def close_pages(self):
+        """
+        Stop reading pages and close the log files they are read from, so the log can be trimmed or cleared.
+        """
+        if self.page_reader is not None:
+            self.page_reader.close()
+            self.page_reader = None
+
+    def show_page(self, number):
+        """
+        Show a page of the log, reading it from the log first if needed. Does nothing if the page does not exist.
+
+        :type number: int
+        :param number: The number of the page to show. The page with the most recent entries is page 0.
+        """
+        if number < 0:
+            return
+
+        while len(self.pages) <= number:
+            try:
+                self.pages.append(next(self.page_reader))
+            except StopIteration:
+                break
+
+        if number < len(self.pages):
+            self.current_page = number
+            self.getControl(self.TEXTBOXID).setText(self.pages[number])
+        elif not self.pages:
+            self.getControl(self.TEXTBOXID).setText(u"")
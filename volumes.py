@@ -0,0 +1,189 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import time
+import urllib
+
+import xbmc
+from executor import get_share
+from utils import debug, get_disk_usage
+from settings import *
+from vfs import native_path
+
+
+class VolumeMonitor(object):
+    """
+    The VolumeMonitor class keeps track of the free disk space on each volume the library is stored on.
+
+    Volumes are discovered from the video sources configured in Kodi. Local paths are grouped by the device they are
+    stored on, network paths by the share they are on. Each volume is checked against the disk space threshold on its
+    own, so only videos on volumes that are actually low on free space need to be cleaned. Sources whose volume cannot
+    be determined, such as network shares on platforms other than Windows, count towards the path to check for free
+    disk space set through the addon settings instead.
+
+    Readings of the free disk space are cached for ``CACHE_TTL`` seconds, and updated as space is freed by cleaning.
+
+    *Example*
+      ``bytes_needed = VolumeMonitor().bytes_to_free()``
+    """
+    CACHE_TTL = 300
+
+    def __init__(self):
+        self.__volumes = {}
+        self.__usage = {}
+        self.__sources = None
+        self.__sources_checked = 0
+
+    @staticmethod
+    def __is_windows():
+        return xbmc.getCondVisibility(u"System.Platform.Windows")
+
+    def volume_of(self, path):
+        """
+        Determine the volume a file is stored on.
+
+        :type path: unicode
+        :param path: The path of the file.
+        :rtype: unicode or int
+        :return: The share of a network path on Windows, the drive of a local path on Windows or the device of any other
+            local path. None if the volume cannot be determined or its free disk space cannot be checked.
+        """
+        folder = os.path.dirname(path)
+        try:
+            return self.__volumes[folder]
+        except KeyError:
+            pass
+
+        volume = None
+        if u"://" in folder:
+            # The free disk space of network shares can only be checked on Windows
+            volume = (get_share(folder) or None) if self.__is_windows() else None
+        elif self.__is_windows():
+            volume = os.path.splitdrive(folder)[0].upper() or None
+        else:
+            # The folder may have been removed already, so use the nearest folder that still exists
+            current = folder
+            while current:
+                try:
+                    volume = os.stat(native_path(current)).st_dev
+                    break
+                except (OSError, UnicodeError):
+                    parent = os.path.dirname(current)
+                    current = parent if parent != current else None
+
+        self.__volumes[folder] = volume
+        return volume
+
+    def usage(self, volume, path):
+        """
+        Get the free and total disk space of a volume. Readings are cached for ``CACHE_TTL`` seconds.
+
+        :type volume: unicode or int
+        :param volume: The volume to check, as returned by ``volume_of()``.
+        :type path: unicode
+        :param path: Any path on the volume.
+        :rtype: (int, int)
+        :return: The number of free bytes and the total number of bytes on the volume, or None if errors occur.
+        """
+        cached = self.__usage.get(volume)
+        if cached is not None and time.time() - cached[0] < self.CACHE_TTL:
+            return cached[1]
+
+        usage = get_disk_usage(path)
+        self.__usage[volume] = (time.time(), usage)
+        return usage
+
+    def freed(self, volume, amount):
+        """
+        Report that disk space was freed on a volume, to keep the cached reading up to date.
+
+        :type volume: unicode or int
+        :param volume: The volume, as returned by ``volume_of()``.
+        :type amount: int
+        :param amount: The number of bytes freed.
+        """
+        cached = self.__usage.get(volume)
+        if cached is not None and cached[1] is not None:
+            bytes_free, bytes_total = cached[1]
+            self.__usage[volume] = (cached[0], (min(bytes_free + amount, bytes_total), bytes_total))
+
+    def discover(self):
+        """
+        Find the volumes the video sources in Kodi are stored on. The result is cached for ``CACHE_TTL`` seconds.
+
+        Network shares can only be checked on Windows. On other platforms, they are covered by the path to check for
+        free disk space set through the addon settings, as are other sources whose volume cannot be determined.
+
+        :rtype: dict
+        :return: A path on each volume, by volume. The path set through the addon settings is stored under None if it
+            is needed.
+        """
+        if self.__sources is not None and time.time() - self.__sources_checked < self.CACHE_TTL:
+            return self.__sources
+
+        request = {u"jsonrpc": u"2.0", u"method": u"Files.GetSources", u"params": {u"media": u"video"}, u"id": 1}
+        result = json.loads(xbmc.executeJSONRPC(json.dumps(request)))
+        if u"error" in result:
+            debug(u"Could not retrieve the video sources. {error}", xbmc.LOGERROR, error=result[u"error"])
+            return {}
+
+        paths = []
+        for source in result[u"result"].get(u"sources", []):
+            path = source[u"file"]
+            if path.startswith(u"multipath://"):
+                paths.extend(unicode(urllib.unquote(p.encode("utf-8")), encoding="utf-8")
+                             for p in path[len(u"multipath://"):].split(u"/") if p)
+            else:
+                paths.append(path)
+
+        self.__sources = {}
+        for path in paths:
+            # volume_of() expects a file, so make sure the source folder itself is used
+            volume = self.volume_of(os.path.join(path, u""))
+            if volume is None:
+                debug(u"Cannot check the free disk space of {path}. Checking {fallback} instead.", path=path,
+                      fallback=get_setting(disk_space_check_path))
+                volume, path = None, get_setting(disk_space_check_path)
+            self.__sources.setdefault(volume, path)
+        self.__sources_checked = time.time()
+
+        debug(u"Found {amount:d} volumes: {volumes}", amount=len(self.__sources), volumes=self.__sources.values())
+        return self.__sources
+
+    def bytes_to_free(self):
+        """
+        Determine how much disk space should be freed on each volume to get back above the threshold set through the
+        addon settings.
+
+        Cleaning does not stop right at the threshold, but continues until the free disk space exceeds it by an extra
+        margin. This prevents a new cleaning run from being needed as soon as a little disk space is used again.
+
+        :rtype: dict
+        :return: The number of bytes to free by volume, for all volumes that are low on free space. The volume of the
+            path set through the addon settings is None. All videos whose volume cannot be determined count towards
+            freeing space on it, or all videos if only that path is checked.
+        """
+        settings = snapshot()
+        if settings[check_all_volumes]:
+            volumes = self.discover()
+        else:
+            volumes = {None: settings[disk_space_check_path]}
+
+        bytes_needed = {}
+        for volume, path in volumes.items():
+            usage = self.usage(volume, path)
+            if usage is None:
+                continue
+
+            bytes_free, bytes_total = usage
+            percentage = float(bytes_free) / bytes_total * 100
+            debug(u"Free space on {path}: {percentage:.2f}%", path=path, percentage=percentage)
+            if percentage > settings[disk_space_threshold]:
+                continue
+
+            target = min(settings[disk_space_threshold] + settings[disk_space_hysteresis], 100)
+            bytes_needed[volume] = max(int(bytes_total * target / 100) - bytes_free, 1)
+
+        return bytes_needed